@@ -1,53 +1,67 @@
+import importlib
 import os
+import click
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
-from config import Config
+from config import select_config
 
 # Инициализация расширений
 db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'  # Эндпоинт для страницы входа
-migrate = Migrate()
 
-def create_app(config_class=Config):
-    """Фабрика приложения Flask."""
+def create_app(config_class=None):
+    """Фабрика приложения Flask (по умолчанию профиль из DB_PROFILE / DATABASE_URL)."""
     app = Flask(__name__)
-    app.config.from_object(config_class)
+    app.config.from_object(config_class or select_config())
     
     # Инициализация расширений
     db.init_app(app)
+    from core.database import configure_engines, replica_router
+    configure_engines(app)
+    replica_router.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    # Flask-Migrate (alembic, ~200 мс импорта) нужен только командам flask db:
+    # фабрику, вызванную из CLI Flask, выдает контекст click
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
     
-    # Импорт моделей ДО создания контекста приложения
+    from core.visit_log import visit_log_writer
+    visit_log_writer.init_app(app)
+    from core.visit_rollup import visit_rollup_job
+    visit_rollup_job.init_app(app)
+    from core.navigation import module_registry
+    module_registry.init_app(app)
+    from core.user_cache import user_cache
+    user_cache.init_app(app)
+    from core.pubsub import event_bus
+    event_bus.init_app(app)
+    from core.fragment_cache import fragment_cache
+    fragment_cache.init_app(app)
+    from core.instrumentation import instrumentation
+    instrumentation.init_app(app)
+    from core.auth import login_gate
+    login_gate.init_app(app)
+    
+    # Импорт моделей ДО создания контекста приложения (всех модулей: на них ссылаются связи User)
     from core import models as core_models
     from modules.dashboard import models as dashboard_models
+    from modules.feedback import models as feedback_models
     
     # Регистрация Blueprint из ядра
     from core.views import bp as core_bp
     from core.views import auth_bp, admin_bp
+    from core import commands as core_commands  # CLI-команды ядра (flask core ...)
     
     app.register_blueprint(core_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     
-    # Регистрация модуля Dashboard
-    try:
-        from modules.dashboard import bp as dashboard_bp
-        app.register_blueprint(dashboard_bp)
-        app.logger.info('Dashboard module registered successfully')
-    except ImportError as e:
-        app.logger.warning(f'Dashboard module not registered: {e}')
-    
-    # Регистрация модуля Feedback
-    try:
-        from modules.feedback import bp as feedback_bp
-        app.register_blueprint(feedback_bp)
-        app.logger.info('Feedback module registered successfully')
-    except ImportError as e:
-        app.logger.warning(f'Feedback module not registered: {e}')
+    # Регистрация модулей из MODULES: пакет выключенного модуля не импортируется
+    for name in app.config.get('MODULES', ('dashboard', 'feedback')):
+        register_module(app, name)
     
     # Обработчики ошибок
     @app.errorhandler(404)
@@ -66,12 +80,14 @@ def create_app(config_class=Config):
     # Контекстный процессор для передачи данных во все шаблоны
     @app.context_processor
     def inject_global_vars():
-        from core.models import CoreModule
+        from flask import g
         from flask_login import current_user
+        from core.navigation import module_registry
         
         active_modules = []
         try:
-            active_modules = CoreModule.query.filter_by(is_active=True).order_by(CoreModule.menu_order).all()
+            # Тот же снимок, что и в g (без повторного запроса к БД)
+            active_modules = g.get('active_modules') or module_registry.get_active_modules()
         except Exception as e:
             app.logger.warning(f'Could not load modules: {e}')
         
@@ -80,57 +96,64 @@ def create_app(config_class=Config):
             current_user=current_user
         )
     
-    # Создание таблиц и начальных данных при первом запуске
-    with app.app_context():
-        create_tables(app)
-        create_initial_data(app)
-    
+    # Схема и начальные данные здесь не создаются: flask db upgrade / flask core init-db
     return app
 
-def create_tables(app):
-    """Создание таблиц в базе данных."""
+def register_module(app, name):
+    """Импорт представлений модуля modules.<name> и регистрация его Blueprint."""
     try:
-        db.create_all()
-        app.logger.info('Database tables created/verified')
-    except Exception as e:
-        app.logger.error(f'Error creating tables: {e}')
+        module = importlib.import_module(f'modules.{name}')
+        module.load_views()
+        app.register_blueprint(module.bp)
+        app.logger.info(f'{name.capitalize()} module registered successfully')
+    except ImportError as e:
+        app.logger.warning(f'{name.capitalize()} module not registered: {e}')
+
+def create_tables(app):
+    """Создание недостающих таблиц (существующие не изменяются)."""
+    db.create_all()
+    app.logger.info('Database tables created/verified')
 
 def create_initial_data(app):
-    """Создание начальных данных при первом запуске."""
+    """Создание начальных данных; повторный запуск ничего не дублирует.
+    
+    Базовые модули добавляются по отсутствующему имени, тестовые
+    участки - только в пустую таблицу. Возвращает число новых записей.
+    """
     from core.models import CoreModule
     from modules.dashboard.models import Area
     
-    # Создаем базовые модули, если их нет
-    if CoreModule.query.count() == 0:
-        modules = [
-            CoreModule(
-                name='dashboard', 
-                display_name='Дашборд 5С', 
-                menu_order=100, 
-                is_active=True,
-                version='1.0.0'
-            ),
-            CoreModule(
-                name='feedback', 
-                display_name='Обратная связь', 
-                menu_order=200, 
-                is_active=True,
-                version='1.0.0'
-            ),
-            CoreModule(
-                name='admin', 
-                display_name='Администрирование', 
-                menu_order=900, 
-                is_active=True,
-                version='1.0.0'
-            ),
-        ]
-        
-        for module in modules:
+    created = 0
+    
+    # Создаем базовые модули, которых еще нет
+    modules = [
+        CoreModule(
+            name='dashboard', 
+            display_name='Дашборд 5С', 
+            menu_order=100, 
+            is_active=True,
+            version='1.0.0'
+        ),
+        CoreModule(
+            name='feedback', 
+            display_name='Обратная связь', 
+            menu_order=200, 
+            is_active=True,
+            version='1.0.0'
+        ),
+        CoreModule(
+            name='admin', 
+            display_name='Администрирование', 
+            menu_order=900, 
+            is_active=True,
+            version='1.0.0'
+        ),
+    ]
+    existing = set(db.session.scalars(db.select(CoreModule.name)))
+    for module in modules:
+        if module.name not in existing:
             db.session.add(module)
-        
-        db.session.commit()
-        app.logger.info('Core modules created')
+            created += 1
     
     # Создаем тестовые участки, если их нет
     if Area.query.count() == 0:
@@ -157,9 +180,11 @@ def create_initial_data(app):
         
         for area in areas:
             db.session.add(area)
-        
-        db.session.commit()
-        app.logger.info('Sample areas created')
+        created += len(areas)
+    
+    db.session.commit()
+    app.logger.info(f'Initial data: {created} records created')
+    return created
 
 # Для запуска приложения напрямую
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+"""Холодный старт приложения: импорт, create_app() и память одного воркера.
+
+Запуск:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 20 --modules dashboard
+    python -m benchmarks.bench_startup --target-ms 800 --target-mb 120
+
+Каждый замер - отдельный процесс интерпретатора (как новый воркер gunicorn
+без --preload). create_app() не должен обращаться к базе, поэтому
+по умолчанию задан URL несуществующего файла SQLite: если фабрика
+создаст его, замер завершится ошибкой.
+
+Код выхода 1, если медиана времени старта или памяти выше цели.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Цели по замерам на машине разработчика (Python 3.11): старт 0.85-0.95 с, ~60 МБ RSS (ldap3, numpy,
+# openpyxl и alembic загружаются при первом использовании)
+STARTUP_TARGET_MS = 1000
+MEMORY_TARGET_MB = 90
+
+PROBE = '''
+import json, resource, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+print(json.dumps(dict(
+    import_ms=(imported - started) * 1000,
+    create_ms=(created - imported) * 1000,
+    rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    routes=len(list(application.url_map.iter_rules())),
+)))
+'''
+
+
+def probe(env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Число запусков')
+    parser.add_argument('--modules', help='Список модулей (MODULES), по умолчанию из конфигурации')
+    parser.add_argument('--target-ms', type=float, default=STARTUP_TARGET_MS, help='Цель: импорт + create_app, мс')
+    parser.add_argument('--target-mb', type=float, default=MEMORY_TARGET_MB, help='Цель: RSS после create_app, МБ')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench_startup.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database, PYTHONDONTWRITEBYTECODE='1')
+    if args.modules is not None:
+        env['MODULES'] = args.modules
+
+    probe(env)  # прогрев файлового кэша ОС и __pycache__
+    runs = [probe(env) for _ in range(args.runs)]
+    if os.path.exists(database):
+        print('FAILED: create_app() touched the database')
+        sys.exit(1)
+
+    startup = [run['import_ms'] + run['create_ms'] for run in runs]
+    results = {
+        'import ms': statistics.median(run['import_ms'] for run in runs),
+        'create_app ms': statistics.median(run['create_ms'] for run in runs),
+        'startup ms': statistics.median(startup),
+        'rss MB': statistics.median(run['rss_mb'] for run in runs),
+    }
+    print(f"{args.runs} runs, {runs[0]['routes']} routes")
+    for name, value in results.items():
+        print(f'{name:15} {value:10.1f}')
+    if len(startup) > 1:
+        print(f'{"startup p90 ms":15} {statistics.quantiles(startup, n=10)[-1]:10.1f}')
+
+    failures = []
+    if results['startup ms'] > args.target_ms:
+        failures.append(f"startup {results['startup ms']:.1f} ms > target {args.target_ms} ms")
+    if results['rss MB'] > args.target_mb:
+        failures.append(f"memory {results['rss MB']:.1f} MB > target {args.target_mb} MB")
+    if failures:
+        print('\nFAILED:')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
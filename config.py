@@ -9,6 +9,79 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///dash5s.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Реплика для чтения (представления с @replica_read); не задана - все запросы к основной базе
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5.0))  # секунды; больше - чтение из основной
+    DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5.0))  # проверка отставания, секунды
+    DB_REPLICA_RETRY_INTERVAL = float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', 30.0))  # после ошибки реплики, секунды
+    DB_REPLICA_READ_YOUR_WRITES = float(os.environ.get('DB_REPLICA_READ_YOUR_WRITES', 10.0))  # не меньше MAX_LAG
+    DB_REPLICA_LAG_QUERY = os.environ.get('DB_REPLICA_LAG_QUERY')  # по умолчанию - по типу СУБД
+    
+    # Параметры движка и PRAGMA SQLite задаются профилями SQLiteConfig / PostgresConfig
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {}
+    
+    # Буферизованная запись журнала посещений (VisitLog)
+    VISIT_LOG_ASYNC = os.environ.get('VISIT_LOG_ASYNC', 'true').lower() == 'true'
+    VISIT_LOG_QUEUE_SIZE = int(os.environ.get('VISIT_LOG_QUEUE_SIZE', 10000))
+    VISIT_LOG_BATCH_SIZE = int(os.environ.get('VISIT_LOG_BATCH_SIZE', 200))
+    VISIT_LOG_FLUSH_INTERVAL = float(os.environ.get('VISIT_LOG_FLUSH_INTERVAL', 2.0))  # секунды
+    VISIT_LOG_DROP_POLICY = os.environ.get('VISIT_LOG_DROP_POLICY', 'drop_new')  # drop_new, drop_oldest, block
+    VISIT_LOG_PUT_TIMEOUT = float(os.environ.get('VISIT_LOG_PUT_TIMEOUT', 0.05))  # для политики block
+    
+    # Агрегаты и срок хранения журнала посещений
+    VISIT_ROLLUP_INTERVAL = int(os.environ.get('VISIT_ROLLUP_INTERVAL', 0))  # секунды; 0 - только `flask core rollup-visits`
+    VISIT_ROLLUP_LAG = int(os.environ.get('VISIT_ROLLUP_LAG', 300))  # не агрегировать последние N секунд
+    VISIT_LOG_RETENTION_DAYS = int(os.environ.get('VISIT_LOG_RETENTION_DAYS', 90))  # 0 - хранить всегда
+    VISIT_ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get('VISIT_ROLLUP_HOURLY_RETENTION_DAYS', 90))
+    VISIT_ROLLUP_DAILY_RETENTION_DAYS = int(os.environ.get('VISIT_ROLLUP_DAILY_RETENTION_DAYS', 0))
+    VISIT_LOG_PARTITIONS_AHEAD = int(os.environ.get('VISIT_LOG_PARTITIONS_AHEAD', 2))  # PostgreSQL: месяцев вперед
+    
+    # Подключаемые модули (пакеты modules.<name>); представления выключенных не загружаются
+    MODULES = [name.strip() for name in os.environ.get('MODULES', 'dashboard,feedback').split(',') if name.strip()]
+    
+    # Кэш реестра модулей (меню); файл-метка общий для всех воркеров gunicorn
+    MODULE_REGISTRY_STAMP_FILE = os.environ.get('MODULE_REGISTRY_STAMP_FILE')  # по умолчанию instance/module_registry.stamp
+    MODULE_REGISTRY_CHECK_INTERVAL = float(os.environ.get('MODULE_REGISTRY_CHECK_INTERVAL', 5.0))  # секунды
+    
+    # Кэш снимков пользователей для user_loader
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # секунды
+    
+    # Шина событий и поток обновлений дашборда (SSE)
+    PUBSUB_URL = os.environ.get('PUBSUB_URL', 'memory://')  # memory:// - в памяти процесса, redis://host:6379/0 - общий
+    PUBSUB_CHANNEL_PREFIX = os.environ.get('PUBSUB_CHANNEL_PREFIX', 'dash5s')
+    PUBSUB_QUEUE_SIZE = int(os.environ.get('PUBSUB_QUEUE_SIZE', 100))  # сообщений на одного подписчика
+    # Поток SSE держит воркер до SSE_MAX_DURATION: включать только с асинхронными воркерами
+    # (gunicorn -k gevent или eventlet); с синхронными несколько табло займут все воркеры
+    SSE_ENABLED = os.environ.get('SSE_ENABLED', 'false').lower() == 'true'
+    SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))  # секунды
+    SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION', 300))  # после этого клиент переподключается, секунды
+    SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 3000))
+    
+    # HTTP-кэширование API графиков: ответ одинаков для всех пользователей, а no-cache
+    # заставляет прокси перепроверять его у приложения (с проверкой входа) по ETag
+    DASHBOARD_API_CACHE_CONTROL = os.environ.get('DASHBOARD_API_CACHE_CONTROL', 'public, no-cache')
+    # Режим табло (/dashboard/?live=1) без SSE: перезагрузка страницы, секунды
+    DASHBOARD_LIVE_REFRESH = int(os.environ.get('DASHBOARD_LIVE_REFRESH', 60))
+    
+    # Кэш отрисованных фрагментов: карточки и история участков, меню модулей
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL', 'memory://')  # memory:// - LRU процесса, redis://host:6379/1 - общий, none:// - выключен
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))  # только для memory://
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))  # секунды
+    FRAGMENT_CACHE_PREFIX = os.environ.get('FRAGMENT_CACHE_PREFIX', 'dash5s:fragment')
+    
+    # Инструментирование запросов: время, число SQL-запросов, /metrics (по умолчанию выключено)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    INSTRUMENTATION_QUERY_BUDGET = int(os.environ.get('INSTRUMENTATION_QUERY_BUDGET', 20))  # SQL-запросов на запрос
+    INSTRUMENTATION_SERVER_TIMING = os.environ.get('INSTRUMENTATION_SERVER_TIMING', 'true').lower() == 'true'
+    METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # если задан - нужен заголовок Authorization: Bearer <token>
+    
+    # Пакетный импорт аудитов
+    AUDIT_IMPORT_CHUNK_SIZE = int(os.environ.get('AUDIT_IMPORT_CHUNK_SIZE', 500))
+    
     # LDAP / AD Configuration
     LDAP_SERVER = os.environ.get('LDAP_SERVER', 'localhost')
     LDAP_PORT = int(os.environ.get('LDAP_PORT', 389))
@@ -19,7 +92,73 @@ class Config:
     LDAP_USER_RDN_ATTR = os.environ.get('LDAP_USER_RDN_ATTR', 'cn')
     LDAP_USER_LOGIN_ATTR = os.environ.get('LDAP_USER_LOGIN_ATTR', 'mail')
     
+    # LDAP: серверы и пул сервисных соединений
+    # (в LDAP_SERVER можно перечислить несколько контроллеров домена через запятую)
+    LDAP_BIND_DN = os.environ.get('LDAP_BIND_DN', '')
+    LDAP_BIND_PASSWORD = os.environ.get('LDAP_BIND_PASSWORD', '')
+    LDAP_GET_INFO = os.environ.get('LDAP_GET_INFO', 'NONE')  # NONE, DSA, SCHEMA, ALL
+    LDAP_POOL_SIZE = int(os.environ.get('LDAP_POOL_SIZE', 5))
+    LDAP_CONNECT_TIMEOUT = int(os.environ.get('LDAP_CONNECT_TIMEOUT', 5))  # секунды
+    LDAP_RECEIVE_TIMEOUT = int(os.environ.get('LDAP_RECEIVE_TIMEOUT', 10))  # секунды
+    LDAP_POOL_HEALTHCHECK_INTERVAL = int(os.environ.get('LDAP_POOL_HEALTHCHECK_INTERVAL', 60))  # проверка после простоя, секунды
+    LDAP_POOL_MAX_LIFETIME = int(os.environ.get('LDAP_POOL_MAX_LIFETIME', 3600))  # секунды
+    LDAP_CACHE_TTL = int(os.environ.get('LDAP_CACHE_TTL', 300))  # кэш атрибутов и роли пользователя, секунды
+
+    # LDAP: проверка пароля при входе в отдельном пуле потоков
+    # (LDAP_AUTH_WORKERS = 0 - в потоке запроса, без таймаута и лимитов)
+    LDAP_AUTH_WORKERS = int(os.environ.get('LDAP_AUTH_WORKERS', 4))
+    LDAP_AUTH_QUEUE = int(os.environ.get('LDAP_AUTH_QUEUE', 8))  # попыток в ожидании сверх занятых потоков
+    LDAP_AUTH_TIMEOUT = float(os.environ.get('LDAP_AUTH_TIMEOUT', 5))  # поиск + привязка, секунды
+    LDAP_LOGIN_MAX_PER_IP = int(os.environ.get('LDAP_LOGIN_MAX_PER_IP', 2))  # одновременных попыток с адреса, 0 - без лимита
+    LDAP_BREAKER_THRESHOLD = int(os.environ.get('LDAP_BREAKER_THRESHOLD', 5))  # ошибок каталога подряд до размыкания
+    LDAP_BREAKER_RESET = int(os.environ.get('LDAP_BREAKER_RESET', 30))  # секунды до пробной попытки
+    
     # Default AD Groups for roles mapping
     LDAP_ADMIN_GROUP = os.environ.get('LDAP_ADMIN_GROUP', 'cn=Dash5S_Admins,ou=groups,dc=test,dc=local')
     LDAP_EDITOR_GROUP = os.environ.get('LDAP_EDITOR_GROUP', 'cn=Dash5S_Editors,ou=groups,dc=test,dc=local')
-    
\ No newline at end of file
+
+
+class SQLiteConfig(Config):
+    """Профиль SQLite: WAL (чтение не ждет записи), ожидание блокировки вместо ошибки."""
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # в режиме WAL без риска повредить базу, fsync только на checkpoint
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # байты
+    }
+
+
+class PostgresConfig(Config):
+    """Профиль PostgreSQL: пул соединений под число потоков воркера.
+    
+    Соединений на воркер не больше DB_POOL_SIZE + DB_MAX_OVERFLOW; сумма по всем
+    воркерам gunicorn должна оставаться ниже max_connections сервера.
+    """
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),  # обычно = числу потоков воркера
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # ожидание свободного соединения, секунды
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # секунды; меньше idle-таймаута pgbouncer/сети
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'connect_args': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),  # секунды
+            'options': f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))}",
+        },
+    }
+
+
+PROFILES = {'base': Config, 'sqlite': SQLiteConfig, 'postgresql': PostgresConfig}
+
+
+def select_config(profile=None, url=None):
+    """Класс конфигурации по DB_PROFILE (base, sqlite, postgresql, auto).
+    
+    auto (по умолчанию) - профиль по схеме DATABASE_URL.
+    """
+    profile = (profile or os.environ.get('DB_PROFILE') or 'auto').lower()
+    if profile == 'auto':
+        url = url or Config.SQLALCHEMY_DATABASE_URI
+        profile = 'postgresql' if url.startswith('postgres') else 'sqlite' if url.startswith('sqlite') else 'base'
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown DB_PROFILE: {profile}')
+    return PROFILES[profile]
@@ -1,89 +1,580 @@
 import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
 from flask import current_app, flash
 from flask_login import login_user
-from ldap3 import Server, Connection, ALL, SUBTREE
-from ldap3.core.exceptions import LDAPException
 from .models import User, db
 
 logger = logging.getLogger(__name__)
 
+# ldap3 (~80 мс импорта) загружается при первом обращении к каталогу, а не при старте воркера
+GET_INFO = ('NONE', 'DSA', 'SCHEMA', 'ALL')
+
+
+def _ldap_exceptions():
+    """Классы ошибок ldap3 для except-блоков: (LDAPBindError, LDAPException)."""
+    from ldap3.core.exceptions import LDAPBindError, LDAPException
+    return LDAPBindError, LDAPException
+
+
+class LDAPConnectionPool:
+    """Пул соединений сервисной учетной записи для поиска в каталоге.
+
+    Объекты Server создаются один раз (без загрузки схемы по умолчанию),
+    соединения переиспользуются между логинами и проверяются перед выдачей,
+    если простаивали дольше LDAP_POOL_HEALTHCHECK_INTERVAL.
+    """
+
+    def __init__(self, config):
+        import ldap3
+        from ldap3 import Server, ServerPool, ROUND_ROBIN
+
+        self.settings = self.settings_from(config)
+        hosts = [host.strip() for host in config['LDAP_SERVER'].split(',') if host.strip()]
+        get_info = str(config.get('LDAP_GET_INFO', 'NONE')).upper()
+        get_info = getattr(ldap3, get_info) if get_info in GET_INFO else ldap3.NONE
+        servers = [
+            Server(
+                host,
+                port=config['LDAP_PORT'],
+                use_ssl=config['LDAP_USE_SSL'],
+                get_info=get_info,
+                connect_timeout=config.get('LDAP_CONNECT_TIMEOUT', 5)
+            )
+            for host in hosts
+        ]
+        # Несколько контроллеров домена через запятую - пул с обходом недоступных
+        self.server = servers[0] if len(servers) == 1 else ServerPool(servers, ROUND_ROBIN, active=True, exhaust=60)
+        self.bind_dn = config.get('LDAP_BIND_DN', '')
+        self.bind_password = config.get('LDAP_BIND_PASSWORD', '')
+        self.receive_timeout = config.get('LDAP_RECEIVE_TIMEOUT', 10)
+        self.healthcheck_interval = config.get('LDAP_POOL_HEALTHCHECK_INTERVAL', 60)
+        self.max_lifetime = config.get('LDAP_POOL_MAX_LIFETIME', 3600)
+        self._idle = queue.LifoQueue(maxsize=config.get('LDAP_POOL_SIZE', 5))
+        self._pid = os.getpid()
+
+    @staticmethod
+    def settings_from(config):
+        keys = ('LDAP_SERVER', 'LDAP_PORT', 'LDAP_USE_SSL', 'LDAP_GET_INFO', 'LDAP_BIND_DN',
+                'LDAP_BIND_PASSWORD', 'LDAP_POOL_SIZE', 'LDAP_CONNECT_TIMEOUT', 'LDAP_RECEIVE_TIMEOUT',
+                'LDAP_POOL_HEALTHCHECK_INTERVAL', 'LDAP_POOL_MAX_LIFETIME')
+        return tuple(config.get(key) for key in keys)
+
+    def open(self, user=None, password=None):
+        """Новое соединение с привязкой (по умолчанию - сервисная учетная запись)."""
+        from ldap3 import Connection
+
+        if user is None:
+            user, password = self.bind_dn, self.bind_password
+        return Connection(self.server, user, password, auto_bind=True,
+                          receive_timeout=self.receive_timeout)
+
+    @contextmanager
+    def connection(self):
+        """Соединение из пула; при ошибке LDAP оно закрывается, а не возвращается."""
+        _, LDAPException = _ldap_exceptions()
+        conn = self._acquire()
+        try:
+            yield conn
+        except LDAPException:
+            self._discard(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def _acquire(self):
+        while True:
+            try:
+                conn, created_at, used_at = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.open()
+                conn._pool_created_at = time.monotonic()
+                return conn
+
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime or not self._is_healthy(conn, now - used_at):
+                self._discard(conn)
+                continue
+            conn._pool_created_at = created_at
+            return conn
+
+    def _is_healthy(self, conn, idle):
+        from ldap3 import BASE, NO_ATTRIBUTES
+
+        _, LDAPException = _ldap_exceptions()
+        if conn.closed or not conn.bound:
+            return False
+        if idle < self.healthcheck_interval:
+            return True
+        try:
+            # Дешевый запрос к корню каталога (RootDSE)
+            return conn.search('', '(objectClass=*)', search_scope=BASE, attributes=[NO_ATTRIBUTES])
+        except LDAPException:
+            return False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait((conn, conn._pool_created_at, time.monotonic()))
+        except queue.Full:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def close(self):
+        """Закрытие всех простаивающих соединений."""
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ldap_pool():
+    """Пул соединений процесса (создается заново после fork или смены настроек)."""
+    global _pool
+    config = current_app.config
+    pool = _pool
+    if pool is None or pool._pid != os.getpid() or pool.settings != LDAPConnectionPool.settings_from(config):
+        with _pool_lock:
+            pool = _pool
+            if pool is None or pool._pid != os.getpid() or pool.settings != LDAPConnectionPool.settings_from(config):
+                if pool is not None and pool._pid == os.getpid():
+                    pool.close()
+                pool = _pool = LDAPConnectionPool(config)
+    return pool
+
+
+# Атрибуты пользователя, читаемые из каталога
+USER_ATTRIBUTES = ['cn', 'mail', 'department', 'memberOf']
+
+# Данные пользователя из каталога и вычисленная роль
+DirectoryEntry = namedtuple('DirectoryEntry', ['dn', 'display_name', 'email', 'department', 'role'])
+
+
+class DirectoryCache:
+    """Кэш атрибутов каталога и роли пользователя с ограниченным временем жизни.
+
+    Записи хранятся по DN; отдельный индекс сопоставляет логин с DN,
+    чтобы при повторном входе пропускать поиск в каталоге.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # dn -> (entry, expires_at)
+        self._dn_by_login = {}
+        self._lock = threading.Lock()
+
+    def get(self, login):
+        with self._lock:
+            dn = self._dn_by_login.get(login.lower())
+            item = self._entries.get(dn) if dn else None
+            if item is None:
+                return None
+            entry, expires_at = item
+            if expires_at < time.monotonic():
+                del self._entries[dn]
+                self._dn_by_login.pop(login.lower(), None)
+                return None
+            return entry
+
+    def put(self, login, entry, ttl):
+        with self._lock:
+            self._entries[entry.dn] = (entry, time.monotonic() + ttl)
+            self._entries.move_to_end(entry.dn)
+            self._dn_by_login[login.lower()] = entry.dn
+            while len(self._entries) > self.max_entries:
+                dn, _ = self._entries.popitem(last=False)
+                self._dn_by_login = {k: v for k, v in self._dn_by_login.items() if v != dn}
+
+    def invalidate(self, login=None):
+        """Удаление записи пользователя (или всего кэша, если логин не указан)."""
+        with self._lock:
+            if login is None:
+                self._entries.clear()
+                self._dn_by_login.clear()
+                return
+            dn = self._dn_by_login.pop(login.lower(), None)
+            if dn:
+                self._entries.pop(dn, None)
+
+
+directory_cache = DirectoryCache()
+
+
+def _first(attributes, name, default=''):
+    value = attributes.get(name)
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+    return str(value) if value not in (None, '') else default
+
+
+def resolve_role(member_of, config):
+    """Роль пользователя по группам AD."""
+    if config['LDAP_ADMIN_GROUP'] in member_of:
+        return 'Admin'
+    if config['LDAP_EDITOR_GROUP'] in member_of:
+        return 'Editor'
+    return 'Viewer'
+
+
+def directory_entry(dn, attributes, username, config):
+    """DirectoryEntry из словаря атрибутов LDAP."""
+    member_of = attributes.get('memberOf') or []
+    if isinstance(member_of, str):
+        member_of = [member_of]
+    return DirectoryEntry(
+        dn=dn,
+        display_name=_first(attributes, 'cn'),
+        email=_first(attributes, 'mail', username),
+        department=_first(attributes, 'department'),
+        role=resolve_role(member_of, config)
+    )
+
+
+def apply_directory_entry(user, entry):
+    """Перенос данных каталога в User; возвращает True, если что-то изменилось."""
+    changed = False
+    for field in ('display_name', 'email', 'department', 'role'):
+        value = getattr(entry, field)
+        if getattr(user, field) != value:
+            setattr(user, field, value)
+            changed = True
+    return changed
+
+
+class LoginRejected(Exception):
+    """Попытка входа отклонена без проверки пароля: лимит попыток или недоступность каталога."""
+
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class CircuitBreaker:
+    """Размыкатель для каталога.
+
+    После failure_threshold ошибок подряд попытки отклоняются сразу, без
+    обращения к серверу; через reset_timeout секунд пропускается одна пробная
+    попытка, и ее успех снова замыкает цепь.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("LDAP circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"LDAP circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LoginGate:
+    """Проверка пароля в каталоге вне потока запроса (расширение Flask).
+
+    Поиск и привязка выполняются в ограниченном пуле потоков с жестким
+    таймаутом на попытку, поэтому медленный контроллер домена держит
+    воркер не дольше LDAP_AUTH_TIMEOUT. Очередь пула ограничена: лишние
+    попытки и попытки при разомкнутом размыкателе отклоняются сразу,
+    как и попытки сверх LDAP_LOGIN_MAX_PER_IP одновременных с одного адреса.
+    Работа с БД остается в потоке запроса. Лимиты действуют в пределах
+    процесса; за обратным прокси remote_addr должен быть адресом клиента
+    (ProxyFix). LDAP_AUTH_WORKERS = 0 - проверка в потоке запроса, как раньше.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.breaker = CircuitBreaker()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._active_by_ip = {}
+        self._counters = dict(accepted=0, rejected_ip=0, rejected_busy=0, rejected_circuit=0, timeouts=0, errors=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('LDAP_AUTH_WORKERS', 4)
+        self.queue_size = app.config.get('LDAP_AUTH_QUEUE', 8)
+        self.timeout = app.config.get('LDAP_AUTH_TIMEOUT', 5.0)
+        self.max_per_ip = app.config.get('LDAP_LOGIN_MAX_PER_IP', 2)
+        self.breaker = CircuitBreaker(app.config.get('LDAP_BREAKER_THRESHOLD', 5),
+                                      app.config.get('LDAP_BREAKER_RESET', 30))
+        app.extensions['login_gate'] = self
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, active=sum(self._active_by_ip.values()), circuit=self.breaker.state)
+
+    def _get_executor(self):
+        # Пул создается лениво и заново после fork (потоки не наследуются)
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='ldap-auth')
+                    self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _enter(self, remote_addr):
+        with self._lock:
+            active = self._active_by_ip.get(remote_addr, 0)
+            if remote_addr and self.max_per_ip and active >= self.max_per_ip:
+                self._counters['rejected_ip'] += 1
+                return False
+            self._active_by_ip[remote_addr] = active + 1
+            return True
+
+    def _leave(self, remote_addr):
+        with self._lock:
+            active = self._active_by_ip.get(remote_addr, 1) - 1
+            if active > 0:
+                self._active_by_ip[remote_addr] = active
+            else:
+                self._active_by_ip.pop(remote_addr, None)
+
+    def check(self, username, password, remote_addr=None):
+        """DirectoryEntry при верном пароле, None при неверном; LoginRejected, если проверка невозможна."""
+        _, LDAPException = _ldap_exceptions()
+        if not self.workers:
+            try:
+                return LDAPAuth.verify(username, password)
+            except LDAPException as e:
+                logger.error(f"LDAP authentication error for {username}: {str(e)}")
+                raise LoginRejected('Служба каталога недоступна, повторите попытку позже')
+
+        if not self._enter(remote_addr):
+            raise LoginRejected('Слишком много попыток входа, повторите через несколько секунд', 429)
+        try:
+            executor = self._get_executor()
+            # Слот занят до конца проверки, даже если запрос уже получил таймаут
+            if not self._slots.acquire(blocking=False):
+                self._count('rejected_busy')
+                raise LoginRejected('Сервис входа перегружен, повторите попытку позже')
+            if not self.breaker.allow():
+                self._slots.release()
+                self._count('rejected_circuit')
+                raise LoginRejected('Служба каталога недоступна, повторите попытку позже')
+
+            self._count('accepted')
+            app = current_app._get_current_object()
+            submitted = False
+            try:
+                future = executor.submit(self._verify, app, username, password)
+                submitted = True
+            except RuntimeError as e:
+                # Пул остановлен (завершение воркера): проверка не запускалась
+                self.breaker.record_failure()
+                self._count('errors')
+                logger.error(f"LDAP authentication pool is unavailable: {str(e)}")
+                raise LoginRejected('Сервис входа недоступен, повторите попытку позже')
+            finally:
+                # Слот освобождает _verify, но только если задача попала в пул
+                if not submitted:
+                    self._slots.release()
+            try:
+                entry = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self.breaker.record_failure()
+                self._count('timeouts')
+                logger.error(f"LDAP authentication timed out for {username} after {self.timeout} s")
+                raise LoginRejected('Служба каталога не отвечает, повторите попытку позже')
+            except LDAPException as e:
+                self.breaker.record_failure()
+                self._count('errors')
+                logger.error(f"LDAP authentication error for {username}: {str(e)}")
+                raise LoginRejected('Служба каталога недоступна, повторите попытку позже')
+            except Exception as e:
+                self.breaker.record_failure()
+                logger.error(f"Unexpected error during authentication: {str(e)}")
+                return None
+            self.breaker.record_success()
+            return entry
+        finally:
+            self._leave(remote_addr)
+
+    def _verify(self, app, username, password):
+        try:
+            with app.app_context():
+                return LDAPAuth.verify(username, password)
+        finally:
+            self._slots.release()
+
+
+login_gate = LoginGate()
+
+
 class LDAPAuth:
     """Класс для работы с аутентификацией через LDAP/AD."""
-    
+
     @staticmethod
-    def authenticate(username, password):
-        """Аутентификация пользователя через LDAP."""
-        if not username or not password:
-            return None
-            
-        try:
-            # Подключение к LDAP-серверу
-            server = Server(
-                current_app.config['LDAP_SERVER'],
-                port=current_app.config['LDAP_PORT'],
-                use_ssl=current_app.config['LDAP_USE_SSL'],
-                get_info=ALL
-            )
-            
-            # Поиск DN пользователя
-            search_filter = f"({current_app.config['LDAP_USER_LOGIN_ATTR']}={username})"
-            
-            with Connection(server, 
-                          current_app.config.get('LDAP_BIND_DN', ''),
-                          current_app.config.get('LDAP_BIND_PASSWORD', ''),
-                          auto_bind=True) as conn:
-                
+    def verify(username, password):
+        """Проверка пароля в каталоге без обращения к БД.
+
+        DirectoryEntry при успехе, None - если пользователь не найден или пароль неверен;
+        ошибки связи с каталогом пробрасываются (LDAPException).
+        """
+        from ldap3 import SUBTREE
+
+        LDAPBindError, _ = _ldap_exceptions()
+        config = current_app.config
+        pool = get_ldap_pool()
+
+        # Атрибуты и роль из кэша; поиск в каталоге - только при промахе
+        entry = directory_cache.get(username)
+        if entry is None:
+            search_filter = f"({config['LDAP_USER_LOGIN_ATTR']}={username})"
+
+            with pool.connection() as conn:
                 conn.search(
-                    search_base=current_app.config['LDAP_USER_DN'],
+                    search_base=config['LDAP_USER_DN'],
                     search_filter=search_filter,
                     search_scope=SUBTREE,
-                    attributes=['cn', 'mail', 'department', 'memberOf']
+                    attributes=USER_ATTRIBUTES
                 )
-                
+
                 if not conn.entries:
                     logger.warning(f"User {username} not found in LDAP")
                     return None
-                
-                user_dn = conn.entries[0].entry_dn
-                
-            # Попытка привязки с учетными данными пользователя
-            with Connection(server, user_dn, password, auto_bind=True) as user_conn:
-                # Успешная аутентификация
+
                 user_info = conn.entries[0]
-                
-                # Получение роли из групп AD
-                role = 'Viewer'
-                member_of = user_info.memberOf.values if hasattr(user_info, 'memberOf') else []
-                
-                if current_app.config['LDAP_ADMIN_GROUP'] in member_of:
-                    role = 'Admin'
-                elif current_app.config['LDAP_EDITOR_GROUP'] in member_of:
-                    role = 'Editor'
-                
-                # Создание/обновление пользователя в БД
-                user = User.query.filter_by(username=username).first()
-                if not user:
-                    user = User(
-                        username=username,
-                        display_name=str(user_info.cn),
-                        email=str(user_info.mail) if hasattr(user_info, 'mail') else username,
-                        department=str(user_info.department) if hasattr(user_info, 'department') else '',
-                        role=role
-                    )
-                else:
-                    user.display_name = str(user_info.cn)
-                    user.email = str(user_info.mail) if hasattr(user_info, 'mail') else username
-                    user.department = str(user_info.department) if hasattr(user_info, 'department') else ''
-                    user.role = role
-                
+                entry = directory_entry(user_info.entry_dn, user_info.entry_attributes_as_dict,
+                                        username, config)
+
+            directory_cache.put(username, entry, config.get('LDAP_CACHE_TTL', 300))
+
+        # Попытка привязки с учетными данными пользователя (пароль проверяется всегда)
+        try:
+            with pool.open(entry.dn, password):
+                pass
+        except LDAPBindError as e:
+            logger.warning(f"LDAP bind failed for {username}: {str(e)}")
+            return None
+        return entry
+
+    @staticmethod
+    def authenticate(username, password, remote_addr=None):
+        """Аутентификация пользователя через LDAP.
+
+        Проверка в каталоге идет через login_gate; LoginRejected пробрасывается,
+        чтобы страница входа не выдавала отказ каталога за неверный пароль.
+        """
+        if not username or not password:
+            return None
+
+        entry = login_gate.check(username, password, remote_addr)
+        if entry is None:
+            return None
+
+        try:
+            # Создание/обновление пользователя в БД (commit - только при изменениях)
+            user = User.query.filter_by(username=username).first()
+            if not user:
+                user = User(username=username)
+                apply_directory_entry(user, entry)
                 db.session.add(user)
                 db.session.commit()
-                
-                return user
-                
-        except LDAPException as e:
-            logger.error(f"LDAP authentication error for {username}: {str(e)}")
-            return None
+            elif apply_directory_entry(user, entry):
+                db.session.commit()
+
+            return user
+
         except Exception as e:
             logger.error(f"Unexpected error during authentication: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def sync_directory(page_size=500):
+        """Обновление всех известных пользователей одним постраничным поиском в каталоге.
+
+        Возвращает кортеж (найдено в каталоге, изменено в БД).
+        """
+        from ldap3 import SUBTREE
+
+        config = current_app.config
+        login_attr = config['LDAP_USER_LOGIN_ATTR']
+        users = {user.username.lower(): user for user in User.query.all()}
+        ttl = config.get('LDAP_CACHE_TTL', 300)
+        found = changed = 0
+
+        with get_ldap_pool().connection() as conn:
+            results = conn.extend.standard.paged_search(
+                search_base=config['LDAP_USER_DN'],
+                search_filter=f'({login_attr}=*)',
+                search_scope=SUBTREE,
+                attributes=list({*USER_ATTRIBUTES, login_attr}),
+                paged_size=page_size,
+                generator=True
+            )
+            for item in results:
+                if item.get('type') != 'searchResEntry':
+                    continue
+                login = _first(item['attributes'], login_attr)
+                user = users.get(login.lower())
+                if user is None:
+                    continue
+
+                entry = directory_entry(item['dn'], item['attributes'], user.username, config)
+                directory_cache.put(user.username, entry, ttl)
+                found += 1
+                if apply_directory_entry(user, entry):
+                    changed += 1
+
+        if changed:
+            db.session.commit()
+        return found, changed
@@ -0,0 +1,41 @@
+import click
+from flask import current_app
+from .views import bp
+from .auth import LDAPAuth
+from .visit_rollup import run_visit_maintenance
+
+
+@bp.cli.command('sync-directory')
+@click.option('--page-size', default=500, show_default=True, help='Размер страницы LDAP-поиска')
+def sync_directory(page_size):
+    """Обновление данных пользователей из каталога одним постраничным поиском."""
+    found, changed = LDAPAuth.sync_directory(page_size=page_size)
+    click.echo(f'Directory sync: {found} users found, {changed} updated')
+
+
+@bp.cli.command('rollup-visits')
+def rollup_visits():
+    """Агрегирование журнала посещений, создание секций и удаление старых записей."""
+    result = run_visit_maintenance(current_app.config)
+    click.echo(
+        f"Visit logs: {result['rolled_up']} rolled up, {result['pruned']} pruned, "
+        f"{result['partitions_created']} partitions created"
+    )
+
+
+@bp.cli.command('init-db')
+@click.option('--seed/--no-seed', default=True, show_default=True, help='Создать начальные данные')
+def init_db(seed):
+    """Создание недостающих таблиц без миграций (разработка, SQLite) и начальных данных."""
+    from app import create_tables, create_initial_data
+    create_tables(current_app)
+    click.echo('Database tables created/verified')
+    if seed:
+        click.echo(f'Initial data: {create_initial_data(current_app)} records created')
+
+
+@bp.cli.command('seed')
+def seed():
+    """Начальные данные (модули, тестовые участки) в существующую схему; повторный запуск безопасен."""
+    from app import create_initial_data
+    click.echo(f'Initial data: {create_initial_data(current_app)} records created')
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context, request, session
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragma_listener(pragmas):
+    """Обработчик события connect: PRAGMA для каждого нового соединения SQLite."""
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+def configure_engines(app):
+    """Настройка движков приложения по конфигу (сейчас - SQLITE_PRAGMAS).
+
+    Движки создаются при db.init_app, но соединения открываются
+    только при первом запросе к базе, поэтому старт воркера не замедляется.
+    """
+    from app import db
+
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', sqlite_pragma_listener(pragmas))
+            logger.debug(f'SQLite pragmas for {engine.url}: {pragmas}')
+
+
+class ReplicaRouter:
+    """Чтение из реплики для представлений, помеченных @replica_read (расширение Flask).
+
+    Реплика - bind 'replica' в SQLALCHEMY_BINDS (DATABASE_REPLICA_URL). SELECT
+    помеченного представления уходят в реплику, запись и SELECT ... FOR UPDATE -
+    в основную базу. Реплика не используется, если ее отставание больше
+    DB_REPLICA_MAX_LAG, если она недоступна (повторная проверка через
+    DB_REPLICA_RETRY_INTERVAL) и в течение DB_REPLICA_READ_YOUR_WRITES секунд
+    после записи пользователя (mark_write), чтобы он сразу видел свой аудит.
+    """
+
+    BIND_KEY = 'replica'
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._available = False
+        self._checked_at = None
+        self.lag = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = self.BIND_KEY in (app.config.get('SQLALCHEMY_BINDS') or {})
+        self.max_lag = app.config.get('DB_REPLICA_MAX_LAG', 5.0)
+        self.check_interval = app.config.get('DB_REPLICA_CHECK_INTERVAL', 5.0)
+        self.retry_interval = app.config.get('DB_REPLICA_RETRY_INTERVAL', 30.0)
+        self.read_your_writes = app.config.get('DB_REPLICA_READ_YOUR_WRITES', 10.0)
+        self.lag_query = app.config.get('DB_REPLICA_LAG_QUERY')
+        self._available = False
+        self._checked_at = None
+        app.extensions['replica_router'] = self
+
+    @property
+    def engine(self):
+        from app import db
+        return db.engines[self.BIND_KEY]
+
+    def available(self):
+        """Реплика доступна и отстает не больше DB_REPLICA_MAX_LAG (проверка не чаще check_interval)."""
+        now = time.monotonic()
+        if self._checked_at is not None and now < self._checked_at:
+            return self._available
+        with self._lock:
+            if self._checked_at is not None and now < self._checked_at:
+                return self._available
+            try:
+                lag = self._measure_lag()
+            except DBAPIError as e:
+                self.mark_failed(e)
+                return False
+            self.lag = lag
+            self._available = lag <= self.max_lag
+            self._checked_at = now + self.check_interval
+            if not self._available:
+                logger.warning(f'Read replica lags {lag:.1f} s (max {self.max_lag} s), reading from primary')
+            return self._available
+
+    def _measure_lag(self):
+        engine = self.engine
+        query = self.lag_query or LAG_QUERIES.get(engine.dialect.name, 'SELECT 0')
+        with engine.connect() as conn:
+            return float(conn.execute(text(query)).scalar() or 0)
+
+    def mark_failed(self, error):
+        """Реплика недоступна: чтение из основной базы до повторной проверки."""
+        logger.warning(f'Read replica failed, reading from primary for {self.retry_interval} s: {str(error)}')
+        self._available = False
+        self._checked_at = time.monotonic() + self.retry_interval
+
+    def mark_write(self):
+        """Пользователь что-то записал: его чтения идут в основную базу DB_REPLICA_READ_YOUR_WRITES секунд."""
+        if self.enabled and has_request_context():
+            session['_db_primary_until'] = time.time() + self.read_your_writes
+
+    def use_replica(self):
+        """Решение для текущего запроса: только GET/HEAD, вне окна read-your-writes, реплика в норме."""
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return False
+        if session.get('_db_primary_until', 0) > time.time():
+            return False
+        return self.available()
+
+
+# Отставание реплики в секундах (0 - реплика применила все полученное)
+LAG_QUERIES = {
+    'postgresql': (
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+    ),
+}
+
+
+def replica_read(view):
+    """Декоратор представления только для чтения: SELECT идут в реплику.
+
+    Пользователь для current_user читается из основной базы (UserCache.get):
+    снимок из реплики мог бы закэшировать уже снятую роль или блокировку.
+    При ошибке реплики представление выполняется повторно на основной базе.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_router.use_replica():
+            return view(*args, **kwargs)
+        # Флаг живет до конца запроса: потоковый ответ (выгрузка) тоже читает реплику
+        g.db_replica = True
+        try:
+            return view(*args, **kwargs)
+        except DBAPIError as e:
+            if not g.pop('db_replica_used', False):
+                raise
+            from app import db
+            db.session.rollback()
+            replica_router.mark_failed(e)
+            g.db_replica = False
+            return view(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _route_to_replica(orm_execute_state):
+    """SELECT в реплику внутри @replica_read, если в сессии нет несохраненных изменений.
+
+    Запрос с execution_options(db_primary=True) всегда идет в основную базу.
+    """
+    if not orm_execute_state.is_select or not has_request_context() or not g.get('db_replica'):
+        return
+    if orm_execute_state.execution_options.get('db_primary'):
+        return
+    session_ = orm_execute_state.session
+    if session_.new or session_.dirty or session_.deleted:
+        return
+    if getattr(orm_execute_state.statement, '_for_update_arg', None) is not None:
+        return
+    bind_arguments = orm_execute_state.bind_arguments
+    if 'bind' in bind_arguments:
+        return
+    from app import db
+    if session_.get_bind(**bind_arguments) is not db.engine:
+        return  # модель с собственным bind
+    bind_arguments['bind'] = replica_router.engine
+    g.db_replica_used = True
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,4 @@
+from flask_wtf import FlaskForm
+
+class ModuleToggleForm(FlaskForm):
+    """Включение/выключение модуля (форма без полей - только CSRF-токен)."""
@@ -0,0 +1,243 @@
+import logging
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from markupsafe import Markup
+
+try:
+    import redis
+except ImportError:  # Redis нужен только при FRAGMENT_CACHE_URL=redis://...
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """LRU-кэш фрагментов в памяти процесса с ограничением по объему.
+
+    Размер записи считается по sys.getsizeof ключа и значения; при
+    превышении max_bytes вытесняются давно не читавшиеся записи.
+    Теги (например, area:5) позволяют удалить все фрагменты участка разом.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags, size)
+        self._tags = {}                # tag -> set(key)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[1] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, ttl, tags=()):
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tuple(tags), size)
+            self.size += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tag):
+        with self._lock:
+            keys = self._tags.pop(tag, ())
+            for key in list(keys):
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, _, tags, size = self._entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def info(self):
+        with self._lock:
+            return dict(entries=len(self._entries), bytes=self.size, evictions=self.evictions)
+
+
+class RedisBackend:
+    """Кэш фрагментов в Redis (или совместимом сервере), общий для всех воркеров.
+
+    Ключи тега хранятся в множестве <prefix>:tag:<tag> с тем же временем
+    жизни, что и фрагменты; объем ограничивается политикой maxmemory сервера.
+    """
+
+    def __init__(self, url, prefix='dash5s:fragment'):
+        if redis is None:
+            raise RuntimeError('redis package is required for FRAGMENT_CACHE_URL=' + url)
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _tag_key(self, tag):
+        return f'{self.prefix}:tag:{tag}'
+
+    def get(self, key):
+        value = self._client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl, tags=()):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.set(key, value.encode('utf-8'), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self._tag_key(tag), key)
+            pipe.expire(self._tag_key(tag), ttl)
+        pipe.execute()
+
+    def invalidate(self, tag):
+        keys = self._client.smembers(self._tag_key(tag))
+        self._client.delete(self._tag_key(tag), *keys)
+        return len(keys)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f'{self.prefix}:*', count=1000))
+        if keys:
+            self._client.delete(*keys)
+
+    def info(self):
+        return {}
+
+
+class FragmentCache:
+    """Кэш отрисованных фрагментов шаблонов (расширение Flask).
+
+    FRAGMENT_CACHE_URL: memory:// - LRU процесса, redis://... - общий кэш,
+    none:// - кэш выключен. В ключ всегда входит роль пользователя, поэтому
+    кнопки редактора не попадают к наблюдателю; версию данных (например,
+    версию сводки участка) передает вызывающий код. Ошибки хранилища не
+    ломают страницу: фрагмент просто отрисовывается заново.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 300
+        self.prefix = 'dash5s:fragment'
+        self._lock = threading.Lock()
+        self._counters = dict(hits=0, misses=0, errors=0, invalidations=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('FRAGMENT_CACHE_URL', 'memory://')
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+        self.prefix = app.config.get('FRAGMENT_CACHE_PREFIX', 'dash5s:fragment')
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.backend = RedisBackend(url, self.prefix)
+        elif url.startswith('none://'):
+            self.backend = None
+        else:
+            self.backend = MemoryBackend(app.config.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        app.add_template_global(self.cache_fragment, 'cache_fragment')
+        app.extensions['fragment_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key(self, name, parts):
+        from flask_login import current_user
+
+        role = getattr(current_user, 'role', None) or 'anonymous'
+        # Коллекции (например, список модулей меню) входят в ключ контрольной суммой
+        parts = [
+            f'{zlib.crc32(repr(part).encode("utf-8")):08x}' if isinstance(part, (tuple, list)) else str(part)
+            for part in parts
+        ]
+        return ':'.join([self.prefix, name, role] + parts)
+
+    def get_or_render(self, name, parts, render, area=None):
+        """Фрагмент из кэша или результат render() (сохраняется в кэш).
+
+        area - id участка: фрагмент удаляется при записи его аудитов.
+        """
+        if self.backend is None:
+            return Markup(render())
+
+        key = self.key(name, parts)
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._incr('errors')
+            logger.warning(f"Fragment cache read failed: {str(e)}")
+            return Markup(render())
+        if value is not None:
+            self._incr('hits')
+            return Markup(value)
+
+        self._incr('misses')
+        value = str(render())
+        tags = (f'area:{area}',) if area is not None else ()
+        try:
+            self.backend.set(key, value, self.ttl, tags)
+        except Exception as e:
+            self._incr('errors')
+            logger.warning(f"Fragment cache write failed: {str(e)}")
+        return Markup(value)
+
+    def cache_fragment(self, name, *parts, area=None, caller=None):
+        """Глобальная функция шаблонов для блока {% call cache_fragment(...) %}.
+
+        Тело блока отрисовывается только при промахе.
+        """
+        return self.get_or_render(name, parts, caller, area)
+
+    def invalidate_area(self, *area_ids):
+        """Удаление фрагментов участков (после записи аудитов)."""
+        if self.backend is None:
+            return 0
+        removed = 0
+        for area_id in area_ids:
+            try:
+                removed += self.backend.invalidate(f'area:{area_id}')
+            except Exception as e:
+                self._incr('errors')
+                logger.warning(f"Fragment cache invalidation failed for area {area_id}: {str(e)}")
+        self._incr('invalidations', removed)
+        return removed
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self):
+        """Счетчики попаданий и промахов процесса и заполнение хранилища."""
+        with self._lock:
+            data = dict(self._counters)
+        if self.backend is not None:
+            data.update(self.backend.info())
+        return data
+
+
+fragment_cache = FragmentCache()
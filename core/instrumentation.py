@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы времени запроса, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def query_budget(limit):
+    """Декоратор представления: собственный бюджет SQL-запросов вместо INSTRUMENTATION_QUERY_BUDGET.
+
+    limit=None - без ограничения (пакетные операции).
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class RequestStats:
+    """Счетчики одного запроса (хранятся в g)."""
+
+    __slots__ = ('started', 'queries', 'sql_time', 'statements', '_query_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self._query_started = None
+
+
+class Instrumentation:
+    """Замеры времени запросов и числа SQL-запросов (расширение Flask, включается конфигом).
+
+    При INSTRUMENTATION_ENABLED = False init_app ничего не регистрирует:
+    ни обработчиков запроса, ни событий движка, ни маршрута /metrics.
+    Метрики копятся в памяти процесса; при нескольких воркерах gunicorn
+    каждый отдает свои значения (Prometheus собирает их как разные цели
+    или через общий счетчик в агенте).
+    Время потоковых ответов (SSE, выгрузка) считается до начала отдачи тела.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._requests = Counter()       # (endpoint, method, status) -> число
+        self._durations = {}             # endpoint -> [счетчики по DURATION_BUCKETS + inf, сумма]
+        self._sql_queries = Counter()    # endpoint -> число запросов
+        self._sql_seconds = Counter()    # endpoint -> время SQL
+        self._over_budget = Counter()    # endpoint -> превышений бюджета
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', False)
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+
+        self.query_budget = app.config.get('INSTRUMENTATION_QUERY_BUDGET', 20)
+        self.server_timing = app.config.get('INSTRUMENTATION_SERVER_TIMING', True)
+        self.metrics_token = app.config.get('METRICS_TOKEN')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.metrics_view)
+        if not getattr(Instrumentation, '_engine_listeners', False):
+            # Один раз на процесс: обработчики работают только внутри запроса с включенными замерами
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            Instrumentation._engine_listeners = True
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unknown'
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', self.query_budget)
+        over_budget = budget is not None and stats.queries > budget
+        if over_budget:
+            statement, repeats = stats.statements.most_common(1)[0]
+            logger.warning(
+                f"Query budget exceeded on {endpoint}: {stats.queries} queries (budget {budget}), "
+                f"most repeated x{repeats}: {statement[:200]}"
+            )
+
+        self._record(endpoint, request.method, response.status_code, elapsed, stats, over_budget)
+
+        if self.server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'app;dur={elapsed * 1000:.1f}, db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"'
+            )
+        return response
+
+    def _record(self, endpoint, method, status, elapsed, stats, over_budget):
+        with self._lock:
+            self._requests[(endpoint, method, status)] += 1
+            histogram = self._durations.get(endpoint)
+            if histogram is None:
+                histogram = self._durations[endpoint] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    histogram[0][i] += 1
+                    break
+            else:
+                histogram[0][-1] += 1
+            histogram[1] += elapsed
+            self._sql_queries[endpoint] += stats.queries
+            self._sql_seconds[endpoint] += stats.sql_time
+            if over_budget:
+                self._over_budget[endpoint] += 1
+
+    def metrics_view(self):
+        """Метрики в текстовом формате Prometheus."""
+        if self.metrics_token and request.headers.get('Authorization') != f'Bearer {self.metrics_token}':
+            abort(403)
+        return Response(self.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    def render_metrics(self):
+        with self._lock:
+            requests = dict(self._requests)
+            durations = {endpoint: (list(counts), total) for endpoint, (counts, total) in self._durations.items()}
+            sql_queries = dict(self._sql_queries)
+            sql_seconds = dict(self._sql_seconds)
+            over_budget = dict(self._over_budget)
+
+        lines = [
+            '# HELP dash5s_requests_total HTTP requests by endpoint, method and status.',
+            '# TYPE dash5s_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'dash5s_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP dash5s_request_duration_seconds Request wall time by endpoint.',
+            '# TYPE dash5s_request_duration_seconds histogram',
+        ]
+        for endpoint, (counts, total) in sorted(durations.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'dash5s_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'dash5s_request_duration_seconds_sum{{{label}}} {total:.6f}')
+            lines.append(f'dash5s_request_duration_seconds_count{{{label}}} {cumulative}')
+
+        for name, help_text, values, fmt in (
+            ('dash5s_sql_queries_total', 'SQL statements executed while handling requests.', sql_queries, '{}'),
+            ('dash5s_sql_seconds_total', 'Time spent in SQL statements while handling requests.', sql_seconds, '{:.6f}'),
+            ('dash5s_query_budget_exceeded_total', 'Requests over the SQL query budget.', over_budget, '{}'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for endpoint, value in sorted(values.items()):
+                lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} ' + fmt.format(value))
+
+        cache = current_app.extensions.get('fragment_cache')
+        if cache is not None and cache.enabled:
+            stats = cache.stats()
+            lines += [
+                '# HELP dash5s_fragment_cache_total Rendered fragment cache lookups and invalidations.',
+                '# TYPE dash5s_fragment_cache_total counter',
+            ]
+            for result in ('hits', 'misses', 'errors', 'invalidations'):
+                lines.append(f'dash5s_fragment_cache_total{{result="{result}"}} {stats[result]}')
+            if 'bytes' in stats:
+                lines += [
+                    '# HELP dash5s_fragment_cache_bytes In-process fragment cache size.',
+                    '# TYPE dash5s_fragment_cache_bytes gauge',
+                    f'dash5s_fragment_cache_bytes {stats["bytes"]}',
+                ]
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            for counter in (self._requests, self._sql_queries, self._sql_seconds, self._over_budget):
+                counter.clear()
+            self._durations.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    if stats is not None:
+        stats._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    if stats is None or stats._query_started is None:
+        return
+    stats.sql_time += time.perf_counter() - stats._query_started
+    stats._query_started = None
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+
+instrumentation = Instrumentation()
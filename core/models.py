@@ -36,10 +36,64 @@ class VisitLog(db.Model):
     endpoint = db.Column(db.String(200))      # Например, 'dashboard.index'
     action = db.Column(db.String(100))        # Например, 'login', 'view_page', 'submit_audit'
     details = db.Column(db.Text)              # Дополнительная информация (JSON)
+    duration_ms = db.Column(db.Integer)       # Время обработки запроса
+    
+    __table_args__ = (
+        db.Index('ix_visit_logs_timestamp', 'timestamp'),
+    )
     
     def __repr__(self):
         return f'<VisitLog {self.user_id} - {self.action} at {self.timestamp}>'
 
+class VisitRollupHourly(db.Model):
+    """Число запросов по часам: endpoint, пользователь, действие (агрегат VisitLog)."""
+    __tablename__ = 'visit_rollup_hourly'
+    
+    bucket = db.Column(db.DateTime, primary_key=True)  # Начало часа (UTC)
+    endpoint = db.Column(db.String(200), primary_key=True, default='')
+    user_id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(100), primary_key=True, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VisitRollupHourly {self.bucket} {self.endpoint} {self.user_id}: {self.count}>'
+
+class VisitRollupDaily(db.Model):
+    """Число запросов по дням: endpoint, пользователь, действие (агрегат VisitLog)."""
+    __tablename__ = 'visit_rollup_daily'
+    
+    bucket = db.Column(db.DateTime, primary_key=True)  # Начало дня (UTC)
+    endpoint = db.Column(db.String(200), primary_key=True, default='')
+    user_id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(100), primary_key=True, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VisitRollupDaily {self.bucket} {self.endpoint} {self.user_id}: {self.count}>'
+
+class VisitLatencyHourly(db.Model):
+    """Гистограмма времени ответа по часам и endpoint (интервалы - LATENCY_BOUNDS_MS)."""
+    __tablename__ = 'visit_latency_hourly'
+    
+    bucket = db.Column(db.DateTime, primary_key=True)  # Начало часа (UTC)
+    endpoint = db.Column(db.String(200), primary_key=True, default='')
+    bin = db.Column(db.Integer, primary_key=True)      # Номер интервала гистограммы
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VisitLatencyHourly {self.bucket} {self.endpoint} bin={self.bin}: {self.count}>'
+
+class VisitRollupState(db.Model):
+    """Граница агрегирования: записи VisitLog раньше watermark уже учтены в агрегатах."""
+    __tablename__ = 'visit_rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<VisitRollupState {self.name}: {self.watermark}>'
+
 class CoreModule(db.Model):
     """Реестр активных модулей системы."""
     __tablename__ = 'core_modules'
@@ -131,4 +185,6 @@ class ChecklistAssignment(db.Model):
 # Функция для загрузки пользователя (требуется Flask-Login)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    # Снимок из кэша процесса: на каждый запрос нет обращения к таблице users
+    from .user_cache import user_cache
+    return user_cache.get(int(user_id))
\ No newline at end of file
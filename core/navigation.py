@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Неизменяемый снимок модуля для меню (не привязан к сессии БД)
+MenuModule = namedtuple('MenuModule', ['id', 'name', 'display_name', 'menu_order', 'version'])
+
+
+class ModuleRegistry:
+    """Кэш активных модулей меню, общий для всех запросов процесса.
+
+    Версия кэша хранится в файле-метке: изменение модуля в любом воркере
+    записывает в метку новый uuid, а остальные воркеры сверяют ее содержимое
+    не чаще раза в MODULE_REGISTRY_CHECK_INTERVAL секунд, не обращаясь к таблице.
+    По содержимому, а не по mtime: на ФС с грубой точностью времени (1-2 с)
+    две смены подряд дают одинаковый mtime.
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._modules = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.check_interval = app.config.get('MODULE_REGISTRY_CHECK_INTERVAL', 5.0)
+        self.stamp_file = app.config.get('MODULE_REGISTRY_STAMP_FILE') or \
+            os.path.join(app.instance_path, 'module_registry.stamp')
+        app.extensions['module_registry'] = self
+
+    def get_active_modules(self):
+        """Список активных модулей в порядке меню (запрос к БД только при смене версии)."""
+        now = time.monotonic()
+        if self._modules is not None and now - self._checked_at < self.check_interval:
+            return self._modules
+
+        version = self._read_version()
+        with self._lock:
+            if self._modules is None or version != self._version:
+                self._modules = self._load()
+                self._version = version
+            self._checked_at = now
+            return self._modules
+
+    def invalidate(self):
+        """Сброс кэша процесса и смена версии для остальных воркеров."""
+        with self._lock:
+            self._modules = None
+            self._version = None
+        try:
+            os.makedirs(os.path.dirname(self.stamp_file), exist_ok=True)
+            # Запись во временный файл и замена: читатель не увидит пустую метку
+            tmp_file = f'{self.stamp_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(tmp_file, self.stamp_file)
+        except OSError as e:
+            logger.warning(f"Could not update module registry stamp: {str(e)}")
+
+    @property
+    def version(self):
+        return self._version
+
+    def _read_version(self):
+        try:
+            with open(self.stamp_file) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _load(self):
+        from .models import CoreModule
+
+        modules = CoreModule.query.filter_by(is_active=True).order_by(CoreModule.menu_order).all()
+        return tuple(
+            MenuModule(m.id, m.name, m.display_name, m.menu_order, m.version)
+            for m in modules
+        )
+
+
+module_registry = ModuleRegistry()
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_module_changes(session, flush_context, instances):
+    """Пометка сессии, в которой меняются записи CoreModule."""
+    from .models import CoreModule
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, CoreModule):
+            session.info['core_modules_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('core_modules_changed', False) and module_registry._app is not None:
+        module_registry.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_on_rollback(session):
+    session.info.pop('core_modules_changed', None)
@@ -0,0 +1,182 @@
+import logging
+import queue
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # Redis нужен только при PUBSUB_URL=redis://...
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Очередь сообщений одного подписчика (например, одного SSE-соединения).
+
+    При переполнении вытесняется самое старое сообщение: подписчикам
+    важно последнее состояние, а не полная история.
+    """
+
+    def __init__(self, broker, channel, max_size):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=max_size)
+        self.dropped = 0
+
+    def put(self, message):
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Следующее сообщение или None по истечении timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalBroker:
+    """Брокер в памяти процесса: рассылка сообщений канала всем подписчикам.
+
+    Используется по умолчанию (один процесс, тесты) и как локальный
+    раздатчик для RedisBroker.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def close(self):
+        with self._lock:
+            self._channels.clear()
+
+
+class RedisBroker(LocalBroker):
+    """Брокер поверх Redis pub/sub (или совместимого сервера).
+
+    Публикация идет в Redis, а каждый процесс держит одну подписку на
+    канал в фоновом потоке и раздает сообщения своим подписчикам локально,
+    поэтому число соединений с Redis не зависит от числа SSE-клиентов.
+    """
+
+    def __init__(self, url, queue_size=100):
+        if redis is None:
+            raise RuntimeError('redis package is required for PUBSUB_URL=' + url)
+        super().__init__(queue_size)
+        self._client = redis.Redis.from_url(url)
+        self._listeners = {}
+
+    def publish(self, channel, message):
+        return self._client.publish(channel, message)
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        with self._lock:
+            if channel not in self._listeners:
+                thread = threading.Thread(target=self._listen, args=(channel,), name=f'pubsub-{channel}', daemon=True)
+                self._listeners[channel] = thread
+                thread.start()
+        return subscription
+
+    def _listen(self, channel):
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(channel)
+                for item in pubsub.listen():
+                    data = item.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    LocalBroker.publish(self, channel, data)
+            except Exception as e:
+                logger.warning(f"Pub/sub listener for {channel} failed, reconnecting: {str(e)}")
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+class EventBus:
+    """Общая шина событий приложения (расширение Flask).
+
+    PUBSUB_URL: memory:// - брокер в памяти процесса, redis://... - Redis.
+    """
+
+    def __init__(self, app=None):
+        self.broker = LocalBroker()
+        self.prefix = 'dash5s'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('PUBSUB_URL', 'memory://')
+        queue_size = app.config.get('PUBSUB_QUEUE_SIZE', 100)
+        self.prefix = app.config.get('PUBSUB_CHANNEL_PREFIX', 'dash5s')
+        self.broker.close()
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.broker = RedisBroker(url, queue_size)
+        else:
+            self.broker = LocalBroker(queue_size)
+        app.extensions['event_bus'] = self
+
+    def channel(self, name):
+        return f'{self.prefix}:{name}'
+
+    def publish(self, name, message):
+        """Публикация; ошибки брокера не должны ломать запрос, который уже зафиксирован."""
+        try:
+            return self.broker.publish(self.channel(name), message)
+        except Exception as e:
+            logger.warning(f"Could not publish to {name}: {str(e)}")
+            return 0
+
+    def subscribe(self, name):
+        return self.broker.subscribe(self.channel(name))
+
+
+event_bus = EventBus()
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class UserSnapshot:
+    """Неизменяемый снимок пользователя для current_user (без привязки к сессии БД)."""
+
+    __slots__ = ('id', 'username', 'display_name', 'email', 'department', 'role', 'is_active')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user):
+        for name in self.__slots__:
+            object.__setattr__(self, name, getattr(user, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only')
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id and hasattr(other, 'get_id')
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<User {self.username} ({self.role})>'
+
+
+class UserCache:
+    """LRU-кэш снимков пользователей процесса с ограниченным временем жизни."""
+
+    def __init__(self, app=None):
+        self.max_entries = 1000
+        self.ttl = 60
+        self._entries = OrderedDict()  # id -> (snapshot, expires_at)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_SIZE', 1000)
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """Снимок пользователя из кэша или из БД при промахе."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is not None and item[1] > now:
+                self._entries.move_to_end(user_id)
+                return item[0]
+
+        from app import db
+        from .models import User
+
+        # Только из основной базы: реплика может еще не знать о смене роли или блокировке
+        user = db.session.get(User, user_id, execution_options={'db_primary': True})
+        if user is None:
+            self.invalidate(user_id)
+            return None
+
+        snapshot = UserSnapshot(user)
+        with self._lock:
+            self._entries[user_id] = (snapshot, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, *user_ids):
+        """Удаление снимков (или всего кэша, если id не указаны)."""
+        with self._lock:
+            if not user_ids:
+                self._entries.clear()
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_user_changes(session, flush_context):
+    """Запоминание id пользователей, измененных в транзакции."""
+    from .models import User
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            session.info.setdefault('changed_user_ids', set()).add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    # Сюда попадают и обновления из LDAPAuth.authenticate, и деактивация администратором
+    user_ids = session.info.pop('changed_user_ids', None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_on_rollback(session):
+    session.info.pop('changed_user_ids', None)
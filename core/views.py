@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, g, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, g, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from .auth import LDAPAuth
+from .auth import LDAPAuth, LoginRejected
+from .forms import ModuleToggleForm
 from .models import User, VisitLog, CoreModule, db
+from .visit_log import visit_log_writer
+from .visit_rollup import visit_rollup_job, visit_stats, active_users_per_day, latency_percentiles
+from .navigation import module_registry
+from .database import replica_read
+import time
 from datetime import datetime
 
 # Обработка импорта url_parse для совместимости с разными версиями Werkzeug
@@ -12,30 +18,34 @@ except ImportError:
     # Для Werkzeug >= 2.0
     from urllib.parse import urlparse as url_parse
 
-from .auth import LDAPAuth
-from .models import User, VisitLog, CoreModule, db
-from datetime import datetime
-
 bp = Blueprint('core', __name__)
 
 
 @bp.before_app_request
 def before_request():
     """Выполняется перед каждым запросом."""
-    # Сохранение активных модулей в g для использования в шаблонах
-    g.active_modules = CoreModule.query.filter_by(is_active=True).order_by(CoreModule.menu_order).all()
+    # Сохранение активных модулей в g для использования в шаблонах (из кэша реестра)
+    g.active_modules = module_registry.get_active_modules()
     
-    # Логирование действий аутентифицированных пользователей
-    if current_user.is_authenticated:
-        log = VisitLog(
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def after_request(response):
+    """Логирование действий аутентифицированных пользователей со временем обработки."""
+    # Запись идет через очередь, без commit в рамках запроса
+    started = g.get('request_started')
+    if started is not None and current_user.is_authenticated:
+        visit_rollup_job.ensure_started()
+        visit_log_writer.push(
             user_id=current_user.id,
             ip_address=request.remote_addr,
             user_agent=request.user_agent.string,
             endpoint=request.endpoint,
-            action=request.method
+            action=request.method,
+            duration_ms=int((time.perf_counter() - started) * 1000)
         )
-        db.session.add(log)
-        db.session.commit()
+    return response
 
 
 @bp.route('/')
@@ -61,8 +71,12 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        # Аутентификация через LDAP
-        user = LDAPAuth.authenticate(username, password)
+        # Аутентификация через LDAP (с таймаутом и лимитами попыток)
+        try:
+            user = LDAPAuth.authenticate(username, password, remote_addr=request.remote_addr)
+        except LoginRejected as e:
+            flash(e.message, 'warning')
+            return render_template('auth/login.html'), e.status
         
         if user:
             login_user(user, remember=True)
@@ -96,6 +110,7 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 
 @admin_bp.route('/')
+@replica_read
 @login_required
 def index():
     """Панель администратора."""
@@ -107,11 +122,14 @@ def index():
     user_count = User.query.count()
     active_users = User.query.filter_by(is_active=True).count()
     recent_logs = VisitLog.query.order_by(VisitLog.timestamp.desc()).limit(10).all()
+    # Счетчики посещений - из суточных агрегатов, а не из журнала
+    stats = visit_stats(days=7)
     
     return render_template('admin/index.html',
                          user_count=user_count,
                          active_users=active_users,
-                         recent_logs=recent_logs)
+                         recent_logs=recent_logs,
+                         stats=stats)
 
 
 @admin_bp.route('/modules')
@@ -123,4 +141,73 @@ def module_management():
         return redirect(url_for('core.index'))
     
     modules = CoreModule.query.order_by(CoreModule.menu_order).all()
-    return render_template('admin/modules.html', modules=modules)
\ No newline at end of file
+    return render_template('admin/modules.html', modules=modules, toggle_form=ModuleToggleForm())
+
+
+@admin_bp.route('/modules/<int:module_id>/toggle', methods=['POST'])
+@login_required
+def toggle_module(module_id):
+    """Включение/выключение модуля."""
+    if current_user.role != 'Admin':
+        flash('Доступ запрещен', 'danger')
+        return redirect(url_for('core.index'))
+    
+    if not ModuleToggleForm().validate_on_submit():
+        flash('Форма устарела, повторите действие', 'danger')
+        return redirect(url_for('admin.module_management'))
+    
+    module = CoreModule.query.get_or_404(module_id)
+    module.is_active = not module.is_active
+    db.session.commit()  # кэш меню сбрасывается обработчиком after_commit
+    
+    flash(f'Модуль "{module.display_name}" {"включен" if module.is_active else "выключен"}', 'success')
+    return redirect(url_for('admin.module_management'))
+
+
+def usage_analytics(days):
+    """Аналитика использования только из агрегатов (журнал посещений не читается)."""
+    data = dict(
+        days=days,
+        active_users=[
+            dict(date=day.strftime('%Y-%m-%d'), users=users) for day, users in active_users_per_day(days)
+        ],
+        top_endpoints=[
+            dict(endpoint=endpoint, requests=count) for endpoint, count in visit_stats(days=days)['top_endpoints']
+        ],
+        latency=latency_percentiles(days),
+        audit_completion=None
+    )
+    # Выполнение аудитов - из сводок модуля Dashboard, если он установлен
+    try:
+        from modules.dashboard.services import audit_completion_stats
+    except ImportError:
+        return data
+    data['audit_completion'] = audit_completion_stats(weeks=min(max(days // 7, 1), 52))
+    return data
+
+
+def _analytics_days():
+    return min(max(request.args.get('days', 30, type=int), 1), 366)
+
+
+@admin_bp.route('/analytics')
+@replica_read
+@login_required
+def analytics():
+    """Аналитика использования платформы."""
+    if current_user.role != 'Admin':
+        flash('Доступ запрещен', 'danger')
+        return redirect(url_for('core.index'))
+    
+    return render_template('admin/analytics.html', data=usage_analytics(_analytics_days()))
+
+
+@admin_bp.route('/api/analytics')
+@replica_read
+@login_required
+def analytics_api():
+    """Аналитика использования в JSON (days=N)."""
+    if current_user.role != 'Admin':
+        return jsonify({'error': 'forbidden'}), 403
+    
+    return jsonify(usage_analytics(_analytics_days()))
@@ -0,0 +1,208 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Политики переполнения очереди
+DROP_NEW = 'drop_new'        # отбрасывать новое событие
+DROP_OLDEST = 'drop_oldest'  # вытеснять самое старое событие
+BLOCK = 'block'              # ждать место в очереди не дольше VISIT_LOG_PUT_TIMEOUT
+
+DROP_POLICIES = (DROP_NEW, DROP_OLDEST, BLOCK)
+
+# Метка в очереди: будит фоновый поток при остановке, не дожидаясь таймаута пачки
+_WAKE = object()
+
+
+class VisitLogWriter:
+    """Буферизованная запись VisitLog: очередь в памяти и фоновый сброс пачками."""
+
+    def __init__(self, app=None):
+        self._app = None
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._atexit_registered = False
+        self._counters = dict(enqueued=0, flushed=0, dropped=0, failed=0, batches=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Чтение настроек и регистрация сброса очереди при завершении процесса."""
+        if self._app is not None:
+            # Повторная инициализация (новое приложение в том же процессе): события,
+            # принятые до нее, записываются в базу прежнего приложения
+            self.shutdown()
+        self._app = app
+        self.enabled = app.config.get('VISIT_LOG_ASYNC', True)
+        self.batch_size = app.config.get('VISIT_LOG_BATCH_SIZE', 200)
+        self.max_age = app.config.get('VISIT_LOG_FLUSH_INTERVAL', 2.0)
+        self.put_timeout = app.config.get('VISIT_LOG_PUT_TIMEOUT', 0.05)
+        self.drop_policy = app.config.get('VISIT_LOG_DROP_POLICY', DROP_NEW)
+        if self.drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown VISIT_LOG_DROP_POLICY: {self.drop_policy}')
+        self._queue = queue.Queue(maxsize=app.config.get('VISIT_LOG_QUEUE_SIZE', 10000))
+        app.extensions['visit_log_writer'] = self
+        if not self._atexit_registered:
+            # Один раз на объект: повторный create_app() в процессе не добавляет обработчики
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def push(self, user_id, ip_address=None, user_agent=None, endpoint=None, action=None, details=None,
+             duration_ms=None):
+        """Постановка события в очередь (без обращения к БД)."""
+        event = dict(
+            user_id=user_id,
+            timestamp=datetime.utcnow(),
+            ip_address=ip_address,
+            user_agent=user_agent,
+            endpoint=endpoint,
+            action=action,
+            details=details,
+            duration_ms=duration_ms
+        )
+
+        if not self.enabled:
+            self._write([event])
+            return True
+
+        self._ensure_thread()
+        if self._put(event):
+            self._incr('enqueued')
+            return True
+
+        self._incr('dropped')
+        return False
+
+    def _put(self, event):
+        """Постановка в очередь с учетом политики переполнения."""
+        try:
+            if self.drop_policy == BLOCK:
+                self._queue.put(event, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy != DROP_OLDEST:
+            return False
+
+        # Вытесняем самое старое событие, чтобы сохранить свежие
+        try:
+            self._queue.get_nowait()
+            self._incr('dropped')
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def _ensure_thread(self):
+        """Ленивый запуск фонового потока (в т.ч. заново после fork воркера)."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Очередь родительского процесса после fork не используется
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='visit-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Цикл фонового потока: набор пачки по размеру или по возрасту."""
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.max_age)
+            except queue.Empty:
+                continue
+
+            batch = [] if first is _WAKE else [first]
+            deadline = time.monotonic() + self.max_age
+            while batch and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _WAKE:
+                    break
+                batch.append(event)
+
+            if batch:
+                self._write(batch)
+
+        self.flush()
+
+    def flush(self):
+        """Синхронный сброс всего, что накопилось в очереди."""
+        if self._queue is None:
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is not _WAKE:
+                    batch.append(event)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout=5.0):
+        """Остановка потока и сброс остатка очереди при завершении процесса."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass  # поток не ждет событий: очередь полна
+            thread.join(timeout)
+        self.flush()
+
+    def _write(self, batch):
+        """Вставка пачки одним executemany."""
+        from app import db
+        from .models import VisitLog
+
+        try:
+            with self._app.app_context():
+                db.session.execute(VisitLog.__table__.insert(), batch)
+                db.session.commit()
+            self._incr('flushed', len(batch))
+            self._incr('batches')
+        except Exception as e:
+            self._incr('failed', len(batch))
+            logger.error(f"Could not write {len(batch)} visit log events: {str(e)}")
+
+    def _incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self):
+        """Счетчики записанных, отброшенных и ожидающих событий."""
+        with self._lock:
+            data = dict(self._counters)
+        data['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return data
+
+
+visit_log_writer = VisitLogWriter()
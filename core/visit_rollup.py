@@ -0,0 +1,432 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = 'visit_logs'
+
+# Ключ агрегатов (кроме count)
+ROLLUP_KEYS = ('bucket', 'endpoint', 'user_id', 'action')
+LATENCY_KEYS = ('bucket', 'endpoint', 'bin')
+
+# Верхние границы интервалов гистограммы времени ответа, мс (последний интервал - без границы)
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _hour_expr(column, dialect):
+    """Начало часа для метки времени средствами СУБД."""
+    from app import db
+
+    if dialect == 'postgresql':
+        return db.func.date_trunc('hour', column)
+    return db.func.strftime('%Y-%m-%d %H:00:00', column)
+
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _upsert_counts(model, rows, dialect, keys=ROLLUP_KEYS):
+    """Прибавление счетчиков к существующим строкам агрегата (INSERT ... ON CONFLICT)."""
+    from app import db
+
+    if not rows:
+        return
+    table = model.__table__
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(table)
+        statement = insert.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={'count': table.c.count + insert.excluded.count}
+        )
+        db.session.execute(statement, rows)
+        return
+
+    # Прочие СУБД: построчно через ORM
+    for row in rows:
+        existing = db.session.get(model, tuple(row[key] for key in keys))
+        if existing is None:
+            db.session.add(model(**row))
+        else:
+            existing.count += row['count']
+
+
+def _state():
+    from app import db
+    from .models import VisitLog, VisitRollupState
+
+    state = db.session.get(VisitRollupState, STATE_NAME)
+    if state is not None:
+        return state
+
+    # Первый запуск: начинаем с самой старой записи журнала
+    start = db.session.scalar(db.select(db.func.min(VisitLog.timestamp)))
+    try:
+        with db.session.begin_nested():
+            db.session.add(VisitRollupState(
+                name=STATE_NAME,
+                watermark=start.replace(minute=0, second=0, microsecond=0) if start else None
+            ))
+    except IntegrityError:
+        pass  # создано параллельным запуском
+    db.session.commit()
+    return db.session.get(VisitRollupState, STATE_NAME)
+
+
+def rollup_visits(now=None, lag=300, max_span=timedelta(days=1)):
+    """Инкрементальное агрегирование VisitLog в почасовые и суточные агрегаты.
+
+    Обрабатывается окно [watermark, now - lag) не длиннее max_span за
+    транзакцию; lag оставляет время буферу VisitLogWriter дописать события.
+    Окно сначала захватывается условным UPDATE границы, поэтому
+    параллельные запуски (несколько воркеров, cron) не учитывают записи дважды.
+    Возвращает число учтенных записей журнала.
+    """
+    from app import db
+    from .models import VisitLog, VisitRollupHourly, VisitRollupDaily, VisitRollupState, VisitLatencyHourly
+
+    dialect = db.engine.dialect.name
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=lag)
+    total = 0
+
+    while True:
+        state = _state()
+        start = state.watermark
+        if start is not None and start >= cutoff:
+            break
+        end = cutoff if start is None else min(cutoff, start + max_span)
+
+        claimed = db.session.execute(
+            db.update(VisitRollupState).where(
+                VisitRollupState.name == STATE_NAME,
+                VisitRollupState.watermark.is_(None) if start is None else VisitRollupState.watermark == start
+            ).values(watermark=end, updated_at=datetime.utcnow())
+        ).rowcount
+        if claimed != 1:
+            db.session.rollback()
+            break  # окно обработано другим процессом
+
+        if start is None:
+            db.session.commit()  # журнал пуст: просто запоминаем границу
+            break
+
+        hour = _hour_expr(VisitLog.timestamp, dialect).label('bucket')
+        rows = db.session.execute(
+            db.select(
+                hour,
+                db.func.coalesce(VisitLog.endpoint, ''),
+                VisitLog.user_id,
+                db.func.coalesce(VisitLog.action, ''),
+                db.func.count()
+            ).where(
+                VisitLog.timestamp >= start,
+                VisitLog.timestamp < end
+            ).group_by(hour, VisitLog.endpoint, VisitLog.user_id, VisitLog.action)
+        ).all()
+
+        hourly = {}
+        daily = {}
+        for bucket, endpoint, user_id, action, count in rows:
+            bucket = _as_datetime(bucket)
+            for target, key_bucket in ((hourly, bucket), (daily, bucket.replace(hour=0))):
+                key = (key_bucket, endpoint, user_id, action)
+                target[key] = target.get(key, 0) + count
+            total += count
+
+        for model, counts in ((VisitRollupHourly, hourly), (VisitRollupDaily, daily)):
+            _upsert_counts(model, [
+                dict(zip(ROLLUP_KEYS, key), count=count) for key, count in counts.items()
+            ], dialect)
+
+        # Гистограмма времени ответа: интервал вычисляется в том же запросе через CASE
+        latency_bin = db.case(
+            *[(VisitLog.duration_ms < bound, i) for i, bound in enumerate(LATENCY_BOUNDS_MS)],
+            else_=len(LATENCY_BOUNDS_MS)
+        ).label('bin')
+        endpoint = db.func.coalesce(VisitLog.endpoint, '').label('endpoint')
+        latency = db.session.execute(
+            db.select(hour, endpoint, latency_bin, db.func.count()).where(
+                VisitLog.timestamp >= start,
+                VisitLog.timestamp < end,
+                VisitLog.duration_ms.isnot(None)
+            ).group_by(hour, endpoint, latency_bin)
+        ).all()
+        _upsert_counts(VisitLatencyHourly, [
+            dict(bucket=_as_datetime(bucket), endpoint=endpoint, bin=latency_bin, count=count)
+            for bucket, endpoint, latency_bin, count in latency
+        ], dialect, keys=LATENCY_KEYS)
+        db.session.commit()
+
+    return total
+
+
+def is_partitioned():
+    """visit_logs секционирована по месяцам (PostgreSQL, см. миграцию)."""
+    from app import db
+
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return bool(db.session.scalar(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'visit_logs' AND c.relnamespace = to_regnamespace(current_schema())"
+    )))
+
+
+def _month_start(value, offset=0):
+    month = value.year * 12 + value.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'visit_logs_p{month:%Y%m}'
+
+
+def ensure_partitions(months_ahead=2, now=None):
+    """Создание секций visit_logs на текущий и следующие месяцы."""
+    from app import db
+
+    if not is_partitioned():
+        return []
+    created = []
+    current = _month_start(now or datetime.utcnow())
+    for offset in range(months_ahead + 1):
+        month = _month_start(current, offset)
+        name = partition_name(month)
+        if db.session.scalar(text('SELECT to_regclass(:name)'), {'name': name}) is None:
+            db.session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF visit_logs "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_month_start(month, 1):%Y-%m-%d}')"
+            ))
+            created.append(name)
+    db.session.commit()
+    return created
+
+
+def _drop_old_partitions(cutoff):
+    """Удаление секций, целиком лежащих раньше cutoff (мгновенно, без DELETE)."""
+    from app import db
+
+    names = db.session.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'visit_logs'::regclass"
+    )).all()
+    dropped = []
+    for name in names:
+        try:
+            month = datetime.strptime(name, 'visit_logs_p%Y%m')
+        except ValueError:
+            continue  # секция по умолчанию и прочие
+        if _month_start(month, 1) <= cutoff:
+            db.session.execute(text(f'DROP TABLE {name}'))
+            dropped.append(name)
+    db.session.commit()
+    return dropped
+
+
+def prune_visit_logs(retention_days, hourly_retention_days=0, daily_retention_days=0,
+                     batch_size=5000, now=None):
+    """Удаление записей журнала старше retention_days и устаревших агрегатов.
+
+    Записи, еще не попавшие в агрегаты (новее watermark), не удаляются.
+    На PostgreSQL с секционированием старые месяцы удаляются целиком,
+    остальное - пачками по batch_size, чтобы не держать долгих блокировок.
+    Нулевой срок хранения - хранить без ограничения.
+    Возвращает число удаленных записей журнала (без учета удаленных секций).
+    """
+    from app import db
+    from .models import VisitLog, VisitRollupHourly, VisitRollupDaily, VisitRollupState, VisitLatencyHourly
+
+    now = now or datetime.utcnow()
+    deleted = 0
+    if retention_days:
+        cutoff = now - timedelta(days=retention_days)
+        state = db.session.get(VisitRollupState, STATE_NAME)
+        watermark = state.watermark if state is not None else None
+        cutoff = min(cutoff, watermark) if watermark is not None else None
+
+        if cutoff is not None:
+            if is_partitioned():
+                dropped = _drop_old_partitions(cutoff)
+                if dropped:
+                    logger.info(f"Dropped visit log partitions: {', '.join(dropped)}")
+            while True:
+                ids = db.select(VisitLog.id).where(VisitLog.timestamp < cutoff).limit(batch_size)
+                count = db.session.execute(
+                    db.delete(VisitLog).where(VisitLog.id.in_(ids.scalar_subquery()))
+                ).rowcount
+                db.session.commit()
+                deleted += count
+                if count < batch_size:
+                    break
+
+    for model, days in ((VisitRollupHourly, hourly_retention_days), (VisitLatencyHourly, hourly_retention_days),
+                        (VisitRollupDaily, daily_retention_days)):
+        if days:
+            db.session.execute(db.delete(model).where(model.bucket < now - timedelta(days=days)))
+    db.session.commit()
+    return deleted
+
+
+def run_visit_maintenance(config):
+    """Полный цикл обслуживания журнала: секции, агрегаты, очистка."""
+    created = ensure_partitions(config.get('VISIT_LOG_PARTITIONS_AHEAD', 2))
+    counted = rollup_visits(lag=config.get('VISIT_ROLLUP_LAG', 300))
+    deleted = prune_visit_logs(
+        config.get('VISIT_LOG_RETENTION_DAYS', 90),
+        hourly_retention_days=config.get('VISIT_ROLLUP_HOURLY_RETENTION_DAYS', 90),
+        daily_retention_days=config.get('VISIT_ROLLUP_DAILY_RETENTION_DAYS', 0)
+    )
+    return dict(partitions_created=len(created), rolled_up=counted, pruned=deleted)
+
+
+class VisitRollupJob:
+    """Периодическое обслуживание журнала в фоновом потоке процесса.
+
+    При VISIT_ROLLUP_INTERVAL = 0 поток не запускается и обслуживание
+    выполняется командой `flask core rollup-visits` (cron/systemd timer).
+    """
+
+    def __init__(self, app=None):
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.interval = 0
+        self.last_result = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.interval = app.config.get('VISIT_ROLLUP_INTERVAL', 0)
+        app.extensions['visit_rollup_job'] = self
+
+    def ensure_started(self):
+        """Ленивый запуск потока (в т.ч. заново после fork воркера)."""
+        if not self.interval:
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='visit-rollup', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        from app import db
+
+        while not self._stop.wait(self.interval):
+            try:
+                with self._app.app_context():
+                    self.last_result = run_visit_maintenance(self._app.config)
+            except Exception as e:
+                with self._app.app_context():
+                    db.session.rollback()
+                logger.error(f"Visit log maintenance failed: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+
+visit_rollup_job = VisitRollupJob()
+
+
+def visit_stats(days=7, top=10, now=None):
+    """Статистика посещений для панели администратора (только из агрегатов)."""
+    from app import db
+    from .models import VisitRollupDaily
+
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=days - 1)
+    recent = VisitRollupDaily.bucket >= since
+
+    requests_today = db.session.scalar(
+        db.select(db.func.coalesce(db.func.sum(VisitRollupDaily.count), 0)).where(VisitRollupDaily.bucket == today)
+    )
+    requests_period, users_period = db.session.execute(
+        db.select(
+            db.func.coalesce(db.func.sum(VisitRollupDaily.count), 0),
+            db.func.count(db.distinct(VisitRollupDaily.user_id))
+        ).where(recent)
+    ).one()
+    total = db.func.sum(VisitRollupDaily.count).label('total')
+    top_endpoints = db.session.execute(
+        db.select(VisitRollupDaily.endpoint, total).where(recent).group_by(
+            VisitRollupDaily.endpoint
+        ).order_by(total.desc()).limit(top)
+    ).all()
+    return dict(
+        days=days,
+        requests_today=requests_today,
+        requests_period=requests_period,
+        users_period=users_period,
+        top_endpoints=[(endpoint or '-', count) for endpoint, count in top_endpoints]
+    )
+
+
+def active_users_per_day(days=30, now=None):
+    """Число активных пользователей по дням (из суточных агрегатов); дни без визитов - 0."""
+    from app import db
+    from .models import VisitRollupDaily
+
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=days - 1)
+    counts = {
+        _as_datetime(bucket): users for bucket, users in db.session.execute(
+            db.select(VisitRollupDaily.bucket, db.func.count(db.distinct(VisitRollupDaily.user_id))).where(
+                VisitRollupDaily.bucket >= since
+            ).group_by(VisitRollupDaily.bucket)
+        )
+    }
+    return [(since + timedelta(days=i), counts.get(since + timedelta(days=i), 0)) for i in range(days)]
+
+
+def _percentile_bound(bins, share):
+    """Верхняя граница интервала гистограммы, в который попадает заданная доля запросов."""
+    total = sum(bins)
+    if not total:
+        return None
+    threshold = total * share
+    seen = 0
+    for i, count in enumerate(bins):
+        seen += count
+        if seen >= threshold:
+            return LATENCY_BOUNDS_MS[i] if i < len(LATENCY_BOUNDS_MS) else None
+    return None
+
+
+def latency_percentiles(days=7, top=20, now=None):
+    """p50/p95 времени ответа по endpoint за период (из почасовых гистограмм).
+
+    Значение - верхняя граница интервала гистограммы в мс (None - больше
+    последней границы). Сортировка по числу запросов.
+    """
+    from app import db
+    from .models import VisitLatencyHourly
+
+    since = (now or datetime.utcnow()) - timedelta(days=days)
+    histograms = {}
+    for endpoint, latency_bin, count in db.session.execute(
+        db.select(VisitLatencyHourly.endpoint, VisitLatencyHourly.bin, db.func.sum(VisitLatencyHourly.count)).where(
+            VisitLatencyHourly.bucket >= since
+        ).group_by(VisitLatencyHourly.endpoint, VisitLatencyHourly.bin)
+    ):
+        bins = histograms.setdefault(endpoint or '-', [0] * (len(LATENCY_BOUNDS_MS) + 1))
+        bins[min(latency_bin, len(LATENCY_BOUNDS_MS))] += count
+
+    result = [
+        dict(endpoint=endpoint, requests=sum(bins),
+             p50_ms=_percentile_bound(bins, 0.5), p95_ms=_percentile_bound(bins, 0.95))
+        for endpoint, bins in histograms.items()
+    ]
+    result.sort(key=lambda item: item['requests'], reverse=True)
+    return result[:top]
@@ -0,0 +1,88 @@
+"""Dashboard and feedback module tables
+
+Revision ID: 4e6d2b8a1f90
+Revises: 79033b0c588c
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6d2b8a1f90'
+down_revision = '79033b0c588c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Раньше эти таблицы создавал db.create_all() при старте приложения:
+    # в существующих базах они уже есть, поэтому создаются только недостающие
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'areas' not in existing:
+        op.create_table('areas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('code', sa.String(length=20), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('manager_id', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['manager_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+        )
+    if 'audit_records' not in existing:
+        op.create_table('audit_records',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('area_id', sa.Integer(), nullable=False),
+        sa.Column('checklist_id', sa.Integer(), nullable=False),
+        sa.Column('week_number', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('score_1s', sa.Float(), nullable=True),
+        sa.Column('score_2s', sa.Float(), nullable=True),
+        sa.Column('score_3s', sa.Float(), nullable=True),
+        sa.Column('score_4s', sa.Float(), nullable=True),
+        sa.Column('score_5s', sa.Float(), nullable=True),
+        sa.Column('overall_score', sa.Float(), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('editor_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['area_id'], ['areas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['checklist_id'], ['checklists.id'], ),
+        sa.ForeignKeyConstraint(['editor_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'audit_responses' not in existing:
+        op.create_table('audit_responses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audit_id', sa.Integer(), nullable=False),
+        sa.Column('question_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('comment', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['audit_id'], ['audit_records.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['question_id'], ['checklist_questions.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('audit_id', 'question_id', name='unique_audit_question')
+        )
+    if 'feedback_messages' not in existing:
+        op.create_table('feedback_messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('admin_comment', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('feedback_messages')
+    op.drop_table('audit_responses')
+    op.drop_table('audit_records')
+    op.drop_table('areas')
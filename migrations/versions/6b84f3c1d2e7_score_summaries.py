@@ -0,0 +1,59 @@
+"""Area score summaries and weekly audit stats
+
+Revision ID: 6b84f3c1d2e7
+Revises: d7b2e90c4a18
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b84f3c1d2e7'
+down_revision = 'd7b2e90c4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Базы, созданные через flask core init-db, уже содержат эти таблицы
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'area_score_summary' not in existing:
+        op.create_table('area_score_summary',
+        sa.Column('area_id', sa.Integer(), nullable=False),
+        sa.Column('last_audit_id', sa.Integer(), nullable=True),
+        sa.Column('last_audit_at', sa.DateTime(), nullable=True),
+        sa.Column('mean_2w', sa.Float(), nullable=True),
+        sa.Column('mean_4w', sa.Float(), nullable=True),
+        sa.Column('mean_12w', sa.Float(), nullable=True),
+        sa.Column('mean_1s', sa.Float(), nullable=True),
+        sa.Column('mean_2s', sa.Float(), nullable=True),
+        sa.Column('mean_3s', sa.Float(), nullable=True),
+        sa.Column('mean_4s', sa.Float(), nullable=True),
+        sa.Column('mean_5s', sa.Float(), nullable=True),
+        sa.Column('trend', sa.Float(), nullable=True),
+        sa.Column('audit_count', sa.Integer(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['area_id'], ['areas.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['last_audit_id'], ['audit_records.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('area_id')
+        )
+    if 'audit_week_stats' not in existing:
+        op.create_table('audit_week_stats',
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('week_number', sa.Integer(), nullable=False),
+        sa.Column('active_areas', sa.Integer(), nullable=True),
+        sa.Column('audited_areas', sa.Integer(), nullable=True),
+        sa.Column('mean_score', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('year', 'week_number')
+        )
+    # Сводки заполняются командой flask dashboard rebuild-scores
+
+
+def downgrade():
+    op.drop_table('audit_week_stats')
+    op.drop_table('area_score_summary')
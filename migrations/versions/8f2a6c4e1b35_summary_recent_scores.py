@@ -0,0 +1,30 @@
+"""Recent audit scores in area score summaries
+
+Revision ID: 8f2a6c4e1b35
+Revises: 6b84f3c1d2e7
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6c4e1b35'
+down_revision = '6b84f3c1d2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана flask core init-db уже с этой колонкой
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('area_score_summary')}
+    if 'recent_scores' not in columns:
+        with op.batch_alter_table('area_score_summary', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('recent_scores', sa.JSON(), nullable=True))
+    # До flask dashboard rebuild-scores текущий балл таких участков считается по аудитам
+
+
+def downgrade():
+    with op.batch_alter_table('area_score_summary', schema=None) as batch_op:
+        batch_op.drop_column('recent_scores')
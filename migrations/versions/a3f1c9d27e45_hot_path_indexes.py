@@ -0,0 +1,45 @@
+"""Indexes for hot audit and log lookups
+
+Revision ID: a3f1c9d27e45
+Revises: 4e6d2b8a1f90
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d27e45'
+down_revision = '4e6d2b8a1f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Уникальный индекс не создастся, если в audit_records уже есть
+    # несколько аудитов одного участка за одну неделю - их нужно удалить заранее
+    with op.batch_alter_table('audit_records', schema=None) as batch_op:
+        batch_op.create_index('ix_audit_records_area_year_week', ['area_id', 'year', 'week_number'], unique=True)
+        batch_op.create_index('ix_audit_records_area_timestamp', ['area_id', 'timestamp'], unique=False,
+                              postgresql_include=['overall_score'])
+        batch_op.create_index('ix_audit_records_year_week', ['year', 'week_number'], unique=False)
+
+    with op.batch_alter_table('visit_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_visit_logs_timestamp', ['timestamp'], unique=False)
+
+    with op.batch_alter_table('feedback_messages', schema=None) as batch_op:
+        batch_op.create_index('ix_feedback_messages_user_created', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('feedback_messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_feedback_messages_user_created')
+
+    with op.batch_alter_table('visit_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_visit_logs_timestamp')
+
+    with op.batch_alter_table('audit_records', schema=None) as batch_op:
+        batch_op.drop_index('ix_audit_records_year_week')
+        batch_op.drop_index('ix_audit_records_area_timestamp')
+        batch_op.drop_index('ix_audit_records_area_year_week')
@@ -0,0 +1,42 @@
+"""Audited area ids in weekly audit stats
+
+Revision ID: c3d9e7a5f261
+Revises: 8f2a6c4e1b35
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9e7a5f261'
+down_revision = '8f2a6c4e1b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = {column['name'] for column in sa.inspect(bind).get_columns('audit_week_stats')}
+    if 'area_ids' not in columns:
+        with op.batch_alter_table('audit_week_stats', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('area_ids', sa.JSON(), nullable=True))
+
+    # Заполнение уже посчитанных недель по таблице аудитов
+    audits = sa.table('audit_records', sa.column('area_id'), sa.column('year'), sa.column('week_number'))
+    stats = sa.table('audit_week_stats', sa.column('year'), sa.column('week_number'), sa.column('area_ids', sa.JSON()))
+    weeks = {}
+    for area_id, year, week in bind.execute(
+        sa.select(audits.c.area_id, audits.c.year, audits.c.week_number).distinct()
+    ):
+        weeks.setdefault((year, week), []).append(area_id)
+    for (year, week), area_ids in weeks.items():
+        bind.execute(stats.update().where(
+            stats.c.year == year, stats.c.week_number == week
+        ).values(area_ids=sorted(area_ids)))
+
+
+def downgrade():
+    with op.batch_alter_table('audit_week_stats', schema=None) as batch_op:
+        batch_op.drop_column('area_ids')
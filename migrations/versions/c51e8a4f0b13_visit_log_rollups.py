@@ -0,0 +1,124 @@
+"""Visit log rollups; monthly partitioning of visit_logs on PostgreSQL
+
+Revision ID: c51e8a4f0b13
+Revises: a3f1c9d27e45
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c51e8a4f0b13'
+down_revision = 'a3f1c9d27e45'
+branch_labels = None
+depends_on = None
+
+
+def _rollup_table(name):
+    op.create_table(name,
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('endpoint', sa.String(length=200), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket', 'endpoint', 'user_id', 'action')
+    )
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_visit_logs():
+    """Перенос visit_logs в таблицу, секционированную по месяцам timestamp.
+
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+    поэтому он становится (id, timestamp); последовательность id сохраняется.
+    """
+    bind = op.get_bind()
+    first, last = bind.execute(sa.text('SELECT min("timestamp"), max("timestamp") FROM visit_logs')).one()
+
+    op.execute('ALTER TABLE visit_logs RENAME TO visit_logs_legacy')
+    op.execute('ALTER INDEX ix_visit_logs_timestamp RENAME TO ix_visit_logs_legacy_timestamp')
+    op.execute("""
+        CREATE TABLE visit_logs (
+            id integer NOT NULL DEFAULT nextval('visit_logs_id_seq'),
+            user_id integer NOT NULL REFERENCES users (id),
+            "timestamp" timestamp without time zone NOT NULL DEFAULT (now() at time zone 'utc'),
+            ip_address varchar(45),
+            user_agent text,
+            endpoint varchar(200),
+            action varchar(100),
+            details text,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute('ALTER SEQUENCE visit_logs_id_seq OWNED BY visit_logs.id')
+    op.execute('CREATE INDEX ix_visit_logs_timestamp ON visit_logs ("timestamp")')
+    op.execute('CREATE TABLE visit_logs_default PARTITION OF visit_logs DEFAULT')
+
+    # Секции с первого месяца журнала до месяца после текущего
+    today = date.today()
+    month = date((first or today).year, (first or today).month, 1)
+    latest = max(last.date(), today) if last else today
+    end = _next_month(_next_month(date(latest.year, latest.month, 1)))
+    while month < end:
+        op.execute(
+            f"CREATE TABLE visit_logs_p{month:%Y%m} PARTITION OF visit_logs "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+        month = _next_month(month)
+
+    op.execute("""
+        INSERT INTO visit_logs (id, user_id, "timestamp", ip_address, user_agent, endpoint, action, details)
+        SELECT id, user_id, coalesce("timestamp", now() at time zone 'utc'), ip_address, user_agent, endpoint, action, details
+        FROM visit_logs_legacy
+    """)
+    op.execute('DROP TABLE visit_logs_legacy')
+
+
+def _unpartition_visit_logs():
+    op.execute('ALTER TABLE visit_logs RENAME TO visit_logs_partitioned')
+    op.execute('ALTER INDEX ix_visit_logs_timestamp RENAME TO ix_visit_logs_partitioned_timestamp')
+    op.execute("""
+        CREATE TABLE visit_logs (
+            id integer NOT NULL DEFAULT nextval('visit_logs_id_seq') PRIMARY KEY,
+            user_id integer NOT NULL REFERENCES users (id),
+            "timestamp" timestamp without time zone,
+            ip_address varchar(45),
+            user_agent text,
+            endpoint varchar(200),
+            action varchar(100),
+            details text
+        )
+    """)
+    op.execute('ALTER SEQUENCE visit_logs_id_seq OWNED BY visit_logs.id')
+    op.execute('INSERT INTO visit_logs SELECT * FROM visit_logs_partitioned')
+    op.execute('DROP TABLE visit_logs_partitioned')
+    op.execute('CREATE INDEX ix_visit_logs_timestamp ON visit_logs ("timestamp")')
+
+
+def upgrade():
+    _rollup_table('visit_rollup_hourly')
+    _rollup_table('visit_rollup_daily')
+    op.create_table('visit_rollup_state',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        _partition_visit_logs()
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _unpartition_visit_logs()
+
+    op.drop_table('visit_rollup_state')
+    op.drop_table('visit_rollup_daily')
+    op.drop_table('visit_rollup_hourly')
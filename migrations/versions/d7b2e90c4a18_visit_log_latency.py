@@ -0,0 +1,37 @@
+"""Request duration in visit logs; hourly latency histograms
+
+Revision ID: d7b2e90c4a18
+Revises: c51e8a4f0b13
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b2e90c4a18'
+down_revision = 'c51e8a4f0b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # На секционированной таблице (PostgreSQL) колонка добавляется во все секции
+    with op.batch_alter_table('visit_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration_ms', sa.Integer(), nullable=True))
+
+    op.create_table('visit_latency_hourly',
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('endpoint', sa.String(length=200), nullable=False),
+    sa.Column('bin', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket', 'endpoint', 'bin')
+    )
+
+
+def downgrade():
+    op.drop_table('visit_latency_hourly')
+
+    with op.batch_alter_table('visit_logs', schema=None) as batch_op:
+        batch_op.drop_column('duration_ms')
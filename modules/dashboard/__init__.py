@@ -2,4 +2,7 @@ from flask import Blueprint
 
 bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
-from . import views
\ No newline at end of file
+
+def load_views():
+    """Импорт представлений и CLI-команд (при регистрации модуля в create_app)."""
+    from . import views, commands
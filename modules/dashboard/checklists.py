@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from core.models import Checklist, ChecklistSection, ChecklistQuestion
+
+# Число "S": разделы верхнего уровня по order_num соответствуют 1S..5S
+S_COUNT = 5
+
+# Раздел в порядке обхода дерева; вопросы раздела и его подразделов -
+# непрерывный диапазон [question_start, question_end) в массивах чек-листа
+CompiledSection = namedtuple('CompiledSection', [
+    'id', 'parent_id', 'title', 'description', 'depth', 's_index', 'question_start', 'question_end'
+])
+CompiledQuestion = namedtuple('CompiledQuestion', [
+    'id', 'section_id', 'question_text', 'help_text', 'weight', 'max_score', 'is_required'
+])
+
+# Вопросы в виде параллельных массивов, упорядоченных по question_id (для расчета баллов)
+ChecklistArrays = namedtuple('ChecklistArrays', ['question_ids', 's_index', 'weights', 'max_scores', 'required'])
+
+CompiledChecklist = namedtuple('CompiledChecklist', [
+    'checklist_id', 'version', 'sections', 'questions', 'question_ids', 'weights', 'max_scores',
+    'required', 's_index', 'arrays'
+])
+
+
+def _version_key(version, updated_at, created_at):
+    return (version, updated_at or created_at)
+
+
+def compile_checklist(checklist_id, version=None):
+    """Сборка неизменяемого представления чек-листа одним запросом.
+
+    Массивы question_ids/weights/max_scores/required/s_index идут в порядке
+    отображения (обход разделов в глубину по order_num).
+    """
+    import numpy as np  # при первой сборке, а не при старте воркера
+    rows = db.session.execute(
+        db.select(
+            ChecklistSection.id, ChecklistSection.parent_section_id, ChecklistSection.order_num,
+            ChecklistSection.title, ChecklistSection.description,
+            ChecklistQuestion.id, ChecklistQuestion.order_num, ChecklistQuestion.question_text,
+            ChecklistQuestion.help_text, ChecklistQuestion.weight, ChecklistQuestion.max_score,
+            ChecklistQuestion.is_required
+        ).outerjoin(
+            ChecklistQuestion, ChecklistQuestion.section_id == ChecklistSection.id
+        ).where(ChecklistSection.checklist_id == checklist_id)
+    ).all()
+
+    sections = {}
+    children = {}
+    questions = {}
+    for (section_id, parent_id, section_order, title, description,
+         question_id, question_order, text, help_text, weight, max_score, is_required) in rows:
+        if section_id not in sections:
+            sections[section_id] = (parent_id, section_order, title, description)
+            children.setdefault(parent_id, []).append((section_order, section_id))
+            questions[section_id] = []
+        if question_id is not None:
+            questions[section_id].append((question_order, question_id, CompiledQuestion(
+                question_id, section_id, text, help_text, weight or 0, max_score or 0, bool(is_required)
+            )))
+
+    compiled_sections = []
+    ordered_questions = []
+    question_s_index = []
+
+    def walk(parent_id, depth, s_index, seen):
+        for i, (_, section_id) in enumerate(sorted(children.get(parent_id, []))):
+            if section_id in seen:
+                continue
+            seen.add(section_id)
+            own_s = i if depth == 0 and i < S_COUNT else s_index
+            parent, _, title, description = sections[section_id]
+            position = len(compiled_sections)
+            compiled_sections.append(None)
+            start = len(ordered_questions)
+            for _, _, question in sorted(questions[section_id]):
+                ordered_questions.append(question)
+                question_s_index.append(-1 if own_s is None else own_s)
+            walk(section_id, depth + 1, own_s, seen)
+            compiled_sections[position] = CompiledSection(
+                section_id, parent, title, description, depth,
+                own_s, start, len(ordered_questions)
+            )
+
+    walk(None, 0, None, set())
+
+    question_ids = np.array([q.id for q in ordered_questions], dtype=np.int64)
+    weights = np.array([q.weight for q in ordered_questions], dtype=np.float64)
+    max_scores = np.array([q.max_score for q in ordered_questions], dtype=np.float64)
+    required = np.array([q.is_required for q in ordered_questions], dtype=bool)
+    s_index = np.array(question_s_index, dtype=np.int64)
+
+    # Для расчета баллов - только вопросы, относящиеся к одному из S, по возрастанию id
+    scored = np.flatnonzero(s_index >= 0)
+    order = scored[np.argsort(question_ids[scored], kind='stable')]
+    arrays = ChecklistArrays(question_ids[order], s_index[order], weights[order], max_scores[order], required[order])
+
+    for array in (question_ids, weights, max_scores, required, s_index, *arrays):
+        array.flags.writeable = False
+
+    return CompiledChecklist(
+        checklist_id, version, tuple(compiled_sections), tuple(ordered_questions),
+        question_ids, weights, max_scores, required, s_index, arrays
+    )
+
+
+class ChecklistCache:
+    """Кэш скомпилированных чек-листов по (checklist_id, версия).
+
+    Версия - номер версии и Checklist.updated_at; любое изменение разделов
+    или вопросов обновляет updated_at (см. _touch_checklists), поэтому
+    устаревшая запись просто перестает находиться по ключу.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, checklist_id):
+        """Скомпилированный чек-лист или None, если чек-листа нет."""
+        row = db.session.execute(
+            db.select(Checklist.version, Checklist.updated_at, Checklist.created_at).where(Checklist.id == checklist_id)
+        ).first()
+        if row is None:
+            return None
+
+        key = (checklist_id, _version_key(*row))
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+
+        compiled = compile_checklist(checklist_id, version=key[1])
+        with self._lock:
+            # Старые версии этого чек-листа больше не нужны
+            for stale in [k for k in self._entries if k[0] == checklist_id]:
+                del self._entries[stale]
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+checklist_cache = ChecklistCache()
+
+
+def get_compiled_checklist(checklist_id):
+    return checklist_cache.get(checklist_id)
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_checklists(session, flush_context, instances):
+    """Обновление Checklist.updated_at при изменении его разделов или вопросов."""
+    checklist_ids = set()
+    with session.no_autoflush:
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, ChecklistSection):
+                checklist_ids.add(obj.checklist_id)
+            elif isinstance(obj, ChecklistQuestion):
+                section = obj.section or (session.get(ChecklistSection, obj.section_id) if obj.section_id else None)
+                if section is not None:
+                    checklist_ids.add(section.checklist_id)
+
+        now = datetime.utcnow()
+        for checklist_id in checklist_ids - {None}:
+            checklist = session.get(Checklist, checklist_id)
+            if checklist is not None:
+                checklist.updated_at = now
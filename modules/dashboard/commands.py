@@ -0,0 +1,57 @@
+import json
+import click
+import time
+from flask import current_app
+from app import db
+from core.models import User
+from . import bp
+from .services import rebuild_area_summaries, refresh_area_summary, refresh_week_stats
+
+
+@bp.cli.command('rebuild-scores')
+@click.option('--batch-size', default=1000, show_default=True, help='Размер пачки при чтении аудитов')
+def rebuild_scores(batch_size):
+    """Полный пересчет сводок баллов участков (area_score_summary)."""
+    count = rebuild_area_summaries(batch_size=batch_size)
+    weeks = refresh_week_stats()
+    db.session.commit()
+    click.echo(f'Rebuilt score summaries for {count} areas and {weeks} weekly stats')
+
+
+@bp.cli.command('import-audits')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--editor', required=True, help='Логин пользователя, от имени которого создаются аудиты')
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']), default=None,
+              help='Формат файла (по умолчанию - по расширению)')
+@click.option('--chunk-size', type=int, default=None, help='Размер пачки вставки')
+def import_audits(path, editor, file_format, chunk_size):
+    """Пакетный импорт аудитов из файла JSON Lines или CSV."""
+    from .importer import AuditImporter, parse_records
+    user = User.query.filter_by(username=editor).first()
+    if user is None:
+        raise click.ClickException(f'User {editor} not found')
+    
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    chunk_size = chunk_size or current_app.config['AUDIT_IMPORT_CHUNK_SIZE']
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = AuditImporter(editor_id=user.id, chunk_size=chunk_size).run(parse_records(stream, file_format))
+    
+    click.echo(f"Imported {report['inserted']} of {report['total']} audits, "
+               f"{report['duplicates']} duplicates, {len(report['errors'])} errors")
+    for error in report['errors']:
+        click.echo(json.dumps(error, ensure_ascii=False))
+
+
+@bp.cli.command('recompute-scores')
+@click.argument('checklist_id', type=int)
+@click.option('--batch-size', default=20000, show_default=True, help='Аудитов в одной пачке расчета')
+def recompute_scores(checklist_id, batch_size):
+    """Пересчет баллов аудитов по ответам после изменения весов чек-листа."""
+    from .scoring import recompute_checklist_scores
+    started = time.perf_counter()
+    updated, areas = recompute_checklist_scores(checklist_id, batch_size=batch_size)
+    for area_id in areas:
+        refresh_area_summary(area_id)
+    refresh_week_stats()  # средние баллы недель
+    db.session.commit()
+    click.echo(f'Recomputed {updated} audits in {len(areas)} areas ({time.perf_counter() - started:.1f} s)')
@@ -0,0 +1,101 @@
+import csv
+import importlib.util
+import io
+import tempfile
+from app import db
+from .models import Area, AuditRecord, AuditResponse
+
+# XLSX-выгрузка доступна только при установленном openpyxl; сам пакет импортируется
+# при первой выгрузке, а не при старте воркера (импорт занимает сотни миллисекунд)
+XLSX_AVAILABLE = importlib.util.find_spec('openpyxl') is not None
+
+AUDIT_COLUMNS = [
+    ('audit_id', AuditRecord.id),
+    ('area_code', Area.code),
+    ('area_name', Area.name),
+    ('year', AuditRecord.year),
+    ('week', AuditRecord.week_number),
+    ('score_1s', AuditRecord.score_1s),
+    ('score_2s', AuditRecord.score_2s),
+    ('score_3s', AuditRecord.score_3s),
+    ('score_4s', AuditRecord.score_4s),
+    ('score_5s', AuditRecord.score_5s),
+    ('overall_score', AuditRecord.overall_score),
+    ('editor_id', AuditRecord.editor_id),
+    ('timestamp', AuditRecord.timestamp),
+    ('notes', AuditRecord.notes),
+]
+
+RESPONSE_COLUMNS = [
+    ('question_id', AuditResponse.question_id),
+    ('response_score', AuditResponse.score),
+    ('response_comment', AuditResponse.comment),
+]
+
+# Размер пачки при чтении из БД и при отправке клиенту
+FETCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def export_query(date_from=None, date_to=None, area_ids=None, with_responses=False):
+    """Выборка аудитов с участками (и ответами на вопросы) для выгрузки."""
+    columns = AUDIT_COLUMNS + (RESPONSE_COLUMNS if with_responses else [])
+    query = db.select(*[column.label(name) for name, column in columns]).join(
+        Area, Area.id == AuditRecord.area_id
+    )
+    if with_responses:
+        query = query.outerjoin(AuditResponse, AuditResponse.audit_id == AuditRecord.id)
+    if date_from is not None:
+        query = query.where(AuditRecord.timestamp >= date_from)
+    if date_to is not None:
+        query = query.where(AuditRecord.timestamp < date_to)
+    if area_ids:
+        query = query.where(AuditRecord.area_id.in_(area_ids))
+
+    order = [AuditRecord.timestamp, AuditRecord.id]
+    if with_responses:
+        order.append(AuditResponse.question_id)
+    return query.order_by(*order), [name for name, _ in columns]
+
+
+def iter_rows(query):
+    """Строки выборки через серверный курсор, пачками по FETCH_SIZE."""
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=FETCH_SIZE))
+    for partition in result.partitions():
+        yield from partition
+
+
+def stream_csv(query, header):
+    """CSV по частям: в памяти не больше одной пачки текста."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')  # BOM, чтобы Excel распознал UTF-8
+    writer.writerow(header)
+
+    for row in iter_rows(query):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def stream_xlsx(query, header):
+    """XLSX: книга в режиме write_only пишется во временный файл и отдается частями."""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('audits')
+    sheet.append(header)
+    for row in iter_rows(query):
+        sheet.append(list(row))
+
+    with tempfile.TemporaryFile() as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,314 @@
+import csv
+import json
+from datetime import date, datetime
+from app import db
+from core.models import ChecklistAssignment
+from sqlalchemy.exc import SQLAlchemyError
+from .models import Area, AuditRecord, AuditResponse
+from .scoring import SCORE_FIELDS, checklist_arrays, score_response_sets
+from .services import refresh_area_summary, refresh_week_stats
+
+
+class ImportRowError(ValueError):
+    """Ошибка в отдельной строке импорта (строка пропускается, импорт продолжается)."""
+
+
+def parse_records(stream, file_format):
+    """Записи из JSON Lines или CSV: пары (номер строки, dict).
+
+    В CSV ответы на вопросы передаются колонкой responses с JSON-списком.
+    Строки с ошибкой разбора возвращаются как (номер строки, ImportRowError).
+    """
+    if file_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(stream), start=2):
+            record = {key: value for key, value in row.items() if key and value not in (None, '')}
+            if 'responses' in record:
+                try:
+                    record['responses'] = json.loads(record['responses'])
+                except ValueError as e:
+                    yield row_number, ImportRowError(f'invalid responses JSON: {e}')
+                    continue
+            yield row_number, record
+        return
+
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, ImportRowError(f'invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield row_number, ImportRowError('record must be a JSON object')
+            continue
+        yield row_number, record
+
+
+def _int(record, key, required=True):
+    value = record.get(key)
+    if value is None:
+        if required:
+            raise ImportRowError(f'{key} is required')
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f'{key} must be an integer')
+
+
+def _score(record, key):
+    try:
+        value = float(record.get(key) or 0)
+    except (TypeError, ValueError):
+        raise ImportRowError(f'{key} must be a number')
+    if not 0 <= value <= 2:
+        raise ImportRowError(f'{key} must be between 0 and 2')
+    return value
+
+
+def _timestamp(record, year, week):
+    """Время аудита: колонка timestamp (ISO 8601) или понедельник ISO-недели аудита.
+
+    Без явного времени исторический аудит получил бы время импорта и считался
+    бы последним аудитом участка и попадал бы в текущий балл.
+    """
+    value = record.get('timestamp')
+    if value is not None:
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ImportRowError('timestamp must be an ISO 8601 date or date-time')
+    try:
+        return datetime.combine(date.fromisocalendar(year, week, 1), datetime.min.time())
+    except ValueError:
+        raise ImportRowError(f'week {week} does not exist in ISO year {year}')
+
+
+def _responses(record):
+    responses = {}
+    for item in record.get('responses') or []:
+        if not isinstance(item, dict):
+            raise ImportRowError('responses must be a list of objects')
+        question_id = _int(item, 'question_id')
+        if question_id in responses:
+            raise ImportRowError(f'duplicate answer for question {question_id}')
+        responses[question_id] = (_int(item, 'score'), item.get('comment'))
+    return responses
+
+
+def _inserted_key(audit):
+    return audit['area_id'], (audit['year'], audit['week_number'])
+
+
+class AuditImporter:
+    """Пакетный импорт аудитов с проверкой дубликатов одним запросом."""
+
+    def __init__(self, editor_id, chunk_size=500):
+        self.editor_id = editor_id
+        self.chunk_size = chunk_size
+        self.errors = []
+        self.inserted = 0
+        self.duplicates = 0
+        self._checklist_arrays = {}
+        self._checklist_limits = {}
+
+    def _error(self, row_number, message):
+        self.errors.append({'row': row_number, 'error': str(message)})
+
+    def run(self, records):
+        """Импорт записей [(номер строки, dict)]; возвращает отчет по строкам."""
+        parsed = []
+        total = 0
+        for row_number, record in records:
+            total += 1
+            if isinstance(record, Exception):
+                self._error(row_number, record)
+                continue
+            parsed.append((row_number, record))
+
+        rows = self._normalize(parsed)
+        rows = self._drop_duplicates(rows)
+
+        affected_areas = set()
+        affected_weeks = set()
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            inserted = self._insert_chunk(chunk)
+            affected_areas.update(area_id for area_id, _ in inserted)
+            affected_weeks.update(week for _, week in inserted)
+
+        for area_id in affected_areas:
+            refresh_area_summary(area_id)
+        refresh_week_stats(affected_weeks)
+        db.session.commit()
+
+        return {
+            'total': total,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+    def _normalize(self, parsed):
+        """Проверка полей, разрешение кодов участков и чек-листов (по одному запросу на все строки)."""
+        codes = {str(record['area_code']) for _, record in parsed if 'area_code' in record and 'area_id' not in record}
+        area_by_code = dict(db.session.query(Area.code, Area.id).filter(Area.code.in_(codes))) if codes else {}
+        known_areas = {area_id for (area_id,) in db.session.query(Area.id)}
+        assignments = dict(db.session.query(ChecklistAssignment.entity_id, ChecklistAssignment.checklist_id).filter(
+            ChecklistAssignment.entity_type == 'area'
+        ))
+
+        rows = []
+        for row_number, record in parsed:
+            try:
+                if 'area_id' in record:
+                    area_id = _int(record, 'area_id')
+                elif 'area_code' in record:
+                    area_id = area_by_code.get(str(record['area_code']))
+                    if area_id is None:
+                        raise ImportRowError(f"unknown area_code {record['area_code']}")
+                else:
+                    raise ImportRowError('area_id or area_code is required')
+                if area_id not in known_areas:
+                    raise ImportRowError(f'unknown area_id {area_id}')
+
+                week = _int(record, 'week_number')
+                year = _int(record, 'year')
+                if not 1 <= week <= 53:
+                    raise ImportRowError('week_number must be between 1 and 53')
+                timestamp = _timestamp(record, year, week)
+
+                checklist_id = _int(record, 'checklist_id', required=False) or assignments.get(area_id)
+                if checklist_id is None:
+                    raise ImportRowError('checklist_id is required (no checklist assigned to the area)')
+
+                responses = _responses(record)
+                if responses:
+                    self._check_questions(checklist_id, responses)
+                    scores = {}  # считаются ниже одним проходом по всем строкам чек-листа
+                else:
+                    scores = {field: _score(record, field) for field in SCORE_FIELDS}
+                    scores['overall_score'] = round(sum(scores.values()) / len(SCORE_FIELDS), 2)
+            except ImportRowError as e:
+                self._error(row_number, e)
+                continue
+
+            audit = dict(
+                area_id=area_id,
+                checklist_id=checklist_id,
+                week_number=week,
+                year=year,
+                timestamp=timestamp,
+                notes=record.get('notes'),
+                editor_id=self.editor_id,
+                **scores
+            )
+            rows.append((row_number, audit, responses))
+
+        self._score_responses(rows)
+        return rows
+
+    def _arrays(self, checklist_id):
+        if checklist_id not in self._checklist_arrays:
+            self._checklist_arrays[checklist_id] = checklist_arrays(checklist_id)
+        return self._checklist_arrays[checklist_id]
+
+    def _max_scores(self, checklist_id):
+        """{question_id: максимальный балл} вопросов чек-листа (None, если чек-листа нет)."""
+        if checklist_id not in self._checklist_limits:
+            arrays = self._arrays(checklist_id)
+            self._checklist_limits[checklist_id] = None if arrays is None else dict(
+                zip(arrays.question_ids.tolist(), arrays.max_scores.tolist())
+            )
+        return self._checklist_limits[checklist_id]
+
+    def _check_questions(self, checklist_id, responses):
+        limits = self._max_scores(checklist_id)
+        if limits is None:
+            raise ImportRowError(f'unknown checklist_id {checklist_id}')
+        unknown = set(responses) - set(limits)
+        if unknown:
+            raise ImportRowError(f'questions not in checklist {checklist_id}: {sorted(unknown)}')
+        # Баллы вне шкалы вопроса исказили бы пересчет (new_audit ограничивает их так же)
+        for question_id, (score, _) in responses.items():
+            if not 0 <= score <= limits[question_id]:
+                raise ImportRowError(
+                    f'score for question {question_id} must be between 0 and {limits[question_id]:g}'
+                )
+
+    def _score_responses(self, rows):
+        """Баллы по ответам: один векторный расчет на каждый чек-лист."""
+        by_checklist = {}
+        for _, audit, responses in rows:
+            if responses:
+                by_checklist.setdefault(audit['checklist_id'], []).append((audit, responses))
+
+        for checklist_id, items in by_checklist.items():
+            scores = score_response_sets(
+                self._arrays(checklist_id),
+                [{qid: score for qid, (score, _) in responses.items()} for _, responses in items]
+            )
+            for (audit, _), values in zip(items, scores):
+                audit.update(values)
+
+    def _drop_duplicates(self, rows):
+        """Дубликаты в БД - одним запросом по набору участков и лет; дубликаты внутри файла - в памяти."""
+        if not rows:
+            return rows
+        area_ids = {audit['area_id'] for _, audit, _ in rows}
+        years = {audit['year'] for _, audit, _ in rows}
+        existing = set(db.session.query(AuditRecord.area_id, AuditRecord.year, AuditRecord.week_number).filter(
+            AuditRecord.area_id.in_(area_ids),
+            AuditRecord.year.in_(years)
+        ))
+
+        unique = []
+        for row_number, audit, responses in rows:
+            key = (audit['area_id'], audit['year'], audit['week_number'])
+            if key in existing:
+                self.duplicates += 1
+                self._error(row_number, f'audit for area {key[0]} week {key[2]}/{key[1]} already exists')
+                continue
+            existing.add(key)
+            unique.append((row_number, audit, responses))
+        return unique
+
+    def _insert_chunk(self, chunk):
+        """Вставка пачки через executemany; при ошибке пачка повторяется построчно.
+
+        Возвращает множество (участок, (год, неделя)) вставленных аудитов.
+        """
+        try:
+            with db.session.begin_nested():
+                self._insert(chunk)
+            self.inserted += len(chunk)
+            return {_inserted_key(audit) for _, audit, _ in chunk}
+        except SQLAlchemyError:
+            pass
+
+        affected = set()
+        for row in chunk:
+            try:
+                with db.session.begin_nested():
+                    self._insert([row])
+                self.inserted += 1
+                affected.add(_inserted_key(row[1]))
+            except SQLAlchemyError as e:
+                self._error(row[0], getattr(e, 'orig', e))
+        return affected
+
+    def _insert(self, chunk):
+        result = db.session.execute(
+            db.insert(AuditRecord).returning(AuditRecord.id, sort_by_parameter_order=True),
+            [audit for _, audit, _ in chunk]
+        )
+        response_rows = []
+        for (audit_id,), (_, _, responses) in zip(result, chunk):
+            for question_id, (score, comment) in responses.items():
+                response_rows.append(dict(audit_id=audit_id, question_id=question_id, score=score, comment=comment))
+        if response_rows:
+            db.session.execute(db.insert(AuditResponse), response_rows)
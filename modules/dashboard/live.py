@@ -0,0 +1,150 @@
+import json
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.util import identity_key
+from app import db
+from core.fragment_cache import fragment_cache
+from core.pubsub import event_bus
+from .models import Area, AuditRecord, AreaScoreSummary, recent_score_mean
+
+# Канал шины событий с обновлениями баллов участков
+SCORES_CHANNEL = 'scores'
+
+LAST_AUDIT_COLUMNS = (
+    AuditRecord.id, AuditRecord.week_number, AuditRecord.year, AuditRecord.overall_score,
+    AuditRecord.score_1s, AuditRecord.score_2s, AuditRecord.score_3s, AuditRecord.score_4s, AuditRecord.score_5s
+)
+
+
+def _payload(summary_values, audit_row):
+    """Событие для экранов: сводка участка и баллы последнего аудита (для радара).
+
+    current_score - текущий балл карточки (как Area.current_score) на момент события.
+    """
+    (area_id, version, last_audit_at, mean_2w, mean_4w, mean_12w, trend, recent_scores) = summary_values
+    data = dict(
+        area_id=area_id,
+        version=version,
+        current_score=recent_score_mean(recent_scores),
+        mean_2w=mean_2w, mean_4w=mean_4w, mean_12w=mean_12w,
+        trend=trend,
+        last_audit=None
+    )
+    if audit_row is not None:
+        audit_id, week, year, overall, *scores = audit_row
+        data['last_audit'] = dict(
+            id=audit_id, week=week, year=year,
+            at=last_audit_at.isoformat() if last_audit_at else None,
+            overall=overall, scores=scores
+        )
+    return data
+
+
+def _summary_values(summary):
+    return (summary.area_id, summary.version, summary.last_audit_at,
+            summary.mean_2w, summary.mean_4w, summary.mean_12w, summary.trend, summary.recent_scores)
+
+
+def score_snapshot(area_ids=None):
+    """Текущее состояние участков одним запросом (первое событие потока)."""
+    query = db.select(
+        AreaScoreSummary.area_id, AreaScoreSummary.version, AreaScoreSummary.last_audit_at,
+        AreaScoreSummary.mean_2w, AreaScoreSummary.mean_4w, AreaScoreSummary.mean_12w, AreaScoreSummary.trend,
+        AreaScoreSummary.recent_scores, *LAST_AUDIT_COLUMNS
+    ).outerjoin(AuditRecord, AuditRecord.id == AreaScoreSummary.last_audit_id)
+    if area_ids is not None:
+        query = query.where(AreaScoreSummary.area_id.in_(area_ids))
+
+    snapshot = []
+    for row in db.session.execute(query):
+        audit_row = row[8:] if row[8] is not None else None
+        snapshot.append(_payload(row[:8], audit_row))
+    return snapshot
+
+
+def format_event(data, event_name='score', event_id=None):
+    """Сообщение в формате text/event-stream."""
+    lines = [f'event: {event_name}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def iter_events(subscription, area_ids, snapshot, heartbeat=15, max_duration=300, retry=3000):
+    """Поток SSE: текущее состояние, затем обновления подписанных участков.
+
+    Поток закрывается через max_duration секунд - браузер переподключается
+    сам (EventSource) и получает свежий снимок, а воркер освобождается.
+    """
+    wanted = set(area_ids) if area_ids is not None else None
+    deadline = time.monotonic() + max_duration
+    try:
+        yield f'retry: {retry}\n\n'
+        for data in snapshot:
+            yield format_event(data, event_id=f"{data['area_id']}-{data['version']}")
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = subscription.get(timeout=min(heartbeat, remaining))
+            if message is None:
+                yield ': ping\n\n'  # не дает прокси закрыть простаивающее соединение
+                continue
+            for data in json.loads(message):
+                if wanted is None or data['area_id'] in wanted:
+                    yield format_event(data, event_id=f"{data['area_id']}-{data['version']}")
+    finally:
+        subscription.close()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_score_updates(session, flush_context):
+    """Запоминание пересчитанных сводок и измененных участков до commit."""
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Area) and obj.id is not None:
+            session.info.setdefault('changed_area_ids', set()).add(obj.id)
+
+    summaries = [obj for obj in (*session.new, *session.dirty) if isinstance(obj, AreaScoreSummary)]
+    if not summaries:
+        return
+
+    audit_ids = {summary.last_audit_id for summary in summaries if summary.last_audit_id is not None}
+    audits = {}
+    # Аудиты, уже загруженные в сессию (обычно только что записанный), - без запроса
+    for audit_id in audit_ids:
+        audit = session.identity_map.get(identity_key(AuditRecord, audit_id))
+        if audit is not None and not attributes.instance_state(audit).expired_attributes:
+            audits[audit_id] = tuple(getattr(audit, column.key) for column in LAST_AUDIT_COLUMNS)
+    missing = audit_ids - set(audits)
+    if missing:
+        with session.no_autoflush:
+            audits.update((row[0], tuple(row)) for row in session.execute(
+                db.select(*LAST_AUDIT_COLUMNS).where(AuditRecord.id.in_(missing))
+            ))
+
+    updates = session.info.setdefault('score_updates', {})
+    for summary in summaries:
+        updates[summary.area_id] = _payload(_summary_values(summary), audits.get(summary.last_audit_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_score_updates(session):
+    # Одно сообщение на транзакцию: импорт сотни аудитов - одна рассылка
+    changed = session.info.pop('changed_area_ids', None)
+    if changed:
+        # Название, описание или активность участка: карточки в ключе содержат эти поля
+        fragment_cache.invalidate_area(*changed)
+    updates = session.info.pop('score_updates', None)
+    if updates:
+        # Кэш фрагментов процесса: карточки и история участков (другие воркеры - по версии в ключе)
+        fragment_cache.invalidate_area(*updates)
+        event_bus.publish(SCORES_CHANNEL, json.dumps(list(updates.values()), default=str))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_score_updates(session):
+    session.info.pop('score_updates', None)
+    session.info.pop('changed_area_ids', None)
@@ -1,6 +1,20 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import db
 
+# Окно текущего балла участка, дней (Area.current_score)
+CURRENT_SCORE_DAYS = 14
+
+
+def recent_score_mean(recent_scores, now=None):
+    """Средний общий балл записей [время ISO, балл] за CURRENT_SCORE_DAYS дней до now.
+
+    Считается так же, как Area.current_score по таблице аудитов.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=CURRENT_SCORE_DAYS)
+    scores = [score or 0 for at, score in recent_scores or () if datetime.fromisoformat(at) >= cutoff]
+    return round(sum(scores) / len(scores), 2) if scores else 0
+
+
 class Area(db.Model):
     """Производственный участок (зона внедрения 5С)."""
     __tablename__ = 'areas'
@@ -22,14 +36,18 @@ class Area(db.Model):
     
     @property
     def last_audit(self):
-        """Последний аудит участка."""
-        return self.audits.order_by(AuditRecord.timestamp.desc()).first()
+        """Последний аудит участка (за самую позднюю неделю)."""
+        if '_prefetched_last_audit' in self.__dict__:
+            return self._prefetched_last_audit
+        return self.audits.order_by(AuditRecord.year.desc(), AuditRecord.week_number.desc(), AuditRecord.id.desc()).first()
     
     @property
     def current_score(self):
         """Текущий общий балл (средний за последние 2 недели)."""
-        from datetime import timedelta
-        two_weeks_ago = datetime.utcnow() - timedelta(days=14)
+        if '_prefetched_current_score' in self.__dict__:
+            return self._prefetched_current_score
+        
+        two_weeks_ago = datetime.utcnow() - timedelta(days=CURRENT_SCORE_DAYS)
         recent_audits = self.audits.filter(AuditRecord.timestamp >= two_weeks_ago).all()
         
         if not recent_audits:
@@ -37,6 +55,19 @@ class Area(db.Model):
         
         total = sum(audit.overall_score for audit in recent_audits)
         return round(total / len(recent_audits), 2)
+    
+    @property
+    def score_version(self):
+        """Версия баллов участка (для ключей кэша фрагментов)."""
+        if '_prefetched_score_version' in self.__dict__:
+            return self._prefetched_score_version
+        summary = self.score_summary
+        return summary.version if summary is not None else 0
+
+    @property
+    def card_fields(self):
+        """Поля участка, выводимые в карточке (для ключа кэша фрагментов)."""
+        return (self.name, self.description, self.is_active)
 
 class AuditRecord(db.Model):
     """Запись аудита 5С."""
@@ -67,6 +98,16 @@ class AuditRecord(db.Model):
     checklist = db.relationship('Checklist')
     editor = db.relationship('User', backref='conducted_audits')
     
+    __table_args__ = (
+        # Одна запись на участок и неделю; проверка дубликата в new_audit - поиск по индексу
+        db.Index('ix_audit_records_area_year_week', 'area_id', 'year', 'week_number', unique=True),
+        # История участка и средний балл за период (на PostgreSQL индекс покрывающий)
+        db.Index('ix_audit_records_area_timestamp', 'area_id', 'timestamp',
+                 postgresql_include=['overall_score']),
+        # Количество аудитов за неделю на дашборде
+        db.Index('ix_audit_records_year_week', 'year', 'week_number'),
+    )
+    
     def __repr__(self):
         return f'<AuditRecord {self.area.code} W{self.week_number} Score: {self.overall_score}>'
 
@@ -88,4 +129,62 @@ class AuditResponse(db.Model):
     )
     
     def __repr__(self):
-        return f'<AuditResponse Q{self.question_id}: {self.score}>'
\ No newline at end of file
+        return f'<AuditResponse Q{self.question_id}: {self.score}>'
+class AreaScoreSummary(db.Model):
+    """Сводка баллов участка (обновляется при записи аудита).
+
+    Окна 2/4/12 недель отсчитываются от ISO-недели самого свежего аудита,
+    поэтому сводка не устаревает между записями.
+    """
+    __tablename__ = 'area_score_summary'
+    
+    area_id = db.Column(db.Integer, db.ForeignKey('areas.id', ondelete='CASCADE'), primary_key=True)
+    last_audit_id = db.Column(db.Integer, db.ForeignKey('audit_records.id', ondelete='SET NULL'))
+    last_audit_at = db.Column(db.DateTime)
+    
+    # Скользящие средние общего балла
+    mean_2w = db.Column(db.Float, default=0)
+    mean_4w = db.Column(db.Float, default=0)
+    mean_12w = db.Column(db.Float, default=0)
+    
+    # Средние по каждому "S" (окно 4 недели)
+    mean_1s = db.Column(db.Float, default=0)
+    mean_2s = db.Column(db.Float, default=0)
+    mean_3s = db.Column(db.Float, default=0)
+    mean_4s = db.Column(db.Float, default=0)
+    mean_5s = db.Column(db.Float, default=0)
+    
+    trend = db.Column(db.Float, default=0)            # Разница с предыдущим аудитом
+    audit_count = db.Column(db.Integer, default=0)    # Аудитов в окне 12 недель
+    # [время, общий балл] аудитов за CURRENT_SCORE_DAYS дней до пересчета: текущий балл
+    # считается при чтении по тому же окну, что и Area.current_score
+    recent_scores = db.Column(db.JSON)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Растет при каждом пересчете
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Связи
+    area = db.relationship('Area', backref=db.backref('score_summary', uselist=False, cascade='all, delete-orphan'))
+    last_audit = db.relationship('AuditRecord')
+    
+    def current_score(self, now=None):
+        """Текущий балл участка на момент now (см. recent_score_mean)."""
+        return recent_score_mean(self.recent_scores, now)
+
+    def __repr__(self):
+        return f'<AreaScoreSummary area={self.area_id} v{self.version} 2w={self.mean_2w}>'
+
+
+class AuditWeekStats(db.Model):
+    """Выполнение аудитов за неделю по всем участкам (обновляется при записи аудита)."""
+    __tablename__ = 'audit_week_stats'
+    
+    year = db.Column(db.Integer, primary_key=True)
+    week_number = db.Column(db.Integer, primary_key=True)
+    active_areas = db.Column(db.Integer, default=0)    # Активных участков на момент пересчета
+    audited_areas = db.Column(db.Integer, default=0)   # Участков с аудитом за неделю
+    area_ids = db.Column(db.JSON)                      # id этих участков (выполнение по участкам)
+    mean_score = db.Column(db.Float, default=0)        # Средний общий балл аудитов недели
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AuditWeekStats {self.year}-W{self.week_number}: {self.audited_areas}/{self.active_areas}>'
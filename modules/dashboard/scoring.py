@@ -0,0 +1,144 @@
+import numpy as np
+from app import db
+from .checklists import S_COUNT, get_compiled_checklist
+
+# Шкала баллов аудита (как в AuditForm: 0-2)
+SCORE_SCALE = 2.0
+SCORE_FIELDS = ('score_1s', 'score_2s', 'score_3s', 'score_4s', 'score_5s')
+
+def checklist_arrays(checklist_id):
+    """Массивы вопросов чек-листа для векторного расчета (из кэша скомпилированных чек-листов).
+
+    Возвращает None, если чек-листа нет.
+    """
+    compiled = get_compiled_checklist(checklist_id)
+    return compiled.arrays if compiled is not None else None
+
+
+def score_matrix(arrays, answers):
+    """Баллы для матрицы ответов (аудиты x вопросы, NaN - нет ответа) за один проход.
+
+    Балл S = сумма(вес * ответ) / сумма(вес * макс. балл) по шкале 0-2.
+    Неотвеченные обязательные вопросы считаются нулем, необязательные
+    не учитываются. Возвращает массив (аудиты x 6): 1S..5S и общий балл
+    (среднее пяти S, как в new_audit).
+    """
+    answered = ~np.isnan(answers)
+    counted = answered | arrays.required
+    earned = np.where(answered, np.minimum(np.nan_to_num(answers), arrays.max_scores), 0.0) * arrays.weights
+    possible = counted * (arrays.weights * arrays.max_scores)
+
+    # Матрица принадлежности вопросов к S: суммирование по разделам умножением матриц
+    membership = np.zeros((len(arrays.question_ids), S_COUNT))
+    membership[np.arange(len(arrays.question_ids)), arrays.s_index] = 1.0
+    earned_s = earned @ membership
+    possible_s = possible @ membership
+
+    scores = np.divide(earned_s * SCORE_SCALE, possible_s, out=np.zeros_like(earned_s), where=possible_s > 0)
+    result = np.empty((answers.shape[0], S_COUNT + 1))
+    result[:, :S_COUNT] = np.round(scores, 2)
+    result[:, S_COUNT] = np.round(result[:, :S_COUNT].mean(axis=1), 2)
+    return result
+
+
+def _score_dicts(result):
+    return [
+        dict(zip(SCORE_FIELDS + ('overall_score',), row))
+        for row in result.tolist()
+    ]
+
+
+def _question_columns(arrays, question_ids):
+    """Столбцы вопросов в массивах чек-листа и маска известных вопросов.
+
+    Вопросы вне расчета (разделы после пятого S, удаленные из чек-листа)
+    в question_ids не входят: searchsorted дал бы для них соседний столбец.
+    """
+    if not len(arrays.question_ids):
+        return np.zeros(len(question_ids), dtype=np.int64), np.zeros(len(question_ids), dtype=bool)
+    columns = np.minimum(np.searchsorted(arrays.question_ids, question_ids), len(arrays.question_ids) - 1)
+    return columns, arrays.question_ids[columns] == question_ids
+
+
+def score_response_sets(arrays, response_sets):
+    """Баллы для списка наборов ответов [{question_id: балл}] одним векторным расчетом.
+
+    Ответы на вопросы, не относящиеся ни к одному S, не учитываются.
+    """
+    answers = np.full((len(response_sets), len(arrays.question_ids)), np.nan)
+    for row, responses in enumerate(response_sets):
+        if not responses:
+            continue
+        question_ids = np.fromiter(responses.keys(), dtype=np.int64, count=len(responses))
+        values = np.fromiter(responses.values(), dtype=np.float64, count=len(responses))
+        columns, known = _question_columns(arrays, question_ids)
+        answers[row, columns[known]] = values[known]
+    return _score_dicts(score_matrix(arrays, answers))
+
+
+def _response_matrix(arrays, audit_ids, rows):
+    """Матрица ответов из массива строк (audit_id, question_id, score)."""
+    answers = np.full((len(audit_ids), len(arrays.question_ids)), np.nan)
+    if len(rows) and len(arrays.question_ids):
+        audit_col = np.searchsorted(audit_ids, rows[:, 0])
+        question_col, known = _question_columns(arrays, rows[:, 1])
+        answers[audit_col[known], question_col[known]] = rows[known, 2]
+    return answers
+
+
+def _fetch_array(statement):
+    """Результат запроса из целых чисел сразу в массив NumPy.
+
+    Строки берутся курсором DBAPI без построения объектов Row SQLAlchemy:
+    на миллионах ответов это основная часть времени пересчета.
+    """
+    result = db.session.connection().execute(statement)
+    try:
+        rows = result.cursor.fetchall()
+    finally:
+        result.close()
+    return np.array(rows, dtype=np.int64).reshape(-1, len(statement.selected_columns))
+
+
+def recompute_checklist_scores(checklist_id, batch_size=20000):
+    """Пересчет баллов всех аудитов чек-листа, у которых есть ответы на вопросы.
+
+    Ответы читаются пачками по диапазону id аудитов, баллы считаются
+    векторно и записываются одним executemany на пачку.
+    Возвращает (число пересчитанных аудитов, множество затронутых участков).
+    """
+    from .models import AuditRecord, AuditResponse
+
+    arrays = checklist_arrays(checklist_id)
+    if arrays is None:
+        return 0, set()
+    audited = _fetch_array(
+        db.select(AuditRecord.id, AuditRecord.area_id).where(
+            AuditRecord.checklist_id == checklist_id,
+            AuditRecord.responses.any()
+        ).order_by(AuditRecord.id)
+    )
+
+    table = AuditRecord.__table__
+    update = table.update().where(table.c.id == db.bindparam('audit_id')).values(
+        **{field: db.bindparam(field) for field in SCORE_FIELDS + ('overall_score',)}
+    )
+
+    for start in range(0, len(audited), batch_size):
+        audit_ids = audited[start:start + batch_size, 0]
+        rows = _fetch_array(
+            db.select(AuditResponse.audit_id, AuditResponse.question_id, AuditResponse.score).join(
+                AuditRecord, AuditRecord.id == AuditResponse.audit_id
+            ).where(
+                AuditRecord.checklist_id == checklist_id,
+                AuditResponse.audit_id.between(int(audit_ids[0]), int(audit_ids[-1]))
+            )
+        )
+
+        # Все аудиты чек-листа с ответами из этого диапазона id входят в пачку
+        scores = _score_dicts(score_matrix(arrays, _response_matrix(arrays, audit_ids, rows)))
+        db.session.execute(update, [
+            dict(audit_id=audit_id, **values) for audit_id, values in zip(audit_ids.tolist(), scores)
+        ])
+
+    return len(audited), set(audited[:, 1].tolist())
@@ -0,0 +1,448 @@
+import zlib
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from .models import CURRENT_SCORE_DAYS, Area, AuditRecord, AreaScoreSummary, AuditWeekStats
+
+# Окна сводки AreaScoreSummary, недель
+SUMMARY_WINDOWS = (2, 4, 12)
+SUMMARY_S_WINDOW = 4
+
+# Последний аудит участка - за самую позднюю ISO-неделю (не по времени внесения)
+LATEST_FIRST = (AuditRecord.year.desc(), AuditRecord.week_number.desc(), AuditRecord.id.desc())
+
+
+def iso_week_window(weeks, today=None):
+    """Список (год, неделя) по ISO за последние weeks недель, от текущей к старым.
+
+    Шаг идет по понедельникам, поэтому годы с 53 неделями учитываются корректно.
+    """
+    if today is None:
+        today = datetime.utcnow()
+    if isinstance(today, datetime):
+        today = today.date()
+    monday = today - timedelta(days=today.weekday())
+    window = []
+    for i in range(weeks):
+        year, week, _ = (monday - timedelta(weeks=i)).isocalendar()
+        window.append((year, week))
+    return window
+
+
+def _week_range_filter(window):
+    """Условие на диапазон (год, неделя) от самой старой до текущей недели окна."""
+    last_year, last_week = window[0]
+    first_year, first_week = window[-1]
+    return db.and_(
+        db.or_(
+            AuditRecord.year > first_year,
+            db.and_(AuditRecord.year == first_year, AuditRecord.week_number >= first_week)
+        ),
+        db.or_(
+            AuditRecord.year < last_year,
+            db.and_(AuditRecord.year == last_year, AuditRecord.week_number <= last_week)
+        )
+    )
+
+
+def get_area_week_series(area_id, weeks=12, today=None):
+    """История аудитов участка по неделям одним запросом, пропуски заполняются в памяти."""
+    window = iso_week_window(weeks, today)
+    if not window:
+        return []
+
+    audits = AuditRecord.query.filter(
+        AuditRecord.area_id == area_id,
+        _week_range_filter(window)
+    ).all()
+    by_week = {(audit.year, audit.week_number): audit for audit in audits}
+
+    series = []
+    for year, week in window:
+        audit = by_week.get((year, week))
+        series.append({
+            'week': week,
+            'year': year,
+            'audit': audit,
+            'score': audit.overall_score if audit else 0
+        })
+    return series
+
+
+SERIES_FIELDS = ('overall_score', 'score_1s', 'score_2s', 'score_3s', 'score_4s', 'score_5s')
+
+
+def get_week_series_batch(area_ids, weeks=12, today=None):
+    """Недельные ряды баллов нескольких участков одним запросом.
+
+    Возвращает (окно недель от старой к новой, {area_id: {поле: [значения]}}),
+    где для каждого поля SERIES_FIELDS значения идут параллельно окну;
+    неделя без аудита - None.
+    """
+    window = list(reversed(iso_week_window(weeks, today)))
+    series = {
+        area_id: {field: [None] * len(window) for field in SERIES_FIELDS}
+        for area_id in area_ids
+    }
+    if not window or not series:
+        return window, series
+
+    position = {key: i for i, key in enumerate(window)}
+    rows = db.session.execute(
+        db.select(
+            AuditRecord.area_id, AuditRecord.year, AuditRecord.week_number,
+            *[getattr(AuditRecord, field) for field in SERIES_FIELDS]
+        ).where(
+            AuditRecord.area_id.in_(series.keys()),
+            _week_range_filter(list(reversed(window)))
+        )
+    )
+    for area_id, year, week, *values in rows:
+        i = position.get((year, week))
+        if i is None:
+            continue
+        area_series = series[area_id]
+        for field, value in zip(SERIES_FIELDS, values):
+            area_series[field][i] = value
+    return window, series
+
+
+def get_latest_scores_batch(area_ids):
+    """Баллы 1S..5S последнего аудита нескольких участков (для радаров).
+
+    Основной путь - один запрос по сводкам с присоединением последнего аудита;
+    для участков без сводки - один запрос с оконной функцией по аудитам.
+    Возвращает {area_id: (название, [1S..5S] или None)}.
+    """
+    score_columns = [getattr(AuditRecord, f'score_{n}s') for n in range(1, 6)]
+    rows = db.session.execute(
+        db.select(Area.id, Area.name, AreaScoreSummary.area_id, *score_columns).outerjoin(
+            AreaScoreSummary, AreaScoreSummary.area_id == Area.id
+        ).outerjoin(
+            AuditRecord, AuditRecord.id == AreaScoreSummary.last_audit_id
+        ).where(Area.id.in_(area_ids))
+    )
+
+    result = {}
+    missing = []
+    for area_id, name, summary_area_id, *scores in rows:
+        if summary_area_id is None:
+            missing.append(area_id)
+        result[area_id] = (name, None if scores[0] is None else scores)
+
+    if missing:
+        ranked = db.select(
+            AuditRecord.area_id, *score_columns,
+            db.func.row_number().over(
+                partition_by=AuditRecord.area_id,
+                order_by=LATEST_FIRST
+            ).label('rank')
+        ).where(AuditRecord.area_id.in_(missing)).subquery()
+        for area_id, *scores in db.session.execute(
+            db.select(ranked.c.area_id, *[ranked.c[column.key] for column in score_columns]).where(ranked.c.rank == 1)
+        ):
+            result[area_id] = (result[area_id][0], scores)
+    return result
+
+
+def area_data_version(area_id):
+    """Версия данных графиков участка для условных запросов: (etag, last_modified).
+
+    Берется из сводки AreaScoreSummary одним запросом по первичному ключу,
+    без построения ответа. Для участка без сводки - по последнему аудиту.
+    Возвращает None, если участка нет.
+    """
+    row = db.session.execute(
+        db.select(Area.name, AreaScoreSummary.version, AreaScoreSummary.last_audit_id, AreaScoreSummary.updated_at).outerjoin(
+            AreaScoreSummary, AreaScoreSummary.area_id == Area.id
+        ).where(Area.id == area_id)
+    ).first()
+    if row is None:
+        return None
+
+    name, version, last_audit_id, modified = row
+    if version is None:
+        last_audit_id, modified = db.session.execute(
+            db.select(db.func.max(AuditRecord.id), db.func.max(AuditRecord.timestamp)).where(AuditRecord.area_id == area_id)
+        ).first()
+        version = 0
+
+    # Название участка входит в ответ радара, поэтому учитывается в ETag
+    etag = f'{area_id}-{version}-{last_audit_id or 0}-{zlib.crc32(name.encode("utf-8")):08x}'
+    return etag, modified
+
+
+def attach_area_scores(areas, now=None):
+    """Последний аудит и текущий балл для всех участков без запросов на каждый участок.
+
+    Сначала читается сводка AreaScoreSummary (выборка по первичному ключу);
+    текущий балл считается по сохраненным в ней баллам последних дней на
+    момент now. Для участков без сводки (или со сводкой, еще не
+    пересчитанной после обновления схемы) выполняется один агрегирующий
+    запрос по аудитам. Результат сохраняется в объектах Area, поэтому
+    свойства last_audit и current_score больше не обращаются к БД.
+    """
+    areas = list(areas)
+    if not areas:
+        return areas
+
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=CURRENT_SCORE_DAYS)
+    summaries = {
+        summary.area_id: summary
+        for summary in AreaScoreSummary.query.options(
+            db.joinedload(AreaScoreSummary.last_audit)
+        ).filter(AreaScoreSummary.area_id.in_([area.id for area in areas]))
+    }
+
+    missing = []
+    for area in areas:
+        summary = summaries.get(area.id)
+        if summary is None or summary.recent_scores is None:
+            missing.append(area)
+            continue
+        area._prefetched_last_audit = summary.last_audit
+        area._prefetched_score_version = summary.version
+        area._prefetched_current_score = summary.current_score(now)
+
+    if missing:
+        _attach_scores_from_audits(missing, cutoff)
+    return areas
+
+
+def _attach_scores_from_audits(areas, cutoff):
+    """Расчет по таблице аудитов одним запросом с оконными функциями."""
+    ranked = db.select(
+        AuditRecord.id.label('id'),
+        db.func.row_number().over(
+            partition_by=AuditRecord.area_id,
+            order_by=LATEST_FIRST
+        ).label('rn'),
+        db.func.avg(
+            db.case((AuditRecord.timestamp >= cutoff, AuditRecord.overall_score))
+        ).over(partition_by=AuditRecord.area_id).label('recent_mean')
+    ).where(
+        AuditRecord.area_id.in_([area.id for area in areas])
+    ).subquery()
+
+    rows = db.session.query(AuditRecord, ranked.c.recent_mean).join(
+        ranked, ranked.c.id == AuditRecord.id
+    ).filter(ranked.c.rn == 1).all()
+    scores = {audit.area_id: (audit, mean) for audit, mean in rows}
+
+    for area in areas:
+        audit, mean = scores.get(area.id, (None, None))
+        area._prefetched_last_audit = audit
+        area._prefetched_current_score = round(mean, 2) if mean is not None else 0
+        area._prefetched_score_version = f'a{audit.id}' if audit else 0
+
+
+def _week_index(year, week):
+    """Порядковый номер ISO-недели (для расчета расстояния между неделями)."""
+    try:
+        monday = date.fromisocalendar(year, week, 1)
+    except ValueError:
+        # Неделя 53 в году, где ее нет, считается следующей за 52-й
+        monday = date.fromisocalendar(year, 52, 1) + timedelta(weeks=week - 52)
+    return monday.toordinal() // 7
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 2) if values else 0
+
+
+def _summary_values(audits, last_audit, recent=()):
+    """Значения сводки по аудитам участка, отсортированным от новой недели к старой.
+
+    recent - пары (время, общий балл) аудитов за последние CURRENT_SCORE_DAYS дней.
+    """
+    values = dict(
+        last_audit_id=last_audit.id if last_audit else None,
+        last_audit_at=last_audit.timestamp if last_audit else None,
+        mean_2w=0, mean_4w=0, mean_12w=0,
+        mean_1s=0, mean_2s=0, mean_3s=0, mean_4s=0, mean_5s=0,
+        trend=0, audit_count=0,
+        recent_scores=sorted(([at.isoformat(), score] for at, score in recent if at is not None), key=lambda item: item[0])
+    )
+    if not audits:
+        return values
+
+    anchor = _week_index(audits[0].year, audits[0].week_number)
+    windowed = [
+        (anchor - _week_index(audit.year, audit.week_number), audit) for audit in audits
+    ]
+
+    for weeks in SUMMARY_WINDOWS:
+        values[f'mean_{weeks}w'] = _mean([a.overall_score or 0 for age, a in windowed if age < weeks])
+
+    s_window = [a for age, a in windowed if age < SUMMARY_S_WINDOW]
+    for n in range(1, 6):
+        values[f'mean_{n}s'] = _mean([getattr(a, f'score_{n}s') or 0 for a in s_window])
+
+    if len(audits) > 1:
+        values['trend'] = round((audits[0].overall_score or 0) - (audits[1].overall_score or 0), 2)
+    values['audit_count'] = sum(1 for age, a in windowed if age < max(SUMMARY_WINDOWS))
+    return values
+
+
+def _summary_row(area_id):
+    """Сводка участка для обновления.
+
+    Отсутствующая строка создается через INSERT ... ON CONFLICT DO NOTHING:
+    две параллельные первые записи аудита участка не конфликтуют по ключу,
+    а вторая просто обновляет строку, вставленную первой.
+    """
+    summary = db.session.get(AreaScoreSummary, area_id)
+    if summary is not None:
+        return summary
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(AreaScoreSummary.__table__)
+        db.session.execute(insert.values(area_id=area_id, version=0).on_conflict_do_nothing(index_elements=['area_id']))
+        return db.session.get(AreaScoreSummary, area_id)
+
+    # Прочие СУБД: обычная вставка через ORM
+    summary = AreaScoreSummary(area_id=area_id, version=0)
+    db.session.add(summary)
+    return summary
+
+
+def _store_summary(summary, values):
+    """Запись сводки в текущую сессию (без commit) с увеличением версии."""
+    for key, value in values.items():
+        setattr(summary, key, value)
+    summary.version = (summary.version or 0) + 1
+    summary.updated_at = datetime.utcnow()
+    return summary
+
+
+def refresh_area_summary(area_id):
+    """Пересчет сводки одного участка в рамках текущей транзакции.
+
+    Вызывается после добавления аудита до commit, чтобы сводка и аудит
+    фиксировались вместе.
+    """
+    db.session.flush()
+    # Одним запросом: аудиты последних недель и аудиты последних дней (для текущего балла).
+    # Первые строки в порядке LATEST_FIRST - ровно последние недели: остальные строки ниже них
+    cutoff = datetime.utcnow() - timedelta(days=CURRENT_SCORE_DAYS)
+    latest_ids = db.select(AuditRecord.id).where(AuditRecord.area_id == area_id).order_by(
+        *LATEST_FIRST
+    ).limit(max(SUMMARY_WINDOWS))
+    rows = AuditRecord.query.filter(
+        AuditRecord.area_id == area_id,
+        db.or_(AuditRecord.id.in_(latest_ids), AuditRecord.timestamp >= cutoff)
+    ).order_by(*LATEST_FIRST).all()
+    audits = rows[:max(SUMMARY_WINDOWS)]
+    recent = [(audit.timestamp, audit.overall_score) for audit in rows
+              if audit.timestamp is not None and audit.timestamp >= cutoff]
+    return _store_summary(_summary_row(area_id), _summary_values(audits, audits[0] if audits else None, recent))
+
+
+def rebuild_area_summaries(batch_size=1000):
+    """Полный пересчет сводок всех участков одним проходом по таблице аудитов."""
+    rows = AuditRecord.query.order_by(AuditRecord.area_id, *LATEST_FIRST).yield_per(batch_size)
+
+    cutoff = datetime.utcnow() - timedelta(days=CURRENT_SCORE_DAYS)
+    computed = {}
+    for area_id, audits in groupby(rows, key=lambda audit: audit.area_id):
+        latest = []
+        recent = []
+        for audit in audits:
+            if len(latest) < max(SUMMARY_WINDOWS):
+                latest.append(audit)
+            if audit.timestamp is not None and audit.timestamp >= cutoff:
+                recent.append((audit.timestamp, audit.overall_score))
+        computed[area_id] = _summary_values(latest, latest[0], recent)
+
+    area_ids = [area_id for (area_id,) in db.session.query(Area.id)]
+    summaries = {summary.area_id: summary for summary in AreaScoreSummary.query}
+    for area_id in area_ids:
+        summary = summaries.get(area_id) or _summary_row(area_id)
+        _store_summary(summary, computed.get(area_id) or _summary_values([], None))
+    db.session.commit()
+    return len(area_ids)
+
+
+def refresh_week_stats(weeks=None):
+    """Пересчет AuditWeekStats для набора (год, неделя) одним агрегирующим запросом.
+
+    Кроме числа участков с аудитом сохраняются их id: по ним считается
+    выполнение аудитов по участкам без чтения таблицы аудитов.
+    weeks=None - все недели (полная перестройка). Изменения остаются
+    в текущей транзакции, commit - на стороне вызывающего.
+    """
+    if weeks is not None and not weeks:
+        return 0
+    db.session.flush()
+    query = db.select(
+        AuditRecord.year, AuditRecord.week_number, AuditRecord.area_id,
+        db.func.count(), db.func.sum(AuditRecord.overall_score)
+    ).group_by(AuditRecord.year, AuditRecord.week_number, AuditRecord.area_id)
+    if weeks is not None:
+        query = query.where(db.tuple_(AuditRecord.year, AuditRecord.week_number).in_(list(weeks)))
+    computed = {}
+    for year, week, area_id, count, total in db.session.execute(query):
+        area_ids, audits, score = computed.get((year, week), ((), 0, 0))
+        computed[(year, week)] = ((*area_ids, area_id), audits + count, score + (total or 0))
+
+    # Для пересчитываемых недель без аудитов (например, после удаления) - нули
+    for key in weeks or ():
+        computed.setdefault(key, ((), 0, 0))
+
+    active_areas = db.session.scalar(db.select(db.func.count()).select_from(Area).where(Area.is_active == True))
+    now = datetime.utcnow()
+    for (year, week), (area_ids, audits, score) in computed.items():
+        stats = db.session.get(AuditWeekStats, (year, week))
+        if stats is None:
+            stats = AuditWeekStats(year=year, week_number=week)
+            db.session.add(stats)
+        stats.active_areas = active_areas
+        stats.audited_areas = len(area_ids)
+        stats.area_ids = sorted(area_ids)
+        stats.mean_score = round(score / audits, 2) if audits else 0
+        stats.updated_at = now
+    return len(computed)
+
+
+def audit_completion_stats(weeks=12, today=None):
+    """Выполнение аудитов по неделям и по участкам - только из AuditWeekStats.
+
+    Окно - weeks ISO-недель до текущей; доля по участку - число недель окна,
+    в id участков которых он есть, плюс отметки по каждой неделе.
+    """
+    window = list(reversed(iso_week_window(weeks, today)))
+    stored = {
+        (stats.year, stats.week_number): stats
+        for stats in AuditWeekStats.query.filter(db.tuple_(AuditWeekStats.year, AuditWeekStats.week_number).in_(window))
+    }
+    active_areas = None
+    by_week = []
+    for year, week in window:
+        stats = stored.get((year, week))
+        if stats is None and active_areas is None:
+            active_areas = db.session.scalar(db.select(db.func.count()).select_from(Area).where(Area.is_active == True))
+        active = stats.active_areas if stats else active_areas
+        audited = stats.audited_areas if stats else 0
+        by_week.append(dict(
+            year=year, week=week, active_areas=active, audited_areas=audited,
+            rate=round(audited / active, 3) if active else 0,
+            mean_score=stats.mean_score if stats else None
+        ))
+
+    audited_weeks = [
+        set(stored[key].area_ids or ()) if key in stored else set() for key in window
+    ]
+    by_area = []
+    for area_id, name in db.session.execute(
+        db.select(Area.id, Area.name).where(Area.is_active == True).order_by(Area.name)
+    ):
+        done = [area_id in area_ids for area_ids in audited_weeks]
+        by_area.append(dict(
+            area_id=area_id, name=name, audits=sum(done),
+            rate=round(sum(done) / len(window), 3) if window else 0,
+            weeks=done
+        ))
+    return dict(weeks=by_week, areas=by_area, area_window_weeks=len(window))
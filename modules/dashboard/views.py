@@ -1,69 +1,80 @@
-from flask import render_template, flash, redirect, url_for, request, jsonify
+from functools import wraps
+from flask import render_template, flash, redirect, url_for, request, jsonify, Response, stream_with_context, current_app, abort, make_response
 from flask_login import login_required, current_user
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 from . import bp
-from .models import Area, AuditRecord, AuditResponse
+from .models import Area, AuditRecord, AuditResponse, AreaScoreSummary
 from .forms import AreaForm, AuditForm
+from . import export, live
+from .checklists import get_compiled_checklist
+from .services import (
+    SERIES_FIELDS, attach_area_scores, area_data_version, get_area_week_series, get_latest_scores_batch,
+    get_week_series_batch, refresh_area_summary, refresh_week_stats
+)
 from app import db
-from datetime import datetime
+from core.models import ChecklistAssignment
+from core.fragment_cache import fragment_cache
+from core.pubsub import event_bus
+from core.instrumentation import query_budget
+from core.database import replica_read, replica_router
+from datetime import datetime, timedelta, timezone
+import io
+from sqlalchemy.exc import IntegrityError
 import calendar
 
 @bp.route('/')
+@replica_read
 @login_required
 def index():
     """Главная страница дашборда."""
     areas = Area.query.filter_by(is_active=True).all()
+    attach_area_scores(areas)  # один агрегирующий запрос вместо запросов на каждый участок
     
     # Статистика
     total_areas = Area.query.count()
     active_areas = Area.query.filter_by(is_active=True).count()
-    this_week = datetime.utcnow().isocalendar()[1]
-    audits_this_week = AuditRecord.query.filter_by(week_number=this_week).count()
+    this_year, this_week, _ = datetime.utcnow().isocalendar()
+    audits_this_week = AuditRecord.query.filter_by(year=this_year, week_number=this_week).count()
     
     return render_template('dashboard/index.html',
                          areas=areas,
                          total_areas=total_areas,
                          active_areas=active_areas,
-                         audits_this_week=audits_this_week)
+                         audits_this_week=audits_this_week,
+                         live=request.args.get('live') == '1')  # режим табло
 
 @bp.route('/area/<int:area_id>')
+@replica_read
 @login_required
 def area_detail(area_id):
     """Детальная страница участка."""
     area = Area.query.get_or_404(area_id)
     
-    # Получаем аудиты за последние 12 недель
-    current_week = datetime.utcnow().isocalendar()[1]
-    weeks_back = 12
+    def render_history():
+        # Запросы истории - только при промахе кэша
+        return render_template('dashboard/components/audit_history.html',
+                             area=area,
+                             audit_history=get_area_week_series(area_id, weeks=12),  # один запрос по диапазону ISO-недель
+                             recent_audits=area.audits.order_by(AuditRecord.timestamp.desc()).limit(5).all())
     
-    audit_history = []
-    for i in range(weeks_back):
-        week = current_week - i
-        year = datetime.utcnow().year
-        
-        if week < 1:
-            week += 52
-            year -= 1
-            
-        audit = AuditRecord.query.filter_by(
-            area_id=area_id,
-            week_number=week,
-            year=year
-        ).first()
-        
-        audit_history.append({
-            'week': week,
-            'year': year,
-            'audit': audit,
-            'score': audit.overall_score if audit else 0
-        })
-    
-    # Получаем последние 5 аудитов
-    recent_audits = area.audits.order_by(AuditRecord.timestamp.desc()).limit(5).all()
+    # Окно истории сдвигается с неделей, поэтому текущая ISO-неделя входит в ключ
+    this_year, this_week, _ = datetime.utcnow().isocalendar()
+    history = fragment_cache.get_or_render('area_history', (area_id, area.score_version, this_year, this_week),
+                                           render_history, area=area_id)
     
     return render_template('dashboard/area_detail.html',
                          area=area,
-                         audit_history=audit_history,
-                         recent_audits=recent_audits)
+                         history=history)
+
+def _is_duplicate_week(error):
+    """Нарушен ли уникальный индекс (area_id, year, week_number), а не другое ограничение."""
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)  # psycopg
+    if constraint:
+        return constraint == 'ix_audit_records_area_year_week'
+    message = str(error.orig)
+    return 'ix_audit_records_area_year_week' in message or \
+        'audit_records.area_id, audit_records.year, audit_records.week_number' in message  # SQLite
 
 @bp.route('/area/<int:area_id>/audit/new', methods=['GET', 'POST'])
 @login_required
@@ -78,22 +89,24 @@ def new_audit(area_id):
     
     form = AuditForm()
     
-    # Устанавливаем значения по умолчанию
-    current_date = datetime.utcnow()
-    form.week_number.data = current_date.isocalendar()[1]
-    form.year.data = current_date.year
+    # Чек-лист участка (скомпилированный, из кэша) - для вопросов формы и расчета баллов
+    assignment = ChecklistAssignment.query.filter_by(entity_type='area', entity_id=area_id).first()
+    checklist = get_compiled_checklist(assignment.checklist_id) if assignment else None
+    if checklist is None:
+        # Аудит без чек-листа сохранить нельзя (audit_records.checklist_id NOT NULL)
+        flash('Участку не назначен чек-лист: аудит провести нельзя, обратитесь к администратору', 'danger')
+        return redirect(url_for('dashboard.area_detail', area_id=area_id))
+    
+    # Значения по умолчанию для новой формы: ISO-год и ISO-неделя (как в истории и сводках);
+    # при отправке остается выбранная пользователем неделя
+    if not form.is_submitted():
+        iso_year, iso_week, _ = datetime.utcnow().isocalendar()
+        form.week_number.data = iso_week
+        form.year.data = iso_year
     
     if form.validate_on_submit():
-        # Проверяем, нет ли уже аудита на эту неделю
-        existing = AuditRecord.query.filter_by(
-            area_id=area_id,
-            week_number=form.week_number.data,
-            year=form.year.data
-        ).first()
-        
-        if existing:
-            flash('Аудит на эту неделю уже существует', 'warning')
-            return redirect(url_for('dashboard.area_detail', area_id=area_id))
+        # Повторный аудит на ту же неделю отклоняет уникальный индекс (см. обработку IntegrityError)
+        area_name = area.name
         
         # Создаем запись аудита
         audit = AuditRecord(
@@ -116,19 +129,82 @@ def new_audit(area_id):
             editor_id=current_user.id
         )
         
-        db.session.add(audit)
-        db.session.commit()
+        # Ответы на вопросы чек-листа (поля q_<id>): баллы считаются по ним
+        responses = {}
+        audit.checklist_id = checklist.checklist_id
+        for question in checklist.questions:
+            value = request.form.get(f'q_{question.id}', type=int)
+            if value is not None:
+                responses[question.id] = max(0, min(value, question.max_score))
+        if responses:
+            from .scoring import score_response_sets  # numpy - только при первом расчете
+            for field, value in score_response_sets(checklist.arrays, [responses])[0].items():
+                setattr(audit, field, value)
+        
+        try:
+            db.session.add(audit)
+            db.session.flush()  # id аудита для ответов
+            if responses:
+                # Все ответы - одним executemany
+                db.session.execute(db.insert(AuditResponse), [
+                    dict(audit_id=audit.id, question_id=question_id, score=score,
+                         comment=request.form.get(f'q_{question_id}_comment') or None)
+                    for question_id, score in responses.items()
+                ])
+            refresh_area_summary(area_id)  # сводка фиксируется в той же транзакции
+            refresh_week_stats({(audit.year, audit.week_number)})
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if not _is_duplicate_week(e):
+                raise
+            # Параллельная запись на ту же неделю (уникальный индекс area_id, year, week_number)
+            flash('Аудит на эту неделю уже существует', 'warning')
+            return redirect(url_for('dashboard.area_detail', area_id=area_id))
         
-        flash(f'Аудит для участка "{area.name}" успешно создан!', 'success')
+        replica_router.mark_write()  # страница участка после редиректа - из основной базы
+        flash(f'Аудит для участка "{area_name}" успешно создан!', 'success')
         return redirect(url_for('dashboard.area_detail', area_id=area_id))
     
     return render_template('dashboard/audit_form.html',
                          form=form,
                          area=area,
+                         checklist=checklist,
                          title='Новый аудит')
 
+def conditional_area_api(view):
+    """Условный GET для API графиков участка (ETag и Last-Modified).
+    
+    Версия данных берется из сводки участка до вызова представления:
+    при совпадении возвращается 304 без запросов для построения ответа.
+    """
+    @wraps(view)
+    def wrapper(area_id):
+        version = area_data_version(area_id)
+        if version is None:
+            abort(404)
+        etag, modified = version
+        if modified is not None:
+            modified = modified.replace(microsecond=0, tzinfo=timezone.utc)
+        
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = modified is not None and request.if_modified_since is not None \
+                and modified <= request.if_modified_since
+        
+        response = Response(status=304) if not_modified else make_response(view(area_id))
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        response.headers['Cache-Control'] = current_app.config['DASHBOARD_API_CACHE_CONTROL']
+        return response
+    return wrapper
+
 @bp.route('/api/area/<int:area_id>/scores')
+@replica_read
 @login_required
+@conditional_area_api
 def area_scores_api(area_id):
     """API для получения баллов участка (для графика)."""
     area = Area.query.get_or_404(area_id)
@@ -154,11 +230,16 @@ def area_scores_api(area_id):
     return jsonify(data)
 
 @bp.route('/api/radar/<int:area_id>')
+@replica_read
 @login_required
+@conditional_area_api
 def radar_data_api(area_id):
     """API для данных радар-диаграммы."""
     area = Area.query.get_or_404(area_id)
-    latest_audit = area.last_audit
+    
+    # Последний аудит из сводки (выборка по первичному ключу)
+    summary = db.session.get(AreaScoreSummary, area_id, options=[db.joinedload(AreaScoreSummary.last_audit)])
+    latest_audit = summary.last_audit if summary else area.last_audit
     
     if not latest_audit:
         scores = [0, 0, 0, 0, 0]
@@ -185,4 +266,178 @@ def radar_data_api(area_id):
         }]
     }
     
-    return jsonify(data)
\ No newline at end of file
+    return jsonify(data)
+
+def _requested_area_ids():
+    """Участки из параметра areas=1,2,3 в порядке запроса (по умолчанию - все активные).
+    
+    Несуществующие id отбрасываются. ValueError при неверном формате.
+    """
+    requested = [int(x) for x in request.args.get('areas', '').split(',') if x.strip()]
+    if not requested:
+        return list(db.session.scalars(db.select(Area.id).where(Area.is_active == True).order_by(Area.id)))
+    existing = set(db.session.scalars(db.select(Area.id).where(Area.id.in_(requested))))
+    return [area_id for area_id in dict.fromkeys(requested) if area_id in existing]
+
+@bp.route('/api/scores')
+@replica_read
+@login_required
+def batch_scores_api():
+    """Недельные баллы нескольких участков (areas=1,2,3&weeks=N) одним запросом.
+    
+    Ответ в колонках: общий список недель и для каждого ряда (overall, s1..s5)
+    массив массивов в порядке списка areas; неделя без аудита - null.
+    """
+    try:
+        area_ids = _requested_area_ids()
+        weeks = min(max(int(request.args.get('weeks', 8)), 1), 53)
+    except ValueError:
+        return jsonify({'error': 'invalid areas or weeks'}), 400
+    
+    window, series = get_week_series_batch(area_ids, weeks)
+    data = {
+        'weeks': [f'W{week}' for _, week in window],
+        'years': [year for year, _ in window],
+        'areas': area_ids,
+    }
+    for field, key in zip(SERIES_FIELDS, ('overall', 's1', 's2', 's3', 's4', 's5')):
+        data[key] = [series[area_id][field] for area_id in area_ids]
+    return jsonify(data)
+
+@bp.route('/api/radar')
+@replica_read
+@login_required
+def batch_radar_api():
+    """Данные радар-диаграмм нескольких участков (areas=1,2,3) в колонках."""
+    try:
+        area_ids = _requested_area_ids()
+    except ValueError:
+        return jsonify({'error': 'invalid areas'}), 400
+    
+    latest = get_latest_scores_batch(area_ids) if area_ids else {}
+    return jsonify({
+        'labels': ['1S', '2S', '3S', '4S', '5S'],
+        'areas': area_ids,
+        'names': [latest[area_id][0] for area_id in area_ids],
+        'scores': [latest[area_id][1] or [0, 0, 0, 0, 0] for area_id in area_ids],
+    })
+
+@bp.route('/export')
+@replica_read
+@login_required
+def export_audits():
+    """Потоковая выгрузка истории аудитов в CSV или XLSX.
+    
+    Параметры: format=csv|xlsx, date_from/date_to (ГГГГ-ММ-ДД, включительно),
+    areas=1,2,3, responses=1 (добавить ответы на вопросы чек-листа).
+    """
+    file_format = request.args.get('format', 'csv').lower()
+    if file_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+    if file_format == 'xlsx' and not export.XLSX_AVAILABLE:
+        return jsonify({'error': 'XLSX export requires openpyxl'}), 501
+    
+    try:
+        date_from = request.args.get('date_from')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+        date_to = request.args.get('date_to')
+        date_to = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1) if date_to else None
+        area_ids = [int(x) for x in request.args.get('areas', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({'error': 'invalid date or area filter'}), 400
+    
+    query, header = export.export_query(
+        date_from=date_from,
+        date_to=date_to,
+        area_ids=area_ids,
+        with_responses=request.args.get('responses') == '1'
+    )
+    
+    if file_format == 'xlsx':
+        body = export.stream_xlsx(query, header)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = export.stream_csv(query, header)
+        mimetype = 'text/csv'
+    
+    filename = f'audits_{datetime.utcnow():%Y%m%d_%H%M}.{file_format}'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@bp.route('/api/audits/bulk', methods=['POST'])
+@login_required
+@query_budget(None)  # число запросов зависит от размера файла
+def bulk_import_api():
+    """Пакетный импорт аудитов из JSON Lines или CSV (тело запроса).
+    
+    Формат определяется параметром format=jsonl|csv или Content-Type.
+    Ошибочные строки пропускаются и перечисляются в отчете.
+    Тело - не форма, поэтому CSRF-токен (csrf_token() со страницы)
+    передается в заголовке X-CSRFToken.
+    """
+    if current_user.role not in ['Editor', 'Admin']:
+        return jsonify({'error': 'forbidden'}), 403
+    
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as e:
+            return jsonify({'error': f'csrf: {e}'}), 400
+    
+    file_format = request.args.get('format')
+    if not file_format:
+        file_format = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    if file_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be jsonl or csv'}), 400
+    
+    chunk_size = request.args.get('chunk_size', type=int) or current_app.config['AUDIT_IMPORT_CHUNK_SIZE']
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    
+    from .importer import AuditImporter, parse_records
+    importer = AuditImporter(editor_id=current_user.id, chunk_size=chunk_size)
+    report = importer.run(parse_records(stream, file_format))
+    if report['inserted']:
+        replica_router.mark_write()
+    return jsonify(report)
+
+
+@bp.route('/api/stream')
+@login_required
+def score_stream():
+    """Поток обновлений баллов (Server-Sent Events) вместо опроса API графиков.
+    
+    Параметр areas=1,2,3 - подписка на участки (по умолчанию все).
+    Первым приходит текущее состояние, затем события после каждого
+    зафиксированного аудита. Соединение занимает воркер до SSE_MAX_DURATION,
+    поэтому поток доступен только при SSE_ENABLED (асинхронные воркеры).
+    """
+    if not current_app.config['SSE_ENABLED']:
+        abort(404)
+    
+    try:
+        area_ids = [int(x) for x in request.args.get('areas', '').split(',') if x.strip()] or None
+    except ValueError:
+        return jsonify({'error': 'invalid area filter'}), 400
+    
+    # Подписка до снимка, чтобы не потерять аудит, записанный между ними
+    subscription = event_bus.subscribe(live.SCORES_CHANNEL)
+    snapshot = live.score_snapshot(area_ids)
+    
+    config = current_app.config
+    # Без stream_with_context: контекст и соединение с БД освобождаются сразу
+    response = Response(
+        live.iter_events(
+            subscription, area_ids, snapshot,
+            heartbeat=config['SSE_HEARTBEAT_INTERVAL'],
+            max_duration=config['SSE_MAX_DURATION'],
+            retry=config['SSE_RETRY_MS']
+        ),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(subscription.close)
+    return response
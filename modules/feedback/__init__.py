@@ -2,4 +2,7 @@ from flask import Blueprint
 
 bp = Blueprint('feedback', __name__, url_prefix='/feedback')
 
-from . import views
\ No newline at end of file
+
+def load_views():
+    """Импорт представлений (при регистрации модуля в create_app)."""
+    from . import views
@@ -13,8 +13,11 @@ class FeedbackMessage(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     
-    # Связи
-    user = db.relationship('User', backref='feedback_messages')
+    # Связь с пользователем - через backref 'author' из User.feedback_messages
+    
+    __table_args__ = (
+        db.Index('ix_feedback_messages_user_created', 'user_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<FeedbackMessage {self.id} from {self.user_id}>'
\ No newline at end of file
@@ -3,8 +3,10 @@ from flask_login import login_required, current_user
 from . import bp
 from .models import FeedbackMessage
 from app import db
+from core.database import replica_read, replica_router
 
 @bp.route('/')
+@replica_read
 @login_required
 def index():
     """Страница обратной связи."""
@@ -38,11 +40,13 @@ def send_message():
     
     db.session.add(message)
     db.session.commit()
+    replica_router.mark_write()
     
     flash('Сообщение отправлено администратору', 'success')
     return redirect(url_for('feedback.index'))
 
 @bp.route('/api/messages')
+@replica_read
 @login_required
 def get_messages_api():
     """API для получения сообщений (JSON)."""
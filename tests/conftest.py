@@ -0,0 +1,23 @@
+"""Общие фикстуры тестов: приложение на SQLite в памяти."""
+import pytest
+
+from app import create_app, create_tables, db
+from config import Config
+
+
+class AppConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_BINDS = {}
+    WTF_CSRF_ENABLED = False
+    VISIT_LOG_ASYNC = False
+
+
+@pytest.fixture
+def app():
+    app = create_app(AppConfig)
+    with app.app_context():
+        create_tables(app)
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,52 @@
+"""Выполнение аудитов по участкам и неделям из предварительно посчитанной статистики."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import db
+
+
+def add_audits(weeks_ago_by_area):
+    from core.models import Checklist, User
+    from modules.dashboard.models import Area, AuditRecord
+    from modules.dashboard.services import refresh_week_stats
+
+    db.session.add_all([User(id=1, username='editor', role='Editor'), Checklist(id=1, name='5S')])
+    now = datetime.utcnow()
+    weeks = set()
+    for code, weeks_ago in weeks_ago_by_area.items():
+        area = Area(name=code, code=code)
+        db.session.add(area)
+        db.session.flush()
+        for ago in weeks_ago:
+            at = now - timedelta(weeks=ago)
+            year, week, _ = at.isocalendar()
+            weeks.add((year, week))
+            db.session.add(AuditRecord(area_id=area.id, checklist_id=1, year=year, week_number=week, editor_id=1,
+                                       timestamp=at, overall_score=1.5))
+    refresh_week_stats(weeks)
+    db.session.commit()
+
+
+def test_area_completion_comes_from_week_stats(app):
+    from modules.dashboard.services import audit_completion_stats
+
+    add_audits({'A': [0, 1, 20], 'B': [3], 'C': []})
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        stats = audit_completion_stats(weeks=4)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert not [statement for statement in statements if 'audit_records' in statement]
+    areas = {area['name']: area for area in stats['areas']}
+    assert areas['A']['weeks'] == [False, False, True, True]  # от старой недели к текущей
+    assert areas['A']['rate'] == 0.5
+    assert areas['B']['weeks'] == [True, False, False, False]
+    assert areas['C']['audits'] == 0
+    assert [week['audited_areas'] for week in stats['weeks']] == [1, 0, 1, 1]
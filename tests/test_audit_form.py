@@ -0,0 +1,79 @@
+"""Форма нового аудита: выбранная неделя сохраняется, текущая ISO-неделя - только по умолчанию."""
+from datetime import datetime
+
+import pytest
+from flask import template_rendered
+
+from app import db
+
+
+@pytest.fixture
+def area(app):
+    """Участок с назначенным чек-листом: по одному вопросу (макс. балл 2) на каждую S."""
+    from core.models import Checklist, ChecklistAssignment, ChecklistQuestion, ChecklistSection, User
+    from modules.dashboard.models import Area
+
+    db.session.add_all([User(id=1, username='editor', role='Editor'), Checklist(id=1, name='5S')])
+    area = Area(name='Склад', code='SKL')
+    db.session.add(area)
+    db.session.flush()
+    for order in range(5):
+        section = ChecklistSection(checklist_id=1, order_num=order, title=f'{order + 1}S')
+        db.session.add(section)
+        db.session.flush()
+        db.session.add(ChecklistQuestion(section_id=section.id, question_text='Вопрос', weight=1, max_score=2))
+    db.session.add(ChecklistAssignment(checklist_id=1, entity_type='area', entity_id=area.id))
+    db.session.commit()
+    return area.id
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+
+def post_audit(client, area_id, year, week, score=2):
+    from core.models import ChecklistQuestion
+
+    # Поля быстрого ввода форма отправляет нулями, баллы считаются по ответам q_<id>
+    data = dict(year=year, week_number=week, **{f'score_{n}s': 0 for n in range(1, 6)})
+    data.update({f'q_{question_id}': score for (question_id,) in db.session.query(ChecklistQuestion.id)})
+    return client.post(f'/dashboard/area/{area_id}/audit/new', data=data)
+
+
+def test_posted_past_week_is_stored(app, area, client):
+    from modules.dashboard.models import AuditRecord
+
+    response = post_audit(client, area, year=2025, week=10)
+
+    assert response.status_code == 302
+    audit = AuditRecord.query.filter_by(area_id=area).one()
+    assert (audit.year, audit.week_number) == (2025, 10)
+    assert audit.overall_score == 2
+
+
+def test_second_audit_for_same_week_is_rejected(app, area, client):
+    from modules.dashboard.models import AuditRecord
+
+    post_audit(client, area, year=2025, week=10)
+    post_audit(client, area, year=2025, week=10, score=0)
+
+    assert AuditRecord.query.filter_by(area_id=area).count() == 1
+    with client.session_transaction() as session:
+        assert ('warning', 'Аудит на эту неделю уже существует') in session['_flashes']
+
+
+def test_new_form_defaults_to_current_iso_week(app, area, client):
+    from benchmarks.bench_endpoints import install_template_paths
+
+    install_template_paths(app)
+    rendered = []
+    with template_rendered.connected_to(lambda sender, template, context: rendered.append(context), app):
+        assert client.get(f'/dashboard/area/{area}/audit/new').status_code == 200
+
+    year, week, _ = datetime.utcnow().isocalendar()
+    form = rendered[0]['form']
+    assert (form.year.data, form.week_number.data) == (year, week)
@@ -0,0 +1,77 @@
+"""Импорт исторических аудитов не меняет последний аудит и текущий балл участка."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+
+
+@pytest.fixture
+def area(app):
+    """Участок с чек-листом и аудитом за текущую неделю (все баллы 2)."""
+    from core.models import Checklist, User
+    from modules.dashboard.models import Area, AuditRecord
+    from modules.dashboard.services import refresh_area_summary
+
+    db.session.add_all([User(id=1, username='editor', role='Editor'), Checklist(id=1, name='5S')])
+    area = Area(name='Склад', code='SKL')
+    db.session.add(area)
+    db.session.flush()
+    now = datetime.utcnow()
+    year, week, _ = now.isocalendar()
+    db.session.add(AuditRecord(area_id=area.id, checklist_id=1, year=year, week_number=week, editor_id=1,
+                               timestamp=now, score_1s=2, score_2s=2, score_3s=2, score_4s=2, score_5s=2,
+                               overall_score=2))
+    refresh_area_summary(area.id)
+    db.session.commit()
+    return area.id
+
+
+def run_import(records):
+    from modules.dashboard.importer import AuditImporter
+
+    return AuditImporter(editor_id=1).run(list(enumerate(records, start=1)))
+
+
+def scores(area_id):
+    """(последний аудит, текущий балл) из сводки и напрямую по таблице аудитов."""
+    from modules.dashboard.models import Area
+    from modules.dashboard.services import attach_area_scores
+
+    db.session.expunge_all()
+    cached = attach_area_scores([db.session.get(Area, area_id)])[0]
+    db.session.expunge_all()
+    direct = db.session.get(Area, area_id)
+    return (cached.last_audit.id, cached.current_score), (direct.last_audit.id, direct.current_score)
+
+
+def test_historical_week_keeps_last_audit_and_current_score(app, area):
+    from modules.dashboard.models import AuditRecord
+
+    before = scores(area)
+    report = run_import([dict(area_id=area, checklist_id=1, year=2023, week_number=10,
+                              score_1s=0, score_2s=0, score_3s=0, score_4s=0, score_5s=0)])
+
+    assert report['inserted'] == 1, report['errors']
+    imported = AuditRecord.query.filter_by(year=2023, week_number=10).one()
+    assert imported.timestamp == datetime(2023, 3, 6)  # понедельник ISO-недели
+    assert scores(area) == before
+    assert before[0][1] == 2.0
+
+
+def test_explicit_timestamp_is_kept(app, area):
+    from modules.dashboard.models import AuditRecord
+
+    report = run_import([dict(area_id=area, checklist_id=1, year=2024, week_number=20, timestamp='2024-05-16T10:30:00',
+                              score_1s=1, score_2s=1, score_3s=1, score_4s=1, score_5s=1)])
+
+    assert report['inserted'] == 1, report['errors']
+    assert AuditRecord.query.filter_by(year=2024).one().timestamp == datetime(2024, 5, 16, 10, 30)
+
+
+def test_nonexistent_week_is_a_row_error(app, area):
+    report = run_import([dict(area_id=area, checklist_id=1, year=2023, week_number=53,
+                              score_1s=1, score_2s=1, score_3s=1, score_4s=1, score_5s=1)])
+
+    assert report['inserted'] == 0
+    assert report['errors'] == [{'row': 1, 'error': 'week 53 does not exist in ISO year 2023'}]
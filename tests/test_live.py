@@ -0,0 +1,85 @@
+"""Рассылка обновлений баллов после commit (after_flush -> after_commit) через брокер в памяти."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from core.pubsub import LocalBroker, event_bus
+
+
+@pytest.fixture
+def scores(app):
+    """Подписка на канал баллов (PUBSUB_URL по умолчанию - LocalBroker)."""
+    from modules.dashboard.live import SCORES_CHANNEL
+
+    assert isinstance(event_bus.broker, LocalBroker)
+    with event_bus.subscribe(SCORES_CHANNEL) as subscription:
+        yield subscription
+
+
+@pytest.fixture
+def area(app):
+    from core.models import Checklist, User
+    from modules.dashboard.models import Area
+
+    db.session.add_all([User(id=1, username='editor', role='Editor'), Checklist(id=1, name='5S')])
+    area = Area(name='Склад', code='SKL')
+    db.session.add(area)
+    db.session.commit()
+    return area.id
+
+
+def add_audit(area_id, weeks_ago, score):
+    from modules.dashboard.models import AuditRecord
+    from modules.dashboard.services import refresh_area_summary
+
+    at = datetime.utcnow() - timedelta(weeks=weeks_ago)
+    year, week, _ = at.isocalendar()
+    audit = AuditRecord(area_id=area_id, checklist_id=1, year=year, week_number=week, editor_id=1, timestamp=at,
+                        score_1s=score, score_2s=score, score_3s=score, score_4s=score, score_5s=score,
+                        overall_score=score)
+    db.session.add(audit)
+    refresh_area_summary(area_id)
+    return audit
+
+
+def test_commit_publishes_summary(app, area, scores):
+    add_audit(area, weeks_ago=1, score=1)
+    db.session.commit()
+    assert scores.get(timeout=1) is not None
+
+    audit = add_audit(area, weeks_ago=0, score=2)
+    assert scores.get(timeout=0) is None  # до commit ничего не рассылается
+    db.session.commit()
+
+    [data] = json.loads(scores.get(timeout=1))
+    assert data['area_id'] == area
+    assert data['version'] == 2
+    assert data['mean_2w'] == 1.5
+    assert data['current_score'] == 1.5
+    assert data['last_audit']['id'] == audit.id
+    assert data['last_audit']['scores'] == [2, 2, 2, 2, 2]
+
+
+def test_rollback_publishes_nothing(app, area, scores):
+    add_audit(area, weeks_ago=0, score=2)
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+
+    assert scores.get(timeout=0.1) is None
+
+
+def test_local_broker_keeps_latest_messages():
+    broker = LocalBroker(queue_size=2)
+    assert broker.publish('scores', 'lost') == 0
+
+    subscription = broker.subscribe('scores')
+    for message in ('a', 'b', 'c'):
+        broker.publish('scores', message)
+    assert [subscription.get(timeout=0), subscription.get(timeout=0)] == ['b', 'c']
+    assert subscription.dropped == 1
+
+    subscription.close()
+    assert broker.subscriber_count() == 0
@@ -0,0 +1,138 @@
+"""Проверка пароля через login_gate: лимиты попыток, размыкатель и освобождение слотов."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from core import auth
+from core.auth import CircuitBreaker, LoginGate, LoginRejected
+
+
+class Directory:
+    """Подмена LDAPAuth.verify: ответ по умолчанию, ошибка или ожидание release()."""
+
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+        self.started = threading.Event()
+        self._blocked = threading.Event()
+        self._blocked.set()
+
+    def block(self):
+        self._blocked.clear()
+
+    def release(self):
+        self._blocked.set()
+
+    def verify(self, username, password):
+        self.calls += 1
+        self.started.set()
+        self._blocked.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return username
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    directory = Directory()
+    monkeypatch.setattr(auth.LDAPAuth, 'verify', staticmethod(directory.verify))
+    yield directory
+    directory.release()
+
+
+@pytest.fixture
+def gate(app):
+    app.config.update(LDAP_AUTH_WORKERS=1, LDAP_AUTH_QUEUE=0, LDAP_AUTH_TIMEOUT=5,
+                      LDAP_LOGIN_MAX_PER_IP=1, LDAP_BREAKER_THRESHOLD=2, LDAP_BREAKER_RESET=0.05)
+    gate = LoginGate(app)
+    yield gate
+    if gate._executor is not None:
+        gate._executor.shutdown(wait=True)
+
+
+def login_in_background(app, gate, directory, remote_addr):
+    """Попытка входа, которая держит пул, пока каталог не ответит."""
+    directory.block()
+
+    def login():
+        with app.app_context():
+            gate.check('slow', 'secret', remote_addr)
+
+    thread = threading.Thread(target=login)
+    thread.start()
+    assert directory.started.wait(timeout=5)
+    return thread
+
+
+def test_second_attempt_from_same_ip_is_rejected(app, gate, directory):
+    thread = login_in_background(app, gate, directory, '10.0.0.1')
+
+    with pytest.raises(LoginRejected) as rejected:
+        gate.check('user', 'secret', '10.0.0.1')
+    assert rejected.value.status == 429
+
+    directory.release()
+    thread.join()
+    assert gate.stats['rejected_ip'] == 1
+    assert gate.stats['active'] == 0
+
+
+def test_attempt_over_pool_capacity_is_rejected(app, gate, directory):
+    thread = login_in_background(app, gate, directory, '10.0.0.1')
+
+    with pytest.raises(LoginRejected) as rejected:
+        gate.check('user', 'secret', '10.0.0.2')
+    assert rejected.value.status == 503
+
+    directory.release()
+    thread.join()
+    assert gate.stats['rejected_busy'] == 1
+    assert gate.check('user', 'secret', '10.0.0.2') == 'user'
+
+
+def test_open_circuit_skips_directory_until_probe_succeeds(app, gate, directory):
+    directory.error = LDAPSocketOpenError('unreachable')
+    for _ in range(2):
+        with pytest.raises(LoginRejected):
+            gate.check('user', 'secret', '10.0.0.1')
+    assert gate.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(LoginRejected):
+        gate.check('user', 'secret', '10.0.0.1')
+    assert directory.calls == 2
+    assert gate.stats['rejected_circuit'] == 1
+
+    time.sleep(0.06)
+    directory.error = None
+    assert gate.check('user', 'secret', '10.0.0.1') == 'user'
+    assert gate.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stopped_pool_releases_slots(app, gate, directory):
+    gate._get_executor().shutdown()
+
+    with pytest.raises(LoginRejected) as rejected:
+        gate.check('user', 'secret', '10.0.0.1')
+    assert rejected.value.status == 503
+    assert directory.calls == 0
+    assert gate.stats['active'] == 0
+
+    # Единственный слот пула свободен: следующая попытка доходит до каталога
+    gate._executor = ThreadPoolExecutor(1)
+    gate.breaker.record_success()
+    assert gate.check('user', 'secret', '10.0.0.1') == 'user'
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # пробная попытка
+    assert not breaker.allow()  # вторая, пока проба не завершилась
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,51 @@
+"""Кэш модулей меню: смена версии через файл-метку, общую для воркеров."""
+import os
+
+import pytest
+
+from app import db
+from core.navigation import ModuleRegistry
+
+
+@pytest.fixture
+def registries(app, tmp_path):
+    """Два реестра с общей меткой - как два воркера gunicorn."""
+    from core.models import CoreModule
+
+    db.session.add_all([CoreModule(name='dashboard', menu_order=1), CoreModule(name='feedback', menu_order=2)])
+    db.session.commit()
+    app.config.update(MODULE_REGISTRY_CHECK_INTERVAL=0, MODULE_REGISTRY_STAMP_FILE=str(tmp_path / 'modules.stamp'))
+    return ModuleRegistry(app), ModuleRegistry(app)
+
+
+def toggle(registry, name):
+    from core.models import CoreModule
+
+    module = CoreModule.query.filter_by(name=name).one()
+    module.is_active = not module.is_active
+    db.session.commit()
+    registry.invalidate()
+
+
+def active_names(registry):
+    return [module.name for module in registry.get_active_modules()]
+
+
+def test_change_in_one_worker_reaches_the_other(registries):
+    first, second = registries
+    assert active_names(second) == ['dashboard', 'feedback']
+
+    toggle(first, 'feedback')
+    assert active_names(second) == ['dashboard']
+
+
+def test_changes_with_same_mtime_are_detected(registries):
+    first, second = registries
+    toggle(first, 'feedback')
+    assert active_names(second) == ['dashboard']
+    stat = os.stat(first.stamp_file)
+
+    # Вторая смена в пределах точности mtime файловой системы
+    toggle(first, 'feedback')
+    os.utime(first.stamp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert active_names(second) == ['dashboard', 'feedback']
@@ -0,0 +1,130 @@
+"""Бюджеты SQL-запросов и время ответа основных страниц на синтетическом заводе.
+
+Число запросов от объема данных не зависит, поэтому по умолчанию база
+небольшая; объем задается переменными BENCH_AREAS, BENCH_YEARS, BENCH_VISITS,
+BENCH_URL - база вместо временного файла SQLite. Время ответа сравнивается
+с базовыми замерами только при заданном BENCH_BASELINE (JSON из
+python -m benchmarks.bench_endpoints --save-baseline, снятый на том же объеме),
+допустимое замедление - BENCH_TOLERANCE.
+"""
+import json
+import os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import create_app, db
+from benchmarks.bench_endpoints import (
+    BUDGETS, ENDPOINTS, PASSWORD, BenchConfig, install_ldap_stub, install_template_paths, measure, request_stats, seed
+)
+from core import auth
+
+AREAS = int(os.environ.get('BENCH_AREAS', 6))
+YEARS = int(os.environ.get('BENCH_YEARS', 1))
+VISITS = int(os.environ.get('BENCH_VISITS', 20000))
+USERS = 20
+BASELINE = os.environ.get('BENCH_BASELINE')
+TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 1.5))
+REPEAT = int(os.environ.get('BENCH_REPEAT', 20))
+
+
+@pytest.fixture(scope='module')
+def bench_url(tmp_path_factory):
+    """База с синтетическими данными (участки, аудиты с ответами, посещения, обратная связь)."""
+    url = os.environ.get('BENCH_URL') or 'sqlite:///' + str(tmp_path_factory.mktemp('bench') / 'bench.db')
+    engine = create_engine(url)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    seed(engine, AREAS, YEARS, 25, VISITS, USERS, 5)
+    engine.dispose()
+    return url
+
+
+@pytest.fixture(scope='module')
+def bench_app(bench_url):
+    """Приложение с инструментированием, каталогом LDAP в памяти и построенными сводками."""
+    from core.visit_rollup import rollup_visits
+    from modules.dashboard.services import rebuild_area_summaries, refresh_week_stats
+
+    class Config(BenchConfig):
+        SQLALCHEMY_DATABASE_URI = bench_url
+        SQLALCHEMY_BINDS = {}
+        VISIT_LOG_ASYNC = False
+
+    original_open = auth.LDAPConnectionPool.open
+    install_ldap_stub(USERS)
+    app = create_app(Config)
+    install_template_paths(app)
+    with app.app_context():
+        rebuild_area_summaries()
+        refresh_week_stats()
+        db.session.commit()
+        rollup_visits(lag=0, max_span=timedelta(days=120))
+    yield app
+    auth.LDAPConnectionPool.open = original_open
+
+
+@pytest.fixture(scope='module')
+def admin_client(bench_app):
+    client = bench_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+
+def fetch_endpoint(client, path):
+    url = path.format(area_id=AREAS // 2 or 1)
+    return lambda: client.get(url)
+
+
+def fetch_login(app):
+    """Вход новым клиентом (без сессии): пароль проверяется привязкой к каталогу."""
+    def login():
+        response = app.test_client().post('/auth/login', data=dict(username='user2@test.local', password=PASSWORD))
+        assert response.status_code == 302, 'login against the stub directory failed'
+        return response
+    return login
+
+
+@pytest.mark.parametrize('name,path', ENDPOINTS, ids=[name for name, _ in ENDPOINTS])
+def test_query_budget(admin_client, name, path):
+    _, queries = measure(fetch_endpoint(admin_client, path), repeat=2)
+    assert queries <= BUDGETS[name], f'{name}: {queries} queries > budget {BUDGETS[name]}'
+
+
+def test_login_query_budget(bench_app):
+    _, queries = measure(fetch_login(bench_app), repeat=2)
+    assert queries <= BUDGETS['auth.login'], f"auth.login: {queries} queries > budget {BUDGETS['auth.login']}"
+
+
+def test_new_audit_query_budget(bench_app, admin_client):
+    """Запись аудита с ответами на все вопросы (неделя до начала синтетической истории)."""
+    from core.models import ChecklistQuestion
+
+    with bench_app.app_context():
+        answers = {f'q_{question_id}': 2 for (question_id,) in db.session.query(ChecklistQuestion.id)}
+    response = admin_client.post('/dashboard/area/1/audit/new', data=dict(
+        year=2023, week_number=1, **{f'score_{n}s': 0 for n in range(1, 6)}, **answers
+    ))
+    assert response.status_code == 302
+
+    _, queries = request_stats(response)
+    budget = min(BUDGETS['dashboard.new_audit'], bench_app.config['INSTRUMENTATION_QUERY_BUDGET'])
+    assert queries <= budget, f'dashboard.new_audit: {queries} queries > budget {budget}'
+
+
+@pytest.mark.skipif(not BASELINE, reason='BENCH_BASELINE is not set')
+@pytest.mark.parametrize('name,path', ENDPOINTS + [('auth.login', None)],
+                         ids=[name for name, _ in ENDPOINTS] + ['auth.login'])
+def test_latency_against_baseline(bench_app, admin_client, name, path):
+    with open(BASELINE, encoding='utf-8') as f:
+        base = json.load(f).get(name)
+    if not base:
+        pytest.skip(f'no baseline for {name}')
+
+    fetch = fetch_login(bench_app) if path is None else fetch_endpoint(admin_client, path)
+    latency, _ = measure(fetch, REPEAT)
+    assert latency <= base['median_ms'] * TOLERANCE, (
+        f"{name}: {latency:.1f} ms > {TOLERANCE} x baseline {base['median_ms']:.1f} ms"
+    )
@@ -0,0 +1,114 @@
+"""Чтение из реплики (@replica_read) на двух файлах SQLite: основная база и ее копия."""
+import shutil
+
+import pytest
+
+from app import create_app, create_initial_data, create_tables, db
+from core.database import replica_router
+from conftest import AppConfig
+
+
+def make_app(primary, replica=None):
+    class Config(AppConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{primary}'
+        SQLALCHEMY_BINDS = {'replica': f'sqlite:///{replica}'} if replica else {}
+        DB_REPLICA_CHECK_INTERVAL = 0
+
+    app = create_app(Config)
+
+    @app.post('/_test/write')
+    def write():
+        replica_router.mark_write()
+        return ''
+
+    return app
+
+
+def seed(app):
+    """Три участка и администратор (id 1) в основной базе."""
+    from core.models import User
+
+    with app.app_context():
+        create_tables(app)
+        create_initial_data(app)
+        db.session.add(User(id=1, username='admin', role='Admin'))
+        db.session.commit()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def add_area(app, name, code):
+    """Участок только в основной базе (реплика еще не получила изменение)."""
+    from modules.dashboard.models import Area
+
+    with app.app_context():
+        db.session.add(Area(name=name, code=code))
+        db.session.commit()
+
+
+def area_ids(client):
+    response = client.get('/dashboard/api/radar')
+    assert response.status_code == 200
+    return response.get_json()['areas']
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    app = make_app(primary, replica)
+    seed(app)
+    shutil.copy(primary, replica)
+    add_area(app, 'Только в основной', 'PRI')
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # Метаданные bind'а реплики остаются в общем объекте db: иначе create_all
+    # следующих приложений (без реплики) ищет ее движок
+    db.metadatas.pop(replica_router.BIND_KEY, None)
+
+
+@pytest.fixture
+def client(replica_app):
+    client = replica_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+
+def test_reads_go_to_replica(client):
+    assert area_ids(client) == [1, 2, 3]
+
+
+def test_reads_stick_to_primary_after_write(client):
+    client.post('/_test/write')
+    assert area_ids(client) == [1, 2, 3, 4]
+
+    with client.session_transaction() as session:
+        session['_db_primary_until'] = 0  # окно read-your-writes истекло
+    assert area_ids(client) == [1, 2, 3]
+
+
+def test_user_is_loaded_from_primary(replica_app, client):
+    from core.models import User
+    from core.user_cache import user_cache
+
+    with replica_app.app_context():
+        db.session.get(User, 1).role = 'Viewer'
+        db.session.commit()
+    user_cache.invalidate()
+
+    assert area_ids(client) == [1, 2, 3]
+    assert user_cache.get(1).role == 'Viewer'
+
+
+def test_without_replica_reads_primary(tmp_path):
+    app = make_app(tmp_path / 'primary.db')
+    seed(app)
+    add_area(app, 'Новый участок', 'NEW')
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    assert not replica_router.enabled
+    assert area_ids(client) == [1, 2, 3, 4]
@@ -0,0 +1,59 @@
+"""Расчет баллов по ответам чек-листа с разделами сверх пяти S."""
+from app import db
+
+
+def make_checklist(sections):
+    """Чек-лист: по одному вопросу (макс. балл 2) в каждом разделе верхнего уровня.
+
+    Вопрос шестого раздела создается первым, поэтому его id меньше id вопросов 1S-5S.
+    """
+    from core.models import Checklist, ChecklistQuestion, ChecklistSection
+
+    checklist = Checklist(name='5S + доп. раздел', version='1.0')
+    db.session.add(checklist)
+    db.session.flush()
+    section_ids = []
+    for order in range(sections):
+        section = ChecklistSection(checklist_id=checklist.id, order_num=order, title=f'Раздел {order + 1}')
+        db.session.add(section)
+        db.session.flush()
+        section_ids.append(section.id)
+
+    question_ids = {}
+    for order in [sections - 1] + list(range(sections - 1)):
+        question = ChecklistQuestion(section_id=section_ids[order], order_num=0, question_text='Вопрос',
+                                     weight=1, max_score=2, is_required=True)
+        db.session.add(question)
+        db.session.flush()
+        question_ids[order] = question.id
+    db.session.commit()
+    return checklist.id, question_ids
+
+
+def test_sixth_section_answers_are_ignored(app):
+    from modules.dashboard.checklists import compile_checklist
+    from modules.dashboard.scoring import score_response_sets
+
+    checklist_id, question_ids = make_checklist(sections=6)
+    compiled = compile_checklist(checklist_id)
+    assert len(compiled.questions) == 6
+    assert len(compiled.arrays.question_ids) == 5
+
+    # Ответы на все вопросы формы, как их отправляет new_audit
+    answers = {question_ids[order]: 2 if order < 5 else 0 for order in range(6)}
+    scores = score_response_sets(compiled.arrays, [answers])[0]
+
+    assert scores == dict(score_1s=2.0, score_2s=2.0, score_3s=2.0, score_4s=2.0, score_5s=2.0, overall_score=2.0)
+
+
+def test_unknown_question_with_highest_id_does_not_raise(app):
+    from modules.dashboard.checklists import compile_checklist
+    from modules.dashboard.scoring import score_response_sets
+
+    checklist_id, question_ids = make_checklist(sections=6)
+    compiled = compile_checklist(checklist_id)
+    answers = {question_id: 1 for question_id in question_ids.values()}
+    answers[max(question_ids.values()) + 100] = 2
+
+    scores = score_response_sets(compiled.arrays, [answers])[0]
+    assert scores['overall_score'] == 1.0
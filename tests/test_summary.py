@@ -0,0 +1,55 @@
+"""Текущий балл из сводки участка совпадает с расчетом Area.current_score по аудитам."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+
+
+@pytest.fixture
+def area(app):
+    """Участок с аудитами в соседних ISO-неделях: 15 дней назад (0) и в пределах 14 дней (2)."""
+    from core.models import Checklist, User
+    from modules.dashboard.models import Area, AuditRecord
+    from modules.dashboard.services import refresh_area_summary
+
+    db.session.add_all([User(id=1, username='editor', role='Editor'), Checklist(id=1, name='5S')])
+    area = Area(name='Склад', code='SKL')
+    db.session.add(area)
+    db.session.flush()
+
+    old = datetime.utcnow() - timedelta(days=15)
+    recent = (old - timedelta(days=old.weekday())).replace(hour=12, minute=0) + timedelta(weeks=1)
+    for at, score in ((old, 0), (recent, 2)):
+        year, week, _ = at.isocalendar()
+        db.session.add(AuditRecord(area_id=area.id, checklist_id=1, year=year, week_number=week, editor_id=1,
+                                   timestamp=at, score_1s=score, score_2s=score, score_3s=score, score_4s=score,
+                                   score_5s=score, overall_score=score))
+    refresh_area_summary(area.id)
+    db.session.commit()
+    return area.id
+
+
+def test_current_score_matches_area_property(app, area):
+    from modules.dashboard.models import Area, AreaScoreSummary
+    from modules.dashboard.services import attach_area_scores
+
+    assert db.session.get(AreaScoreSummary, area).mean_2w == 1.0  # окно двух недель включает оба аудита
+
+    db.session.expunge_all()
+    expected = db.session.get(Area, area).current_score
+    db.session.expunge_all()
+    cached = attach_area_scores([db.session.get(Area, area)])[0].current_score
+
+    assert expected == 2.0
+    assert cached == expected
+
+
+def test_current_score_follows_read_time(app, area):
+    from modules.dashboard.models import AreaScoreSummary
+
+    summary = db.session.get(AreaScoreSummary, area)
+    now = datetime.utcnow()
+
+    assert summary.current_score(now) == 2.0
+    assert summary.current_score(now + timedelta(days=14)) == 0
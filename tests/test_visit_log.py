@@ -0,0 +1,34 @@
+"""Фоновая запись журнала посещений: события не теряются при повторной инициализации."""
+import time
+
+from app import create_app, create_tables, db
+from core.visit_log import VisitLogWriter
+from conftest import AppConfig
+
+
+def test_reinit_writes_pending_events_to_previous_app(app):
+    from core.models import User, VisitLog
+
+    db.session.add(User(id=1, username='viewer', role='Viewer'))
+    db.session.commit()
+    app.config.update(VISIT_LOG_ASYNC=True, VISIT_LOG_FLUSH_INTERVAL=30)
+    writer = VisitLogWriter(app)
+    writer.push(1, endpoint='core.index')
+    writer.push(1, endpoint='core.index')
+
+    started = time.monotonic()
+    other = create_app(AppConfig)
+    writer.init_app(other)
+
+    assert time.monotonic() - started < 5  # поток не ждет VISIT_LOG_FLUSH_INTERVAL
+    assert VisitLog.query.count() == 2
+    assert writer.stats()['queued'] == 0
+
+    with other.app_context():
+        create_tables(other)
+        db.session.add(User(id=1, username='viewer', role='Viewer'))
+        db.session.commit()
+        writer.push(1, endpoint='core.index')
+        writer.shutdown()
+        assert VisitLog.query.count() == 1
+        db.session.remove()